@@ -0,0 +1,60 @@
+import random
+import time
+from io import StringIO
+from threading import Lock
+from typing import Any, Tuple
+
+from benchmarks.fake_host import FakeHost
+from wireguard.client.base import BaseClient, content_version
+
+
+class FakeClient(BaseClient):
+    """In-process client for a FakeHost that simulates the network round-trip time of every call."""
+
+    def __init__(self, host: FakeHost, rtt: float = 0.0, jitter: float = 0.0) -> None:
+        """Initializes the FakeClient instance.
+
+        Args:
+            host (FakeHost): The emulated host.
+            rtt (float): The simulated round-trip time in seconds. Defaults to 0.
+            jitter (float): The maximum random deviation added to the round-trip time, in seconds.
+                Defaults to 0.
+        """
+        self.host = host
+        self.rtt = rtt
+        self.jitter = jitter
+        self.round_trips = 0
+        self._lock = Lock()
+        self._write_lock = Lock()
+
+    def _round_trip(self) -> None:
+        with self._lock:
+            self.round_trips += 1
+
+        delay = self.rtt + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def execute(self, command: str) -> Tuple[Any, Any, Any]:
+        self._round_trip()
+        _, stdout, stderr = self.host.run(command)
+        return None, StringIO(stdout), StringIO(stderr)
+
+    def get_file_contents(self, path: str) -> str:
+        self._round_trip()
+        return self.host.read_file(path)
+
+    def put_file_contents(self, path: str, contents: str) -> None:
+        self._round_trip()
+        self.host.write_file(path, contents)
+
+    def replace_file_contents(self, path: str, contents: str, version: str) -> bool:
+        self._round_trip()
+
+        # Checked and written in one go, as the remote client does with a single command
+        with self._write_lock:
+            if content_version(self.host.read_file(path)) != version:
+                return False
+
+            self.host.write_file(path, contents)
+            return True
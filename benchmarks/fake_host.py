@@ -0,0 +1,303 @@
+import base64
+import hashlib
+import os
+import random
+import re
+import time
+from threading import Lock
+from typing import Tuple
+
+from nacl.public import PrivateKey
+
+_SYNCCONF_RE = re.compile(r'^(\w+) syncconf (\S+) <\((\S+) strip (\S+)\)$')
+# The atomic replacement of a file by RemoteClient, optionally guarded by the checksum of the file
+_REPLACE_RE = re.compile(
+    r'^(?:if \[ "\$\(sha256sum < \S+ \| cut -c1-64\)" = (?P<version>\w+) \]; then )?'
+    r'chmod --reference=\S+ \S+ 2>/dev/null; chown --reference=\S+ \S+ 2>/dev/null; '
+    r'mv -f (?P<tmp>\S+) (?P<target>\S+) && echo replaced(?:; else rm -f \S+; fi)?$'
+)
+
+# A section of the batched read of all interfaces
+_DUMP_ALL_RE = re.compile(r'echo "# (\S+)"; \1 show all dump')
+
+
+def generate_private_key() -> str:
+    return base64.b64encode(bytes(PrivateKey.generate())).decode()
+
+
+def derive_public_key(private_key: str) -> str:
+    return base64.b64encode(bytes(PrivateKey(base64.b64decode(private_key)).public_key)).decode()
+
+
+def random_public_key() -> str:
+    # Peers of the generated config never need their private keys, random bytes are enough
+    return base64.b64encode(os.urandom(32)).decode()
+
+
+class FakeHost:
+    """In-memory Linux host with a WireGuard interface that emulates ``wg``/``awg`` and a file system.
+
+    The runtime state of the interface is rebuilt from the configuration file on ``syncconf``
+    and ``wg-quick up``, as the real tools do.
+    """
+
+    def __init__(
+            self,
+            peers: int,
+            protocol: str = 'wg',
+            interface_name: str = 'wg0',
+            path_to_config: str = '/etc/wireguard/wg0.conf',
+    ) -> None:
+        """Initializes the FakeHost instance.
+
+        Args:
+            peers (int): The number of peers in the generated configuration.
+            protocol (str): The command name, ``wg`` or ``awg``. Defaults to ``wg``.
+            interface_name (str): The interface name. Defaults to ``wg0``.
+            path_to_config (str): The configuration file path. Defaults to ``/etc/wireguard/wg0.conf``.
+        """
+        self.protocol = protocol
+        self.interface_name = interface_name
+        self.path_to_config = path_to_config
+
+        self.private_key = generate_private_key()
+        self.public_key = derive_public_key(self.private_key)
+        self.listen_port = 51820
+
+        self.files = {path_to_config: self._build_config(peers)}
+        self.interface_up = True
+        self.runtime_peers: dict[str, dict] = {}
+        self._lock = Lock()
+
+        self._sync_runtime()
+
+    def _build_config(self, peers: int) -> str:
+        lines = [
+            '[Interface]',
+            'Address = 10.0.0.1/16',
+            f'ListenPort = {self.listen_port}',
+            f'PrivateKey = {self.private_key}',
+        ]
+
+        if self.protocol == 'awg':
+            lines.extend(f'{param} = {value}' for param, value in (
+                ('Jc', 4), ('Jmin', 40), ('Jmax', 70), ('S1', 0), ('S2', 0),
+                ('H1', 1), ('H2', 2), ('H3', 3), ('H4', 4),
+            ))
+
+        for i in range(peers):
+            address = f'10.0.{(i + 2) // 256}.{(i + 2) % 256}/32'
+            lines.append('')
+
+            if self.protocol == 'awg':
+                lines.extend([
+                    '[Peer]',
+                    f'PublicKey = {random_public_key()}',
+                    f'AllowedIPs = {address}',
+                    f'#_Name = peer{i}',
+                ])
+            else:
+                lines.extend([
+                    f'# peer{i}',
+                    '[Peer]',
+                    f'PublicKey = {random_public_key()}',
+                    f'AllowedIPs = {address}',
+                ])
+
+        return '\n'.join(lines) + '\n'
+
+    def _sync_runtime(self) -> None:
+        """Rebuilds the runtime peers from the enabled peers of the configuration file."""
+        runtime_peers = {}
+        current = None
+
+        for line in self.files[self.path_to_config].splitlines():
+            line = line.strip()
+
+            if line == '[Peer]':
+                current = {}
+            elif line.startswith('['):
+                current = None
+            elif current is not None and ' = ' in line and not line.startswith('#'):
+                key, value = line.split(' = ', 1)
+                current[key] = value
+
+                if key == 'PublicKey':
+                    runtime_peers[value] = current
+
+        now = int(time.time())
+
+        for pubkey, peer in runtime_peers.items():
+            runtime_peers[pubkey] = self.runtime_peers.get(pubkey) or {
+                'allowed_ips': peer.get('AllowedIPs', '(none)'),
+                'endpoint': f'198.51.100.{random.randint(1, 254)}:{random.randint(1024, 65535)}',
+                'latest_handshake': now - random.randint(0, 600),
+                'rx': random.randint(0, 10 ** 9),
+                'tx': random.randint(0, 10 ** 9),
+            }
+
+        self.runtime_peers = runtime_peers
+
+    def _show(self) -> str:
+        blocks = [
+            f'interface: {self.interface_name}\n'
+            f'  public key: {self.public_key}\n'
+            f'  private key: (hidden)\n'
+            f'  listening port: {self.listen_port}'
+        ]
+
+        now = int(time.time())
+
+        for pubkey, peer in self.runtime_peers.items():
+            blocks.append(
+                f'peer: {pubkey}\n'
+                f'  endpoint: {peer["endpoint"]}\n'
+                f'  allowed ips: {peer["allowed_ips"]}\n'
+                f'  latest handshake: {now - peer["latest_handshake"]} seconds ago\n'
+                f'  transfer: {peer["rx"]} B received, {peer["tx"]} B sent'
+            )
+
+        return '\n\n'.join(blocks) + '\n'
+
+    def _dump(self) -> str:
+        lines = [f'{self.private_key}\t{self.public_key}\t{self.listen_port}\toff']
+        lines.extend(
+            f'{pubkey}\t(none)\t{peer["endpoint"]}\t{peer["allowed_ips"]}\t'
+            f'{peer["latest_handshake"]}\t{peer["rx"]}\t{peer["tx"]}\toff'
+            for pubkey, peer in self.runtime_peers.items()
+        )
+        return '\n'.join(lines) + '\n'
+
+    def _dump_all(self, command: str) -> str:
+        """Emulates the batched read of ``HostDumpReader``: a marker line per protocol,
+        followed by the ``show all dump`` output of the protocol, which is empty for other protocols."""
+        output = []
+
+        for protocol in _DUMP_ALL_RE.findall(command):
+            output.append(f'# {protocol}\n')
+
+            if protocol == self.protocol and self.interface_up:
+                output.extend(f'{self.interface_name}\t{line}\n' for line in self._dump().splitlines())
+
+        return ''.join(output)
+
+    def run(self, command: str) -> Tuple[int, str, str]:
+        """Runs a shell command supported by the emulation.
+
+        Args:
+            command (str): The command line.
+
+        Returns:
+            Tuple[int, str, str]: The exit status, the standard output and the standard error.
+        """
+        with self._lock:
+            return self._run(command.strip())
+
+    def _run(self, command: str) -> Tuple[int, str, str]:
+        wg, quick = self.protocol, f'{self.protocol}-quick'
+        no_device = (1, '', 'Unable to access interface: No such device\n')
+
+        if command == f'{wg} genkey':
+            return 0, generate_private_key() + '\n', ''
+
+        if command.startswith('echo ') and command.endswith(f'| {wg} pubkey'):
+            private_key = command[len('echo '):-len(f'| {wg} pubkey')].strip().strip('"')
+            return 0, derive_public_key(private_key) + '\n', ''
+
+        if command == f'{wg} show {self.interface_name}':
+            return (0, self._show(), '') if self.interface_up else no_device
+
+        if command == f'{wg} show {self.interface_name} dump':
+            return (0, self._dump(), '') if self.interface_up else no_device
+
+        if command.startswith('echo "# ') and command.endswith('show all dump'):
+            return 0, self._dump_all(command), ''
+
+        if command == f'{wg} show {self.interface_name} public-key':
+            return (0, self.public_key + '\n', '') if self.interface_up else no_device
+
+        if command == f'{quick} up {self.interface_name}':
+            self.interface_up = True
+            self._sync_runtime()
+            return 0, '', ''
+
+        if command == f'{quick} down {self.interface_name}':
+            self.interface_up = False
+            self.runtime_peers = {}
+            return 0, '', ''
+
+        if _SYNCCONF_RE.match(command):
+            if self.interface_up:
+                self._sync_runtime()
+            return 0, '', ''
+
+        if command.startswith('cat /proc/loadavg'):
+            return 0, self._health(resample='sleep' in command), ''
+
+        if command.startswith('cat '):
+            path = command[len('cat '):].strip()
+            if path in self.files:
+                return 0, self.files[path], ''
+            return 1, '', f'cat: {path}: No such file or directory\n'
+
+        if command.startswith('sha256sum '):
+            path = command[len('sha256sum '):].strip()
+            if path in self.files:
+                return 0, f'{hashlib.sha256(self.files[path].encode()).hexdigest()}  {path}\n', ''
+            return 1, '', f'sha256sum: {path}: No such file or directory\n'
+
+        if match := _REPLACE_RE.match(command):
+            tmp, target, version = match.group('tmp', 'target', 'version')
+            contents = self.files.pop(tmp, None)
+
+            if contents is None:
+                return 1, '', f"mv: cannot stat '{tmp}': No such file or directory\n"
+
+            if version is not None and hashlib.sha256(self.files.get(target, '').encode()).hexdigest() != version:
+                return 0, '', ''
+
+            self.files[target] = contents
+            return 0, 'replaced\n', ''
+
+        if command == 'reboot':
+            return 0, '', ''
+
+        return 127, '', f'bash: {command.split()[0]}: command not found\n'
+
+    def _health(self, resample: bool) -> str:
+        """Emulates ``cat /proc/loadavg /proc/uptime; nproc; cat /proc/meminfo /proc/net/dev``,
+        optionally followed by another read of ``/proc/net/dev``."""
+        rx = sum(peer['rx'] for peer in self.runtime_peers.values())
+        tx = sum(peer['tx'] for peer in self.runtime_peers.values())
+        net_dev = (
+            'Inter-|   Receive                                                |  Transmit\n'
+            ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls '
+            'carrier compressed\n'
+            '    lo:    1024      10    0    0    0     0          0         0     1024      10    0    0    0     0 '
+            '      0          0\n'
+        )
+
+        if self.interface_up:
+            net_dev += f'{self.interface_name:>6}: {rx} 0 0 0 0 0 0 0 {tx} 0 0 0 0 0 0 0\n'
+
+        output = (
+            '0.42 0.35 0.30 1/123 4567\n'
+            '93784.12 350000.00\n'
+            '4\n'
+            'MemTotal:        2048000 kB\n'
+            'MemFree:          512000 kB\n'
+            'MemAvailable:    1024000 kB\n'
+        ) + net_dev
+
+        return output + net_dev if resample else output
+
+    def read_file(self, path: str) -> str:
+        with self._lock:
+            try:
+                return self.files[path]
+            except KeyError:
+                raise FileNotFoundError(path)
+
+    def write_file(self, path: str, contents: str) -> None:
+        with self._lock:
+            self.files[path] = contents
@@ -0,0 +1,282 @@
+"""Load test of the whole update processing pipeline: middlewares, FSM storage, handlers and backends.
+
+Synthetic updates of concurrent admins are fed into the dispatcher from ``main.py``. Telegram is replaced
+by a session answering every request after a simulated delay, and the servers by in-process fake hosts.
+
+Usage::
+
+    python -m benchmarks.load --admins 10 --duration 30 --servers 3 --peers 1000 --rtt 0.02
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Chat, Message, Update
+
+from benchmarks.fake_client import FakeClient
+from benchmarks.fake_host import FakeHost
+from db.database import Database
+from main import create_dispatcher
+from modules.collector import StatsCollector
+from modules.expiry import ExpiryScheduler
+from modules.instrumentation import instrument_server
+from modules.middlewares import TelegramTimingMiddleware
+from modules.peer_index import PeerIndex
+from modules.provisioning import ProvisioningPool
+from modules.storages import SQLiteStorage
+from servers.server_factory import ServerFactory
+from wireguard.linux import Linux
+from wireguard.protocol.wireguard import WireguardProtocol
+
+
+class FakeSession(BaseSession):
+    """Bot session that answers every Telegram request locally after a simulated delay."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+        self._message_ids = itertools.count(1)
+
+    async def make_request(
+            self,
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+            timeout: Optional[int] = None,
+    ) -> TelegramType:
+        self.requests += 1
+
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        if method.__returning__ is bool:
+            return True
+
+        return Message.model_validate(
+            {
+                'message_id': getattr(method, 'message_id', None) or next(self._message_ids),
+                'date': datetime.now(),
+                'chat': Chat(id=getattr(method, 'chat_id', None) or 0, type='private'),
+                'text': getattr(method, 'text', None),
+            },
+            context={'bot': bot},
+        )
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b''
+
+    async def close(self) -> None:
+        pass
+
+
+class UpdateFactory:
+    """Builds updates of a private chat with an admin, already mounted to the bot."""
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, bot: Bot, user_id: int) -> None:
+        self.bot = bot
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f'Admin {user_id}', 'username': f'admin{user_id}'}
+        self.chat = {'id': user_id, 'type': 'private', 'username': f'admin{user_id}'}
+        self._message_ids = itertools.count(1)
+
+    def _message(self, text: str) -> dict:
+        return {'message_id': next(self._message_ids), 'date': datetime.now(), 'chat': self.chat,
+                'from': self.user, 'text': text}
+
+    def message(self, text: str) -> Update:
+        return Update.model_validate(
+            {'update_id': next(self._update_ids), 'message': self._message(text)},
+            context={'bot': self.bot},
+        )
+
+    def callback(self, data: str) -> Update:
+        callback_query = {
+            'id': str(next(self._update_ids)),
+            'from': self.user,
+            'chat_instance': str(self.user['id']),
+            'data': data,
+            'message': self._message('Bot message'),
+        }
+        return Update.model_validate(
+            {'update_id': next(self._update_ids), 'callback_query': callback_query},
+            context={'bot': self.bot},
+        )
+
+
+class LoopLagMonitor:
+    """Measures how long the event loop is blocked by oversleeping of a periodic timer."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.lags: list[float] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started - self.interval))
+
+
+async def run_admin(
+        dp,
+        bot: Bot,
+        user_id: int,
+        server_names: list[str],
+        deadline: float,
+        add_every: int,
+        latencies: defaultdict,
+        errors: defaultdict,
+) -> None:
+    """Repeats the flows of a single admin until the deadline."""
+    updates = UpdateFactory(bot, user_id)
+
+    for iteration in itertools.count():
+        if time.monotonic() >= deadline:
+            return
+
+        server_name = server_names[(user_id + iteration) % len(server_names)]
+        steps = [
+            ('/servers', updates.message('/servers')),
+            ('server:', updates.callback(f'server:{server_name}')),
+            ('get_peers', updates.callback('get_peers')),
+        ]
+
+        if add_every and iteration % add_every == add_every - 1:
+            steps += [
+                ('add_peer', updates.callback('add_peer')),
+                ('peer name', updates.message(f'load-{user_id}-{iteration}')),
+                ('config_peers', updates.callback('config_peers')),
+            ]
+
+        for kind, update in steps:
+            started = time.perf_counter()
+
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                errors[kind] += 1
+                logging.debug(f'Update "{kind}" failed: {e!r}')
+
+            latencies[kind].append(time.perf_counter() - started)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def _register_servers(count: int, peers: int, rtt: float, jitter: float) -> dict:
+    servers = {}
+
+    for i in range(count):
+        server_name = f'bench{i}'
+        server = Linux(FakeClient(FakeHost(peers), rtt, jitter), WireguardProtocol(), '127.0.0.1')
+        instrument_server(server, server_name)
+
+        # The factory returns cached instances by name, so the stand-ins are used instead of real hosts
+        ServerFactory._created_servers[server_name] = server
+        servers[server_name] = {'type': 'Linux', 'data': {}}
+
+    return servers
+
+
+async def main(args: argparse.Namespace) -> None:
+    database_path = os.path.join(tempfile.mkdtemp(), 'load.db')
+    Database(database_path).init_db()
+
+    admins = list(range(1, args.admins + 1))
+    servers = _register_servers(args.servers, args.peers, args.rtt, args.jitter)
+
+    session = FakeSession(args.api_latency)
+    session.middleware(TelegramTimingMiddleware())
+    bot = Bot(token='42:LOAD-TEST', session=session, default=DefaultBotProperties(parse_mode='HTML'))
+
+    collector = StatsCollector(servers, interval=0)
+    provisioning_pool = ProvisioningPool(collector, size=args.pool_size)
+    pool_task = asyncio.create_task(provisioning_pool.run())
+
+    dp = create_dispatcher(
+        admins=admins,
+        servers=servers,
+        collector=collector,
+        expiry_scheduler=ExpiryScheduler(collector, Database(database_path)),
+        provisioning_pool=provisioning_pool,
+        peer_index=PeerIndex(collector, Database(database_path)),
+        storage=SQLiteStorage(database_path),
+    )
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    monitor = LoopLagMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+
+    started = time.monotonic()
+    deadline = started + args.duration
+
+    await asyncio.gather(*(
+        run_admin(dp, bot, user_id, list(servers), deadline, args.add_every, latencies, errors)
+        for user_id in admins
+    ))
+
+    elapsed = time.monotonic() - started
+    monitor_task.cancel()
+    pool_task.cancel()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f'{total} updates in {elapsed:.1f}s: {total / elapsed:.1f} updates/s, '
+          f'{session.requests} Telegram requests, {sum(errors.values())} errors')
+    print(f'{"update":<14}{"count":>7}{"errors":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+
+    for kind, values in [*latencies.items(), ('all', list(itertools.chain(*latencies.values())))]:
+        print(
+            f'{kind:<14}{len(values):>7}{errors.get(kind, 0) if kind != "all" else sum(errors.values()):>8}'
+            f'{statistics.median(values) * 1000:>9.1f}{_percentile(values, 0.95) * 1000:>9.1f}'
+            f'{_percentile(values, 0.99) * 1000:>9.1f}{max(values) * 1000:>9.1f}'
+        )
+
+    if args.pool_size:
+        hits, misses = sum(provisioning_pool.hits.values()), sum(provisioning_pool.misses.values())
+        print(f'Provisioning pool: {hits} hits, {misses} misses')
+
+    blocked = sum(monitor.lags)
+    print(f'Event loop blocked for {blocked:.2f}s ({blocked / elapsed:.0%} of the run), '
+          f'longest block {max(monitor.lags, default=0) * 1000:.1f}ms, '
+          f'p99 lag {_percentile(monitor.lags, 0.99) * 1000 if monitor.lags else 0:.1f}ms')
+
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--admins', type=int, default=5, help='Concurrent admins')
+    parser.add_argument('--duration', type=float, default=10, help='Test duration in seconds')
+    parser.add_argument('--servers', type=int, default=2, help='Number of stand-in servers')
+    parser.add_argument('--peers', type=int, default=100, help='Peers per server')
+    parser.add_argument('--rtt', type=float, default=0.0, help='Simulated server round-trip time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random RTT deviation in seconds')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='Simulated Telegram API latency')
+    parser.add_argument('--pool-size', type=int, default=0, help='Prepared peers per server, 0 disables the pool')
+    parser.add_argument('--add-every', type=int, default=5, help='Run the add peer flow every N iterations, 0 never')
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('aiogram.event').setLevel(logging.WARNING)
+
+    asyncio.run(main(parser.parse_args()))
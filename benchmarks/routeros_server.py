@@ -0,0 +1,360 @@
+import socket
+import socketserver
+import time
+from threading import Lock, Thread
+
+from routeros_api.base_api import decode_length, encode_length
+
+from benchmarks.fake_host import derive_public_key, generate_private_key, random_public_key
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: '_TCPServer'
+
+    def setup(self) -> None:
+        # Replies are sent sentence by sentence, which must not be delayed by the Nagle algorithm
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Changes are pushed to listening connections from the threads of other connections
+        self._send_lock = Lock()
+
+    def _read(self, length: int) -> bytes:
+        data = b''
+
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError('Connection closed')
+            data += chunk
+
+        return data
+
+    def _receive_sentence(self) -> list[str]:
+        words = []
+
+        while word := self._read(decode_length(self._read)):
+            words.append(word.decode())
+
+        return words
+
+    def _send_sentence(self, words: list[str]) -> None:
+        with self._send_lock:
+            self.request.sendall(b''.join(encode_length(len(w)) + w for w in (w.encode() for w in words + [''])))
+
+    def send_event(self, words: list[str], tag: str | None) -> None:
+        try:
+            self._send_sentence(words + ([f'.tag={tag}'] if tag is not None else []))
+        except OSError:
+            pass
+
+    def handle(self) -> None:
+        try:
+            self._handle()
+        finally:
+            self.server.stand_in.unlisten(self)
+
+    def _handle(self) -> None:
+        while True:
+            try:
+                sentence = self._receive_sentence()
+            except (ConnectionError, OSError):
+                return
+
+            if not sentence:
+                continue
+
+            command, attributes, queries, tag = sentence[0], {}, {}, None
+
+            for word in sentence[1:]:
+                if word.startswith('.tag='):
+                    tag = word[len('.tag='):]
+                elif word.startswith('='):
+                    key, _, value = word[1:].partition('=')
+                    attributes[key] = value
+                elif word.startswith('?'):
+                    key, _, value = word[1:].partition('=')
+                    queries[key] = value
+
+            tag_words = [f'.tag={tag}'] if tag is not None else []
+
+            # A listen command is answered by the changes until it's cancelled
+            if command.endswith('/listen'):
+                self.server.stand_in.listen(self, command[:-len('/listen')], tag)
+                continue
+
+            if command == '/cancel':
+                if self.server.stand_in.unlisten(self, attributes.get('tag')):
+                    self.send_event(['!trap', '=category=2', '=message=interrupted'], attributes.get('tag'))
+                    self.send_event(['!done'], attributes.get('tag'))
+                self._send_sentence(['!done'] + tag_words)
+                continue
+
+            for reply in self.server.stand_in.handle(command, attributes, queries):
+                self._send_sentence(reply + tag_words)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    stand_in: 'FakeRouterOSServer'
+
+
+class FakeRouterOSServer:
+    """Local RouterOS API server with a single WireGuard interface, to benchmark ``RouterOS`` without a router.
+
+    Only the commands used by the bot are implemented: printing, listening to, adding, setting
+    and removing WireGuard interfaces, peers and IP addresses, monitoring the interface traffic,
+    reading the system resources and rebooting.
+    """
+
+    def __init__(
+            self,
+            peers: int,
+            interface_name: str = 'wireguard1',
+            username: str = 'admin',
+            password: str = 'password',
+            rtt: float = 0.0,
+    ) -> None:
+        """Initializes the FakeRouterOSServer instance.
+
+        Args:
+            peers (int): The number of peers to create.
+            interface_name (str): The WireGuard interface name. Defaults to ``wireguard1``.
+            username (str): The accepted username. Defaults to ``admin``.
+            password (str): The accepted password. Defaults to ``password``.
+            rtt (float): Additional delay of every request in seconds, to simulate a distant router.
+                Defaults to 0.
+        """
+        self.interface_name = interface_name
+        self.username = username
+        self.password = password
+        self.rtt = rtt
+        self.round_trips = 0
+        self.port = None
+
+        private_key = generate_private_key()
+        self.tables: dict[str, dict[str, dict[str, str]]] = {
+            '/interface/wireguard': {
+                '*1': {
+                    '.id': '*1',
+                    'name': interface_name,
+                    'private-key': private_key,
+                    'public-key': derive_public_key(private_key),
+                    'listen-port': '13231',
+                    'mtu': '1420',
+                    'disabled': 'false',
+                    'running': 'true',
+                },
+            },
+            '/ip/address': {
+                '*1': {'.id': '*1', 'address': '10.0.0.1/16', 'interface': interface_name, 'disabled': 'false'},
+            },
+            '/interface/wireguard/peers': {},
+            '/system/resource': {
+                '*0': {
+                    'uptime': '1w2d3h4m5s',
+                    'cpu-count': '4',
+                    'cpu-load': '12',
+                    'free-memory': str(768 * 2 ** 20),
+                    'total-memory': str(1024 * 2 ** 20),
+                    'board-name': 'CHR',
+                },
+            },
+        }
+
+        self._next_id = 2
+        self._server = None
+        self._lock = Lock()
+        self._listeners: list[tuple[_Handler, str, str | None]] = []
+
+        for i in range(peers):
+            self._add('/interface/wireguard/peers', {
+                'name': f'peer{i}',
+                'interface': interface_name,
+                'public-key': random_public_key(),
+                'allowed-address': f'10.0.{(i + 2) // 256}.{(i + 2) % 256}/32',
+                'current-endpoint-address': f'198.51.100.{i % 254 + 1}',
+                'current-endpoint-port': str(1024 + i % 60000),
+                'last-handshake': f'{i % 10}m{i % 60}s',
+                'rx': str(i * 1024),
+                'tx': str(i * 2048),
+            })
+
+    def _add(self, path: str, attributes: dict[str, str]) -> str:
+        item_id = f'*{self._next_id:X}'
+        self._next_id += 1
+
+        if path == '/interface/wireguard/peers':
+            if attributes.get('private-key') == 'auto':
+                attributes['private-key'] = generate_private_key()
+                attributes['public-key'] = derive_public_key(attributes['private-key'])
+
+            attributes.setdefault('private-key', '')
+            attributes.setdefault('disabled', 'false')
+            attributes.setdefault('rx', '0')
+            attributes.setdefault('tx', '0')
+
+        self.tables[path][item_id] = {'.id': item_id} | attributes
+        return item_id
+
+    def listen(self, handler: _Handler, path: str, tag: str | None) -> None:
+        """Starts streaming the changes of a table to a connection.
+
+        Args:
+            handler (_Handler): The listening connection.
+            path (str): The table path, e.g. ``/interface/wireguard/peers``.
+            tag (str | None): The tag of the listen command.
+        """
+        with self._lock:
+            self._listeners.append((handler, path, tag))
+
+    def unlisten(self, handler: _Handler, tag: str | None = None) -> bool:
+        """Stops streaming changes to a connection.
+
+        Args:
+            handler (_Handler): The listening connection.
+            tag (str | None): The tag of the listen command to cancel, all commands of the connection if None.
+
+        Returns:
+            bool: Whether a listen command was cancelled.
+        """
+        with self._lock:
+            remaining = [
+                listener for listener in self._listeners
+                if listener[0] is not handler or tag is not None and listener[2] != tag
+            ]
+            cancelled = len(remaining) != len(self._listeners)
+            self._listeners = remaining
+
+        return cancelled
+
+    def _notify(self, path: str, item: dict[str, str], dead: bool = False) -> None:
+        words = ['!re', f'=.id={item[".id"]}', '=.dead=yes'] if dead else \
+            ['!re'] + [f'={key}={value}' for key, value in item.items()]
+
+        for handler, listened_path, tag in list(self._listeners):
+            if listened_path == path:
+                handler.send_event(words, tag)
+
+    def simulate_traffic(self, count: int | None = None) -> None:
+        """Makes peers transfer some data and do a handshake, as reported to the listeners.
+
+        Args:
+            count (int | None): The number of peers, all of them if None.
+        """
+        with self._lock:
+            peers = list(self.tables['/interface/wireguard/peers'].values())[:count]
+
+            for peer in peers:
+                peer['rx'] = str(int(peer['rx']) + 1024)
+                peer['tx'] = str(int(peer['tx']) + 2048)
+                peer['last-handshake'] = '1s'
+                self._notify('/interface/wireguard/peers', dict(peer))
+
+    @staticmethod
+    def _normalize(attributes: dict[str, str]) -> dict[str, str]:
+        return {
+            key: {'yes': 'true', 'no': 'false'}.get(value, value) if key == 'disabled' else value
+            for key, value in attributes.items()
+        }
+
+    def handle(self, command: str, attributes: dict[str, str], queries: dict[str, str]) -> list[list[str]]:
+        """Executes an API command.
+
+        Args:
+            command (str): The command word, e.g. ``/interface/wireguard/peers/print``.
+            attributes (dict[str, str]): The command attributes.
+            queries (dict[str, str]): The equality queries.
+
+        Returns:
+            list[list[str]]: The reply sentences.
+        """
+        with self._lock:
+            self.round_trips += 1
+
+        if self.rtt > 0:
+            time.sleep(self.rtt)
+
+        path, _, action = command.rpartition('/')
+
+        with self._lock:
+            if command == '/login':
+                if (attributes.get('name'), attributes.get('password')) == (self.username, self.password):
+                    return [['!done']]
+                return [['!trap', '=message=invalid user name or password (6)'], ['!done']]
+
+            if command == '/system/reboot':
+                return [['!done']]
+
+            if command == '/interface/monitor-traffic':
+                # Every enabled peer of the interface is assumed to transfer 1 KB/s each way
+                peers = sum(
+                    peer['interface'] == attributes.get('interface') and peer.get('disabled') != 'true'
+                    for peer in self.tables['/interface/wireguard/peers'].values()
+                )
+                return [
+                    ['!re', f'=name={attributes.get("interface")}',
+                     f'=rx-bits-per-second={peers * 8192}', f'=tx-bits-per-second={peers * 8192}'],
+                    ['!done'],
+                ]
+
+            if path not in self.tables:
+                return [['!trap', '=message=no such command prefix'], ['!done']]
+
+            table = self.tables[path]
+
+            if action == 'print':
+                proplist = attributes.get('.proplist')
+                keys = proplist.split(',') if proplist else None
+                replies = []
+
+                for item in table.values():
+                    if all(item.get(key) == value for key, value in queries.items()):
+                        fields = item if keys is None else {k: item[k] for k in keys if k in item}
+                        replies.append(['!re'] + [f'={key}={value}' for key, value in fields.items()])
+
+                return replies + [['!done']]
+
+            if action == 'add':
+                item_id = self._add(path, self._normalize(attributes))
+                self._notify(path, dict(table[item_id]))
+                return [['!done', f'=ret={item_id}']]
+
+            # Several items can be changed at once by a comma-separated list of IDs
+            item_ids = attributes.pop('.id', '').split(',')
+
+            if not all(item_id in table for item_id in item_ids):
+                return [['!trap', '=message=no such item'], ['!done']]
+
+            if action == 'set':
+                for item_id in item_ids:
+                    table[item_id].update(self._normalize(attributes))
+                    self._notify(path, dict(table[item_id]))
+                return [['!done']]
+
+            if action == 'remove':
+                for item_id in item_ids:
+                    self._notify(path, table.pop(item_id), dead=True)
+                return [['!done']]
+
+        return [['!trap', '=message=no such command'], ['!done']]
+
+    def start(self) -> None:
+        """Starts accepting connections on a random local port."""
+        self._server = _TCPServer(('127.0.0.1', 0), _Handler)
+        self._server.stand_in = self
+        self.port = self._server.server_address[1]
+
+        Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stops accepting connections."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeRouterOSServer':
+        self.start()
+        return self
+
+    def __exit__(self, *_args) -> None:
+        self.stop()
@@ -0,0 +1,183 @@
+"""Benchmarks of the WireGuard backends against local stand-ins for Linux hosts and RouterOS.
+
+Usage::
+
+    python -m benchmarks.run --backends fake ssh routeros --peers 10 1000 10000 --rtt 0.02
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json --tolerance 0.25
+
+With ``--compare`` the exit status is 1 if any scenario needs more round trips than in the baseline,
+or is slower than the baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from contextlib import ExitStack
+from typing import Callable
+
+from benchmarks.fake_client import FakeClient
+from benchmarks.fake_host import FakeHost
+from benchmarks.routeros_server import FakeRouterOSServer
+from benchmarks.ssh_server import FakeSSHServer
+from wireguard.client.remote import RemoteClient
+from wireguard.linux import Linux
+from wireguard.protocol.amnezia_wg import AmneziaWGProtocol
+from wireguard.protocol.wireguard import WireguardProtocol
+from wireguard.routeros import RouterOS
+from wireguard.wireguard import WireGuard
+
+BACKENDS = ('fake', 'ssh', 'routeros')
+SCENARIOS = ('status', 'stats', 'add', 'delete', 'enable')
+
+
+def _create_backend(stack: ExitStack, backend: str, peers: int, args: argparse.Namespace) -> tuple[WireGuard, Callable]:
+    """Creates a server instance against a stand-in.
+
+    Returns:
+        tuple[WireGuard, Callable]: The server instance and a function returning the round trips made so far.
+    """
+    protocol = AmneziaWGProtocol() if args.protocol == 'awg' else WireguardProtocol()
+
+    match backend:
+        case 'fake':
+            client = FakeClient(FakeHost(peers, args.protocol), args.rtt, args.jitter)
+            server = Linux(client, protocol, '127.0.0.1', path_to_config='/etc/wireguard/wg0.conf')
+            return server, lambda: client.round_trips
+
+        case 'ssh':
+            ssh = stack.enter_context(FakeSSHServer(FakeHost(peers, args.protocol), rtt=args.rtt))
+            client = RemoteClient('127.0.0.1', ssh.port, ssh.username, ssh.password)
+            server = Linux(client, protocol, '127.0.0.1', path_to_config='/etc/wireguard/wg0.conf')
+            return server, lambda: ssh.round_trips
+
+        case 'routeros':
+            router = stack.enter_context(FakeRouterOSServer(peers, rtt=args.rtt))
+            server = RouterOS('127.0.0.1', router.port, router.username, router.password, protocol, '127.0.0.1')
+            return server, lambda: router.round_trips
+
+    raise ValueError(f'Unknown backend: {backend}')
+
+
+def _operations(server: WireGuard, scenario: str, pubkeys: list[str]) -> Callable[[int], None]:
+    match scenario:
+        case 'status':
+            return lambda i: server.get_wg_enabled() and server.get_peers()
+        case 'stats':
+            return lambda i: server.get_peers_stats()
+        case 'add':
+            return lambda i: server.add_peer(f'bench{i}')
+        case 'delete':
+            return lambda i: server.delete_peer(pubkeys[i])
+        case 'enable':
+            # Alternates disabling and enabling the same peer, so that every call changes the state
+            return lambda i: server.set_peer_enabled(pubkeys[0], i % 2 == 1)
+
+    raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def run_scenario(backend: str, peers: int, scenario: str, args: argparse.Namespace) -> dict:
+    """Runs a scenario against a fresh stand-in.
+
+    Returns:
+        dict: The latencies in seconds (``median``, ``p95``, ``max``) and round trips per operation.
+    """
+    with ExitStack() as stack:
+        server, round_trips = _create_backend(stack, backend, peers, args)
+
+        config = server.get_config(as_dict=True)
+        pubkeys = [section['PublicKey'] for name, section in config.items() if name != 'Interface']
+
+        operation = _operations(server, scenario, pubkeys)
+        operation(-1)  # Warm-up, e.g. the first SFTP session
+
+        durations = []
+        started_round_trips = round_trips()
+
+        for i in range(args.repeat):
+            started = time.perf_counter()
+            operation(i)
+            durations.append(time.perf_counter() - started)
+
+        durations.sort()
+
+        return {
+            'median': statistics.median(durations),
+            'p95': durations[min(len(durations) - 1, round(0.95 * (len(durations) - 1)))],
+            'max': durations[-1],
+            'round_trips': (round_trips() - started_round_trips) / args.repeat,
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Finds the regressions against a baseline.
+
+    Returns:
+        list[str]: The descriptions of the regressions.
+    """
+    regressions = []
+
+    for key, result in results.items():
+        previous = baseline.get(key)
+
+        if previous is None:
+            continue
+
+        if result['round_trips'] > previous['round_trips']:
+            regressions.append(f'{key}: {previous["round_trips"]:g} -> {result["round_trips"]:g} round trips')
+
+        if result['median'] > previous['median'] * (1 + tolerance):
+            regressions.append(f'{key}: median {previous["median"] * 1000:.1f} -> {result["median"] * 1000:.1f} ms')
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--peers', nargs='+', type=int, default=[10, 1000, 10000])
+    parser.add_argument('--protocol', choices=('wg', 'awg'), default='wg', help='The protocol of Linux hosts')
+    parser.add_argument('--repeat', type=int, default=5, help='Measured operations per scenario')
+    parser.add_argument('--rtt', type=float, default=0.0, help='Simulated round-trip time in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random RTT deviation in seconds')
+    parser.add_argument('--save', help='Write the results to a JSON file')
+    parser.add_argument('--compare', help='Compare the results with a JSON file written by --save')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative latency increase')
+    args = parser.parse_args()
+
+    results = {}
+    print(f'{"backend":<10}{"peers":>7}  {"scenario":<8}{"median ms":>11}{"p95 ms":>10}{"max ms":>10}{"trips":>8}')
+
+    for backend in args.backends:
+        for peers in args.peers:
+            for scenario in args.scenarios:
+                result = run_scenario(backend, peers, scenario, args)
+                results[f'{backend}/{peers}/{scenario}'] = result
+
+                print(
+                    f'{backend:<10}{peers:>7}  {scenario:<8}{result["median"] * 1000:>11.1f}'
+                    f'{result["p95"] * 1000:>10.1f}{result["max"] * 1000:>10.1f}{result["round_trips"]:>8g}',
+                    flush=True,
+                )
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+import logging
+import os
+import socket
+import time
+from io import BytesIO
+from threading import Lock, Thread
+
+import paramiko
+from paramiko.sftp import SFTP_NO_SUCH_FILE, SFTP_OK
+
+from benchmarks.fake_host import FakeHost
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    def __init__(self, stand_in: 'FakeSSHServer', path: str, flags: int) -> None:
+        super().__init__(flags)
+        self.stand_in = stand_in
+        self.path = path
+        self.writable = bool(flags & (os.O_WRONLY | os.O_RDWR))
+
+        contents = b'' if flags & os.O_TRUNC else stand_in.host.read_file(path).encode()
+        self.readfile = self.writefile = BytesIO(contents)
+
+    def read(self, offset, length):
+        self.stand_in.request()
+        return super().read(offset, length)
+
+    def write(self, offset, data):
+        self.stand_in.request()
+        return super().write(offset, data)
+
+    def stat(self):
+        self.stand_in.request()
+        return self.stand_in.attributes(len(self.readfile.getvalue()))
+
+    def close(self):
+        self.stand_in.request()
+
+        if self.writable:
+            self.stand_in.host.write_file(self.path, self.writefile.getvalue().decode())
+
+        super().close()
+
+
+class _SFTPInterface(paramiko.SFTPServerInterface):
+    def __init__(self, server: paramiko.ServerInterface, stand_in: 'FakeSSHServer', *args, **kwargs) -> None:
+        super().__init__(server, *args, **kwargs)
+        self.stand_in = stand_in
+
+    def open(self, path, flags, attr):
+        self.stand_in.request()
+        writable = flags & (os.O_WRONLY | os.O_RDWR)
+
+        if not writable and path not in self.stand_in.host.files:
+            return SFTP_NO_SUCH_FILE
+
+        return _SFTPHandle(self.stand_in, path, flags)
+
+    def stat(self, path):
+        self.stand_in.request()
+
+        if path not in self.stand_in.host.files:
+            return SFTP_NO_SUCH_FILE
+
+        return self.stand_in.attributes(len(self.stand_in.host.files[path].encode()))
+
+    lstat = stat
+
+    def remove(self, path):
+        self.stand_in.request()
+        self.stand_in.host.files.pop(path, None)
+        return SFTP_OK
+
+    def canonicalize(self, path):
+        return path
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, stand_in: 'FakeSSHServer') -> None:
+        self.stand_in = stand_in
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.stand_in.username, self.stand_in.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        self.stand_in.request()
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        self.stand_in.request()
+        Thread(target=self._execute, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+    def check_channel_subsystem_request(self, channel, name):
+        self.stand_in.request()
+        return super().check_channel_subsystem_request(channel, name)
+
+    def _execute(self, channel: paramiko.Channel, command: str) -> None:
+        status, stdout, stderr = self.stand_in.host.run(command)
+
+        # The channel is left for the client to close: closing it here could overtake the reply
+        # to the exec request, which the client treats as a failure
+        try:
+            channel.sendall(stdout.encode())
+            channel.sendall_stderr(stderr.encode())
+            channel.send_exit_status(status)
+            channel.shutdown_write()
+        except (EOFError, OSError, paramiko.SSHException):
+            # The server was stopped or the client has gone away
+            pass
+
+
+class FakeSSHServer:
+    """Local SSH server with SFTP that exposes a FakeHost, to benchmark ``RemoteClient`` without a real host.
+
+    Usage::
+
+        with FakeSSHServer(FakeHost(peers=1000)) as ssh:
+            client = RemoteClient('127.0.0.1', ssh.port, ssh.username, ssh.password)
+    """
+
+    def __init__(self, host: FakeHost, username: str = 'root', password: str = 'password', rtt: float = 0.0) -> None:
+        """Initializes the FakeSSHServer instance.
+
+        Args:
+            host (FakeHost): The emulated host.
+            username (str): The accepted username. Defaults to ``root``.
+            password (str): The accepted password. Defaults to ``password``.
+            rtt (float): Additional delay of every request in seconds, to simulate a distant host.
+                Defaults to 0.
+        """
+        self.host = host
+        self.username = username
+        self.password = password
+        self.rtt = rtt
+        self.round_trips = 0
+        self.port = None
+
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._socket = None
+        self._transports: list[paramiko.Transport] = []
+        self._lock = Lock()
+
+    def request(self) -> None:
+        """Counts a request of the client and applies the simulated delay."""
+        with self._lock:
+            self.round_trips += 1
+
+        if self.rtt > 0:
+            time.sleep(self.rtt)
+
+    @staticmethod
+    def attributes(size: int) -> paramiko.SFTPAttributes:
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = size
+        attributes.st_mode = 0o100600
+        return attributes
+
+    def start(self) -> None:
+        """Starts accepting connections on a random local port."""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen()
+        self.port = self._socket.getsockname()[1]
+
+        Thread(target=self._accept, daemon=True).start()
+
+    def stop(self) -> None:
+        """Stops accepting connections and closes all sessions."""
+        self._socket.close()
+
+        for transport in self._transports:
+            transport.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                sock, _ = self._socket.accept()
+            except OSError:
+                return
+
+            # The stand-in must not add delays of its own to the small replies
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            try:
+                transport = paramiko.Transport(sock)
+                transport.add_server_key(self._host_key)
+                transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _SFTPInterface, self)
+                transport.start_server(server=_ServerInterface(self))
+                self._transports.append(transport)
+            except (paramiko.SSHException, EOFError) as e:
+                logging.debug(f'SSH negotiation failed: {e}')
+
+    def __enter__(self) -> 'FakeSSHServer':
+        self.start()
+        return self
+
+    def __exit__(self, *_args) -> None:
+        self.stop()
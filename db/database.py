@@ -1,5 +1,6 @@
+import logging
 import sqlite3
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 
 
 class Database:
@@ -16,12 +17,13 @@ class Database:
         """
         self.database_name: str = database_name
 
-    def execute_query(self, query: str, parameters: Tuple = ()) -> List[Tuple]:
+    def execute_query(self, query: str, parameters: Tuple | Dict = ()) -> List[Tuple]:
         """Executes an SQL query on the database.
 
         Args:
             query (str): The SQL query to execute.
-            parameters (Tuple): Optional parameters for the query. Defaults to an empty tuple.
+            parameters (Tuple | Dict): Optional positional or named parameters for the query.
+                Defaults to an empty tuple.
 
         Returns:
             List[Tuple]: A list of tuples containing the query results.
@@ -31,6 +33,19 @@ class Database:
             cur.execute(query, parameters)
             return cur.fetchall()
 
+    def execute_many(self, query: str, parameters: List[Tuple]) -> None:
+        """Executes an SQL query on the database for every set of parameters in a single transaction.
+
+        Args:
+            query (str): The SQL query to execute.
+            parameters (List[Tuple]): A list of parameter tuples.
+
+        Returns:
+            None
+        """
+        with sqlite3.connect(self.database_name) as con:
+            con.executemany(query, parameters)
+
     def init_db(self) -> None:
         """Initializes the database schema if it doesn't exist.
 
@@ -41,6 +56,43 @@ class Database:
             CREATE TABLE IF NOT EXISTS states (chat_id INTEGER PRIMARY KEY, state TEXT);
             CREATE TABLE IF NOT EXISTS data (chat_id INTEGER PRIMARY KEY, data TEXT);
             CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS quotas (
+                server_name TEXT,
+                pubkey TEXT,
+                limit_bytes INTEGER NOT NULL,
+                used_bytes INTEGER NOT NULL DEFAULT 0,
+                last_rx INTEGER,
+                last_tx INTEGER,
+                exceeded INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (server_name, pubkey)
+            );
+            CREATE TABLE IF NOT EXISTS expirations (
+                server_name TEXT,
+                pubkey TEXT,
+                expires_at REAL NOT NULL,
+                action TEXT NOT NULL,
+                PRIMARY KEY (server_name, pubkey)
+            );
+            CREATE TABLE IF NOT EXISTS peers (
+                server_name TEXT,
+                pubkey TEXT,
+                name TEXT NOT NULL,
+                address TEXT,
+                enabled INTEGER NOT NULL DEFAULT 1,
+                remote_id TEXT,
+                PRIMARY KEY (server_name, pubkey)
+            );
+            CREATE INDEX IF NOT EXISTS peers_name ON peers (name);
+            CREATE INDEX IF NOT EXISTS peers_address ON peers (address);
+            CREATE TABLE IF NOT EXISTS peer_sync (server_name TEXT PRIMARY KEY, version TEXT, synced_at REAL);
+            CREATE TABLE IF NOT EXISTS client_configs (
+                server_name TEXT,
+                pubkey TEXT,
+                config BLOB NOT NULL,
+                photo_file_id TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (server_name, pubkey)
+            );
             INSERT OR IGNORE INTO settings (key, value) VALUES ('log_level', 'INFO');
         '''
 
@@ -48,6 +100,53 @@ class Database:
             cur = con.cursor()
             cur.executescript(sql_queries)
 
+        self._init_peer_search()
+
+    def _init_peer_search(self) -> None:
+        """Creates the trigram full-text index of the peers, kept in sync with the peers table by triggers.
+
+        The trigram tokenizer is available since SQLite 3.34, with older versions
+        the peers are searched by prefix only.
+
+        Returns:
+            None
+        """
+        sql_queries: str = '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS peers_search USING fts5(
+                name, address, pubkey, content='peers', content_rowid='rowid', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS peers_search_insert AFTER INSERT ON peers BEGIN
+                INSERT INTO peers_search (rowid, name, address, pubkey)
+                VALUES (new.rowid, new.name, new.address, new.pubkey);
+            END;
+            CREATE TRIGGER IF NOT EXISTS peers_search_delete AFTER DELETE ON peers BEGIN
+                INSERT INTO peers_search (peers_search, rowid, name, address, pubkey)
+                VALUES ('delete', old.rowid, old.name, old.address, old.pubkey);
+            END;
+            CREATE TRIGGER IF NOT EXISTS peers_search_update AFTER UPDATE ON peers BEGIN
+                INSERT INTO peers_search (peers_search, rowid, name, address, pubkey)
+                VALUES ('delete', old.rowid, old.name, old.address, old.pubkey);
+                INSERT INTO peers_search (rowid, name, address, pubkey)
+                VALUES (new.rowid, new.name, new.address, new.pubkey);
+            END;
+        '''
+
+        created = not self._has_peer_search()
+
+        try:
+            with sqlite3.connect(self.database_name) as con:
+                con.executescript(sql_queries)
+
+                # Peers indexed before the search index existed
+                if created:
+                    con.execute("INSERT INTO peers_search (peers_search) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            logging.warning(f'Peer search is limited to prefixes, the full-text index is not supported: {e}')
+
+    def _has_peer_search(self) -> bool:
+        query: str = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'peers_search'"
+        return bool(self.execute_query(query))
+
     def get_log_level(self) -> Optional[str]:
         """Retrieves the current log level from the settings table.
 
@@ -66,3 +165,351 @@ class Database:
         """
         query: str = "UPDATE settings SET value = ? WHERE key = 'log_level'"
         self.execute_query(query, (log_level,))
+
+    def get_quota(self, server_name: str, pubkey: str) -> Optional[Tuple]:
+        """Retrieves the traffic quota of a peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+
+        Returns:
+            Optional[Tuple]: A ``(limit_bytes, used_bytes, exceeded)`` tuple if the peer has a quota, else None.
+        """
+        query: str = 'SELECT limit_bytes, used_bytes, exceeded FROM quotas WHERE server_name = ? AND pubkey = ?'
+        result: List[Tuple] = self.execute_query(query, (server_name, pubkey))
+        return result[0] if result else None
+
+    def get_quotas(self, server_name: str) -> List[Tuple]:
+        """Retrieves the traffic quotas of all peers of a server.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            List[Tuple]: A list of ``(pubkey, limit_bytes, used_bytes, last_rx, last_tx, exceeded)`` tuples.
+        """
+        query: str = '''
+            SELECT pubkey, limit_bytes, used_bytes, last_rx, last_tx, exceeded FROM quotas WHERE server_name = ?
+        '''
+        return self.execute_query(query, (server_name,))
+
+    def set_quota(self, server_name: str, pubkey: str, limit_bytes: int) -> None:
+        """Sets the traffic limit of a peer, keeping the already accumulated usage.
+
+        The exceeded flag is cleared if the accumulated usage is below the new limit.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+            limit_bytes (int): The traffic limit in bytes.
+        """
+        query: str = '''
+            INSERT INTO quotas (server_name, pubkey, limit_bytes) VALUES (?, ?, ?)
+            ON CONFLICT (server_name, pubkey) DO UPDATE SET
+                limit_bytes = excluded.limit_bytes,
+                exceeded = exceeded AND used_bytes >= excluded.limit_bytes
+        '''
+        self.execute_query(query, (server_name, pubkey, limit_bytes))
+
+    def reset_quota_usage(self, server_name: str, pubkey: str) -> None:
+        """Resets the accumulated traffic of a peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+        """
+        query: str = 'UPDATE quotas SET used_bytes = 0, exceeded = 0 WHERE server_name = ? AND pubkey = ?'
+        self.execute_query(query, (server_name, pubkey))
+
+    def update_quota_usage(self, usage: List[Tuple]) -> None:
+        """Stores the accumulated traffic of several peers at once.
+
+        Args:
+            usage (List[Tuple]): A list of ``(used_bytes, last_rx, last_tx, exceeded, server_name, pubkey)`` tuples.
+        """
+        query: str = '''
+            UPDATE quotas SET used_bytes = ?, last_rx = ?, last_tx = ?, exceeded = ?
+            WHERE server_name = ? AND pubkey = ?
+        '''
+        self.execute_many(query, usage)
+
+    def delete_quota(self, server_name: str, pubkey: str) -> None:
+        """Removes the traffic quota of a peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+        """
+        query: str = 'DELETE FROM quotas WHERE server_name = ? AND pubkey = ?'
+        self.execute_query(query, (server_name, pubkey))
+
+    def get_expiration(self, server_name: str, pubkey: str) -> Optional[Tuple]:
+        """Retrieves the expiration of a peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+
+        Returns:
+            Optional[Tuple]: An ``(expires_at, action)`` tuple if the peer expires, else None.
+        """
+        query: str = 'SELECT expires_at, action FROM expirations WHERE server_name = ? AND pubkey = ?'
+        result: List[Tuple] = self.execute_query(query, (server_name, pubkey))
+        return result[0] if result else None
+
+    def get_expirations(self) -> List[Tuple]:
+        """Retrieves the expirations of all peers of all servers.
+
+        Returns:
+            List[Tuple]: A list of ``(server_name, pubkey, expires_at, action)`` tuples.
+        """
+        return self.execute_query('SELECT server_name, pubkey, expires_at, action FROM expirations')
+
+    def set_expiration(self, server_name: str, pubkey: str, expires_at: float, action: str) -> None:
+        """Sets the expiration of a peer, replacing the previous one.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+            expires_at (float): The UNIX timestamp of the expiration.
+            action (str): What to do with the peer when it expires, ``disable`` or ``delete``.
+        """
+        query: str = 'REPLACE INTO expirations (server_name, pubkey, expires_at, action) VALUES (?, ?, ?, ?)'
+        self.execute_query(query, (server_name, pubkey, expires_at, action))
+
+    def delete_expirations(self, peers: List[Tuple]) -> None:
+        """Removes the expirations of several peers at once.
+
+        Args:
+            peers (List[Tuple]): A list of ``(server_name, pubkey)`` tuples.
+        """
+        self.execute_many('DELETE FROM expirations WHERE server_name = ? AND pubkey = ?', peers)
+
+    def get_client_config(self, server_name: str, pubkey: str) -> Optional[Tuple]:
+        """Retrieves the stored client configuration of a peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+
+        Returns:
+            Optional[Tuple]: A ``(config, photo_file_id)`` tuple with the encrypted configuration
+            if it's stored, else None.
+        """
+        query: str = 'SELECT config, photo_file_id FROM client_configs WHERE server_name = ? AND pubkey = ?'
+        result: List[Tuple] = self.execute_query(query, (server_name, pubkey))
+        return result[0] if result else None
+
+    def set_client_config(self, server_name: str, pubkey: str, config: bytes, created_at: float) -> None:
+        """Stores the client configuration of a peer, replacing the previous one.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+            config (bytes): The encrypted configuration.
+            created_at (float): The UNIX timestamp of the creation of the configuration.
+        """
+        query: str = 'REPLACE INTO client_configs (server_name, pubkey, config, created_at) VALUES (?, ?, ?, ?)'
+        self.execute_query(query, (server_name, pubkey, config, created_at))
+
+    def set_client_config_photo(self, server_name: str, pubkey: str, photo_file_id: str) -> None:
+        """Stores the Telegram file ID of the QR code of a stored client configuration.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+            photo_file_id (str): The file ID of the sent QR code.
+        """
+        query: str = 'UPDATE client_configs SET photo_file_id = ? WHERE server_name = ? AND pubkey = ?'
+        self.execute_query(query, (photo_file_id, server_name, pubkey))
+
+    def delete_client_configs(self, server_name: str, pubkeys: List[str]) -> None:
+        """Removes the stored client configurations of several peers of a server at once.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkeys (List[str]): The public keys of the peers.
+        """
+        query: str = 'DELETE FROM client_configs WHERE server_name = ? AND pubkey = ?'
+        self.execute_many(query, [(server_name, pubkey) for pubkey in pubkeys])
+
+    def get_indexed_peers(self, server_name: str) -> List[Tuple]:
+        """Retrieves the indexed peers of a server in the order they were added.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            List[Tuple]: A list of ``(pubkey, name, address, enabled, remote_id)`` tuples.
+        """
+        query: str = 'SELECT pubkey, name, address, enabled, remote_id FROM peers WHERE server_name = ? ORDER BY rowid'
+        return self.execute_query(query, (server_name,))
+
+    def get_indexed_peer(self, server_name: str, pubkey: str) -> Optional[Tuple]:
+        """Retrieves an indexed peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+
+        Returns:
+            Optional[Tuple]: A ``(name, address, enabled, remote_id)`` tuple if the peer is indexed, else None.
+        """
+        query: str = 'SELECT name, address, enabled, remote_id FROM peers WHERE server_name = ? AND pubkey = ?'
+        result: List[Tuple] = self.execute_query(query, (server_name, pubkey))
+        return result[0] if result else None
+
+    def find_indexed_peers(self, name: Optional[str] = None, address: Optional[str] = None) -> List[Tuple]:
+        """Finds the indexed peers of all servers by their exact name or address.
+
+        Args:
+            name (Optional[str]): The name of the peer.
+            address (Optional[str]): The address of the peer, e.g. ``10.0.0.2/32``.
+
+        Returns:
+            List[Tuple]: A list of ``(server_name, pubkey, name, address, enabled)`` tuples.
+        """
+        conditions = [f'{column} = ?' for column, value in (('name', name), ('address', address)) if value is not None]
+        query: str = f'''
+            SELECT server_name, pubkey, name, address, enabled FROM peers
+            WHERE {' AND '.join(conditions) or '1'} ORDER BY server_name, rowid
+        '''
+        return self.execute_query(query, tuple(value for value in (name, address) if value is not None))
+
+    def get_peer_sync(self, server_name: str) -> Optional[Tuple]:
+        """Retrieves the state of the last peer index synchronization of a server.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            Optional[Tuple]: A ``(version, synced_at)`` tuple if the index is up to date, else None.
+        """
+        query: str = 'SELECT version, synced_at FROM peer_sync WHERE server_name = ?'
+        result: List[Tuple] = self.execute_query(query, (server_name,))
+        return result[0] if result else None
+
+    def update_peer_index(
+            self,
+            server_name: str,
+            peers: List[Tuple],
+            deleted_pubkeys: List[str],
+            version: Optional[str],
+            synced_at: float,
+    ) -> None:
+        """Applies the changes found by a synchronization to the peer index in a single transaction.
+
+        Args:
+            server_name (str): The name of the server.
+            peers (List[Tuple]): New or changed peers as ``(pubkey, name, address, enabled, remote_id)`` tuples.
+            deleted_pubkeys (List[str]): The public keys of the peers that no longer exist.
+            version (Optional[str]): The version of the server configuration the index corresponds to.
+            synced_at (float): The UNIX timestamp of the synchronization.
+        """
+        upsert_query: str = '''
+            INSERT INTO peers (server_name, pubkey, name, address, enabled, remote_id) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (server_name, pubkey) DO UPDATE SET
+                name = excluded.name,
+                address = excluded.address,
+                enabled = excluded.enabled,
+                remote_id = excluded.remote_id
+        '''
+
+        with sqlite3.connect(self.database_name) as con:
+            con.executemany(upsert_query, [(server_name, *peer) for peer in peers])
+            con.executemany(
+                'DELETE FROM peers WHERE server_name = ? AND pubkey = ?',
+                [(server_name, pubkey) for pubkey in deleted_pubkeys],
+            )
+            con.execute(
+                'REPLACE INTO peer_sync (server_name, version, synced_at) VALUES (?, ?, ?)',
+                (server_name, version, synced_at),
+            )
+
+    def invalidate_peer_index(self, server_name: str) -> None:
+        """Marks the peer index of a server as outdated, so it's synchronized before the next use.
+
+        Args:
+            server_name (str): The name of the server.
+        """
+        self.execute_query('DELETE FROM peer_sync WHERE server_name = ?', (server_name,))
+
+    def update_indexed_peer(self, server_name: str, pubkey: str, **fields) -> None:
+        """Changes an indexed peer after it was changed by the bot.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+            **fields: The new values of the ``name``, ``address`` or ``enabled`` columns.
+        """
+        columns = [column for column in ('name', 'address', 'enabled') if column in fields]
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        query: str = f'UPDATE peers SET {assignments} WHERE server_name = ? AND pubkey = ?'
+        self.execute_query(query, (*(fields[column] for column in columns), server_name, pubkey))
+
+    def delete_indexed_peers(self, server_name: str, pubkeys: List[str]) -> None:
+        """Removes several peers of a server from the index at once.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkeys (List[str]): The public keys of the peers.
+        """
+        self.execute_many(
+            'DELETE FROM peers WHERE server_name = ? AND pubkey = ?',
+            [(server_name, pubkey) for pubkey in pubkeys],
+        )
+
+    def get_indexed_peer_by_id(self, peer_id: int) -> Optional[Tuple]:
+        """Retrieves an indexed peer by its ID in the index.
+
+        Args:
+            peer_id (int): The ID of the peer, as returned by ``search_indexed_peers``.
+
+        Returns:
+            Optional[Tuple]: A ``(server_name, pubkey, name, address, enabled)`` tuple if the peer is indexed, else None.
+        """
+        query: str = 'SELECT server_name, pubkey, name, address, enabled FROM peers WHERE rowid = ?'
+        result: List[Tuple] = self.execute_query(query, (peer_id,))
+        return result[0] if result else None
+
+    def search_indexed_peers(self, text: str, limit: int = 50) -> List[Tuple]:
+        """Searches the indexed peers of all servers by a part of the name, address or public key.
+
+        Texts of at least three characters are looked up in the trigram index and match anywhere,
+        shorter ones match the beginning of the values. Exact and prefix name matches come first.
+
+        Args:
+            text (str): The text to search for, case-insensitive.
+            limit (int): The maximum number of peers to return. Defaults to 50.
+
+        Returns:
+            List[Tuple]: A list of ``(id, server_name, pubkey, name, address, enabled)`` tuples.
+        """
+        parameters = {
+            'text': text,
+            'prefix': text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',
+            # Quoted as a phrase, so that the text is never parsed as a query expression
+            'phrase': '"' + text.replace('"', '""') + '"',
+            'limit': limit,
+        }
+        order: str = '''
+            ORDER BY peers.name = :text COLLATE NOCASE DESC, peers.name LIKE :prefix ESCAPE '\\' DESC, peers.name
+            LIMIT :limit
+        '''
+
+        if len(text) >= 3 and self._has_peer_search():
+            query: str = f'''
+                SELECT peers.rowid, peers.server_name, peers.pubkey, peers.name, peers.address, peers.enabled
+                FROM peers_search JOIN peers ON peers.rowid = peers_search.rowid
+                WHERE peers_search MATCH :phrase {order}
+            '''
+        else:
+            query: str = f'''
+                SELECT rowid, server_name, pubkey, name, address, enabled FROM peers
+                WHERE name LIKE :prefix ESCAPE '\\' OR address LIKE :prefix ESCAPE '\\'
+                    OR pubkey LIKE :prefix ESCAPE '\\'
+                {order}
+            '''
+
+        return self.execute_query(query, parameters)
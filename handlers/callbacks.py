@@ -1,13 +1,23 @@
+import asyncio
+import html
 import logging
 
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
+from aiogram.types.input_file import BufferedInputFile
 
 from db.database import Database
-from modules.fsm_states import AddPeer, RenamePeer
+from modules.collector import StatsCollector
+from modules.dashboard import update_dashboard
+from modules.expiry import ExpiryScheduler
+from modules.fsm_states import AddPeer, RenamePeer, SetQuota, SetExpiry
 from modules.keyboards import *
-from modules.messages import peers_message
+from modules.messages import status_message, quota_message, expiry_message, server_menu_message, client_config_qr
+from modules.peer_index import PeerIndex
+from modules.placement import ServerPlacement
+from modules.status import StatusCache
+from modules.vault import ConfigVault
 from wireguard.wireguard import WireGuard
 
 router = Router()
@@ -20,11 +30,38 @@ async def send_servers(callback: CallbackQuery, state: FSMContext, servers: dict
     await callback.message.edit_text(text='Server list:', reply_markup=servers_kb(server_names))
 
 
+@router.callback_query(F.data == 'dashboard')
+async def send_dashboard(
+        callback: CallbackQuery,
+        state: FSMContext,
+        servers: dict,
+        collector: StatsCollector,
+        handshake_stale_after: float,
+        dashboard_timeout: float,
+):
+    await state.clear()
+    await callback.answer('Requesting servers...')
+    await update_dashboard(callback.message, servers, collector, handshake_stale_after, dashboard_timeout)
+
+
+async def _get_host_health(server_name: str, server: WireGuard) -> dict | None:
+    # The menu is shown without the load rather than not at all
+    try:
+        return await asyncio.to_thread(server.get_host_health)
+    except Exception as e:
+        logging.debug(f'Unable to get the host health of "{server_name}": {e!r}')
+        return None
+
+
 @router.callback_query(F.data.startswith('server:'))
 async def send_server_menu(callback: CallbackQuery, server_name: str, server: WireGuard):
+    interface_is_up, health = await asyncio.gather(
+        asyncio.to_thread(server.get_wg_enabled),
+        _get_host_health(server_name, server),
+    )
     await callback.message.edit_text(
-        text=f'Server <b>{server_name}</b>',
-        reply_markup=wg_options_kb(server.get_wg_enabled())
+        text=server_menu_message(server_name, health),
+        reply_markup=wg_options_kb(interface_is_up)
     )
 
 
@@ -49,10 +86,48 @@ async def reboot_host(callback: CallbackQuery, state: FSMContext, servers: dict,
 
 
 @router.callback_query(F.data == 'get_peers')
-async def send_peer_list(callback: CallbackQuery, server: WireGuard):
-    await callback.answer('Requesting status...')
-    peer_list = server.get_peers()
-    await callback.message.edit_text(text=f'{peers_message(peer_list)}', reply_markup=peer_list_kb())
+async def send_peer_list(
+        callback: CallbackQuery,
+        server_name: str,
+        server: WireGuard,
+        peer_index: PeerIndex,
+        status_cache: StatusCache,
+):
+    message = callback.message
+    view = status_cache.open_view(message.chat.id, message.message_id, server_name)
+    snapshot = status_cache.get(server_name)
+
+    try:
+        # The last known status is shown right away and updated once the server responds
+        if snapshot is not None:
+            await callback.answer()
+            refreshing = not status_cache.is_fresh(server_name)
+            await message.edit_text(text=status_message(snapshot, refreshing), reply_markup=peer_list_kb())
+
+            if not refreshing:
+                return
+        else:
+            await callback.answer('Requesting status...')
+
+        snapshot = await status_cache.refresh(server_name, server, peer_index)
+
+        if status_cache.is_view_open(message.chat.id, message.message_id, view):
+            await message.edit_text(text=status_message(snapshot), reply_markup=peer_list_kb())
+    finally:
+        # Nothing edits the message anymore, unless it was made live
+        status_cache.finish_view(message.chat.id, message.message_id, view)
+
+
+@router.callback_query(F.data == 'live_status')
+async def start_live_status(
+        callback: CallbackQuery,
+        server_name: str,
+        server: WireGuard,
+        peer_index: PeerIndex,
+        status_cache: StatusCache,
+):
+    await callback.answer(f'The status will be refreshed every {status_cache.live_interval:g} seconds')
+    status_cache.start_live(callback.message, server_name, server, peer_index)
 
 
 @router.callback_query(F.data == 'get_server_config')
@@ -79,14 +154,30 @@ async def add_peer(callback: CallbackQuery, state: FSMContext):
     await state.set_state(AddPeer.waiting_for_peer_name)
 
 
+@router.callback_query(F.data == 'add_peer_anywhere')
+async def add_peer_anywhere(callback: CallbackQuery, state: FSMContext, servers: dict, placement: ServerPlacement):
+    server_name = placement.choose()
+
+    if server_name is None:
+        return await callback.answer('No server can take a new client', show_alert=True)
+
+    text = f'The client will be added to <b>{html.escape(server_name)}</b>.'
+
+    if placement.get_load(server_name).free_ips is None:
+        text += "\nThe load of the servers isn't known yet, so it's the first server that may take a client."
+
+    # The client is then added as if the server was selected from the list
+    await state.set_data({'server_name': server_name, 'server_data': servers[server_name]})
+    await callback.message.edit_text(text=f"{text}\nSend me the client's name", reply_markup=cancel_btn('servers'))
+    await state.set_state(AddPeer.waiting_for_peer_name)
+
+
 @router.callback_query(F.data == 'config_peers')
-async def config_peers(callback: CallbackQuery, server: WireGuard, state: FSMContext):
+async def config_peers(callback: CallbackQuery, server_name: str, state: FSMContext, peer_index: PeerIndex):
     await state.set_state()
     await callback.answer('Requesting a list of peers...')
 
-    config = server.get_config(as_dict=True)
-    config.pop('Interface')
-    peers = {name: data['PublicKey'] for name, data in config.items()}
+    peers = {name: pubkey for pubkey, name, *_ in await peer_index.get_peers(server_name)}
 
     text = 'Choose a client:'
     markup = peers_kb(peers)
@@ -99,15 +190,55 @@ async def config_peers(callback: CallbackQuery, server: WireGuard, state: FSMCon
 
 
 @router.callback_query(F.data.startswith('peer'))
-async def show_peer(callback: CallbackQuery, server: WireGuard, state: FSMContext):
+async def show_peer(
+        callback: CallbackQuery,
+        server_name: str,
+        state: FSMContext,
+        peer_index: PeerIndex,
+        vault: ConfigVault | None,
+):
     await state.set_state()
     pubkey = callback.data.split(':')[-1]
-    peer_is_enabled = server.get_peer_enabled(pubkey)
-    await callback.message.edit_text(text=f'Choose an action:', reply_markup=peer_action_kb(pubkey, peer_is_enabled))
+    peer = await peer_index.get_peer(server_name, pubkey)
+    peer_is_enabled = peer is not None and bool(peer[2])
+    has_config = vault is not None and vault.has(server_name, pubkey)
+    await callback.message.edit_text(
+        text=f'Choose an action:',
+        reply_markup=peer_action_kb(pubkey, peer_is_enabled, has_config),
+    )
+
+
+@router.callback_query(F.data.startswith('resend_config'))
+async def resend_config(callback: CallbackQuery, server_name: str, vault: ConfigVault | None):
+    pubkey = callback.data.split(':')[-1]
+    stored = vault.get(server_name, pubkey) if vault is not None else None
+
+    if stored is None:
+        return await callback.answer('The configuration of this client is not stored', show_alert=True)
+
+    client_config, photo_file_id = stored
+    await callback.answer()
+
+    # The server isn't requested, the stored configuration is what the client got when it was added
+    sent = await callback.message.answer_photo(
+        photo=photo_file_id or BufferedInputFile(client_config_qr(client_config), 'qr'),
+        caption=client_config,
+        reply_markup=back_btn('config_peers'),
+    )
+
+    if photo_file_id is None and sent.photo:
+        vault.set_photo(server_name, pubkey, sent.photo[-1].file_id)
 
 
 @router.callback_query(F.data.startswith('selected_peer'))
-async def process_peer_action(callback: CallbackQuery, state: FSMContext, server: WireGuard):
+async def process_peer_action(
+        callback: CallbackQuery,
+        state: FSMContext,
+        server_name: str,
+        server: WireGuard,
+        peer_index: PeerIndex,
+        vault: ConfigVault | None,
+):
     _, action, pubkey = callback.data.split(':')
 
     match action:
@@ -121,10 +252,12 @@ async def process_peer_action(callback: CallbackQuery, state: FSMContext, server
             return await state.set_state(RenamePeer.waiting_for_new_name)
         case 'off':
             await callback.answer('Disabling...')
-            server.set_peer_enabled(pubkey, False)
+            await asyncio.to_thread(server.set_peer_enabled, pubkey, False)
+            await peer_index.update_peer(server_name, pubkey, enabled=False)
         case 'on':
             await callback.answer('Enabling...')
-            server.set_peer_enabled(pubkey, True)
+            await asyncio.to_thread(server.set_peer_enabled, pubkey, True)
+            await peer_index.update_peer(server_name, pubkey, enabled=True)
         case 'del':
             return await callback.message.edit_text(
                 text='Are you sure you want to delete the peer? This action cannot be reversed!',
@@ -133,20 +266,114 @@ async def process_peer_action(callback: CallbackQuery, state: FSMContext, server
         case _:
             await callback.answer('Unknown action!', show_alert=True)
 
-    await show_peer(callback, server, state)
+    await show_peer(callback, server_name, state, peer_index, vault)
 
 
 @router.callback_query(F.data.startswith('confirm_peer_del'))
-async def delete_peer(callback: CallbackQuery, state: FSMContext, server: WireGuard):
+async def delete_peer(
+        callback: CallbackQuery,
+        state: FSMContext,
+        server_name: str,
+        server: WireGuard,
+        expiry_scheduler: ExpiryScheduler,
+        peer_index: PeerIndex,
+        vault: ConfigVault | None,
+):
     _, deletion_yes_no, pubkey = callback.data.split(':')
     deletion_confirmed = deletion_yes_no == 'y'
 
     if deletion_confirmed:
         await callback.answer('Deleting...')
-        server.delete_peer(pubkey)
-        return await config_peers(callback, server, state)
+        await asyncio.to_thread(server.delete_peer, pubkey)
+        Database().delete_quota(server_name, pubkey)
+        Database().delete_client_configs(server_name, [pubkey])
+        await expiry_scheduler.cancel(server_name, pubkey)
+        await peer_index.delete_peers(server_name, [pubkey])
+        return await config_peers(callback, server_name, state, peer_index)
+    else:
+        await show_peer(callback, server_name, state, peer_index, vault)
+
+
+@router.callback_query(F.data.startswith('quota:'))
+async def show_quota(callback: CallbackQuery, state: FSMContext, server_name: str):
+    await state.set_state()
+    pubkey = callback.data.split(':')[-1]
+    quota = Database().get_quota(server_name, pubkey)
+    await callback.message.edit_text(text=quota_message(quota), reply_markup=quota_kb(pubkey, quota is not None))
+
+
+@router.callback_query(F.data.startswith('quota_set'))
+async def set_quota(callback: CallbackQuery, state: FSMContext):
+    pubkey = callback.data.split(':')[-1]
+    await callback.message.edit_text(
+        text='Send me the traffic limit, e.g. <code>10 GB</code> or <code>500 MiB</code>',
+        reply_markup=cancel_btn(f'quota:{pubkey}')
+    )
+    await state.update_data({'pubkey': pubkey})
+    await state.set_state(SetQuota.waiting_for_limit)
+
+
+@router.callback_query(F.data.startswith('quota_reset') | F.data.startswith('quota_del'))
+async def reset_quota(
+        callback: CallbackQuery,
+        state: FSMContext,
+        server_name: str,
+        server: WireGuard,
+        peer_index: PeerIndex,
+):
+    action, pubkey = callback.data.split(':')
+    database = Database()
+    quota = database.get_quota(server_name, pubkey)
+
+    if action == 'quota_reset':
+        await callback.answer('Resetting usage...')
+        database.reset_quota_usage(server_name, pubkey)
     else:
-        await show_peer(callback, server, state)
+        await callback.answer('Removing quota...')
+        database.delete_quota(server_name, pubkey)
+
+    # Give the traffic back to a client that was disabled by the quota engine
+    if quota and quota[2]:
+        await asyncio.to_thread(server.set_peer_enabled, pubkey, True)
+        await peer_index.update_peer(server_name, pubkey, enabled=True)
+
+    await show_quota(callback, state, server_name)
+
+
+@router.callback_query(F.data.startswith('expiry:'))
+async def show_expiry(callback: CallbackQuery, state: FSMContext, server_name: str, expiry_scheduler: ExpiryScheduler):
+    await state.set_state()
+    pubkey = callback.data.split(':')[-1]
+    expiration = expiry_scheduler.get(server_name, pubkey)
+    await callback.message.edit_text(
+        text=expiry_message(expiration),
+        reply_markup=expiry_kb(pubkey, expiration is not None)
+    )
+
+
+@router.callback_query(F.data.startswith('expiry_set'))
+async def set_expiry(callback: CallbackQuery, state: FSMContext):
+    _, action, pubkey = callback.data.split(':')
+    await callback.message.edit_text(
+        text='Send me the expiry as a duration, e.g. <code>12h</code> or <code>7d</code>, '
+             'or as a date, e.g. <code>2025-01-31 18:00</code>',
+        reply_markup=cancel_btn(f'expiry:{pubkey}')
+    )
+    await state.update_data({'pubkey': pubkey, 'expiry_action': action})
+    await state.set_state(SetExpiry.waiting_for_date)
+
+
+@router.callback_query(F.data.startswith('expiry_del'))
+async def delete_expiry(
+        callback: CallbackQuery,
+        state: FSMContext,
+        server_name: str,
+        expiry_scheduler: ExpiryScheduler,
+):
+    pubkey = callback.data.split(':')[-1]
+    await callback.answer('Removing expiry...')
+    await expiry_scheduler.cancel(server_name, pubkey)
+    await show_expiry(callback, state, server_name, expiry_scheduler)
 
 
 @router.callback_query(F.data.startswith('debug_log'))
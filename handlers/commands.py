@@ -1,14 +1,46 @@
-from aiogram import Router
+from html import escape
+
+from aiogram import Router, F
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
+from aiogram.filters.command import CommandObject
 from aiogram.types import Message
 
 from db.database import Database
-from modules.keyboards import servers_kb, bot_settings_kb
+from modules.collector import StatsCollector
+from modules.dashboard import update_dashboard
+from modules.instrumentation import operation_stats
+from modules.keyboards import servers_kb, bot_settings_kb, peer_action_kb
+from modules.messages import stats_message
+from modules.peer_index import PeerIndex
+from modules.vault import ConfigVault
 
 router = Router()
 
 
+@router.message(CommandStart(deep_link=True, magic=F.args.regexp(r'^peer_\d+$')))
+async def open_peer(
+        message: Message,
+        command: CommandObject,
+        state: FSMContext,
+        servers: dict,
+        peer_index: PeerIndex,
+        vault: ConfigVault | None,
+):
+    await state.clear()
+    peer = await peer_index.get_by_id(int(command.args.removeprefix('peer_')))
+
+    if peer is None or peer[0] not in servers:
+        return await message.answer('The client no longer exists')
+
+    server_name, pubkey, name, _, enabled = peer
+    await state.set_data({'server_name': server_name, 'server_data': servers[server_name]})
+    await message.answer(
+        text=f'Client <b>{escape(name)}</b> on <b>{escape(server_name)}</b>, choose an action:',
+        reply_markup=peer_action_kb(pubkey, bool(enabled), vault is not None and vault.has(server_name, pubkey)),
+    )
+
+
 @router.message(CommandStart())
 async def send_start(message: Message, state: FSMContext):
     await state.clear()
@@ -26,3 +58,20 @@ async def send_servers(message: Message, servers: dict, state: FSMContext):
 async def send_settings(message: Message):
     debug_log_enabled = Database().get_log_level() == 'DEBUG'
     await message.answer('Bot settings:', reply_markup=bot_settings_kb(debug_log_enabled))
+
+
+@router.message(Command('dashboard'))
+async def send_dashboard(
+        message: Message,
+        servers: dict,
+        collector: StatsCollector,
+        handshake_stale_after: float,
+        dashboard_timeout: float,
+):
+    dashboard = await message.answer('Requesting servers...')
+    await update_dashboard(dashboard, servers, collector, handshake_stale_after, dashboard_timeout)
+
+
+@router.message(Command('stats'))
+async def send_stats(message: Message):
+    await message.answer(stats_message(operation_stats.summary()))
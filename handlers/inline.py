@@ -0,0 +1,38 @@
+from html import escape
+
+from aiogram import Bot, Router
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from aiogram.utils.deep_linking import create_start_link
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from modules.peer_index import PeerIndex
+
+router = Router()
+
+SEARCH_LIMIT = 50
+
+
+@router.inline_query()
+async def search_peers(inline_query: InlineQuery, bot: Bot, peer_index: PeerIndex):
+    text = inline_query.query.strip()
+
+    if not text:
+        return await inline_query.answer([], cache_time=0, is_personal=True)
+
+    results = []
+
+    for peer_id, server_name, pubkey, name, address, enabled in await peer_index.search(text, SEARCH_LIMIT):
+        kb = InlineKeyboardBuilder()
+        kb.button(text='Open client ➡️', url=await create_start_link(bot, f'peer_{peer_id}'))
+
+        results.append(InlineQueryResultArticle(
+            id=str(peer_id),
+            title=name,
+            description=f'{server_name} · {address or "no address"} · {"enabled" if enabled else "disabled"}',
+            input_message_content=InputTextMessageContent(
+                message_text=f'🔎 <b>{escape(name)}</b> on <b>{escape(server_name)}</b>\n<code>{pubkey}</code>',
+            ),
+            reply_markup=kb.as_markup(),
+        ))
+
+    await inline_query.answer(results, cache_time=5, is_personal=True)
@@ -1,44 +1,127 @@
-from io import BytesIO
+import asyncio
+import time
 
-import qrcode
 from aiogram import Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 from aiogram.types.input_file import BufferedInputFile
-from qrcode.image.pure import PyPNGImage
 
-from modules.fsm_states import AddPeer, RenamePeer
-from modules.keyboards import peer_action_kb, back_btn
+from db.database import Database
+from modules.expiry import ExpiryScheduler, parse_expiry
+from modules.fsm_states import AddPeer, RenamePeer, SetQuota, SetExpiry
+from modules.keyboards import peer_action_kb, back_btn, quota_kb, expiry_kb
+from modules.messages import quota_message, expiry_message, client_config_qr
+from modules.peer_index import PeerIndex
+from modules.placement import ServerPlacement
+from modules.provisioning import ProvisioningPool
+from modules.quotas import parse_size
+from modules.vault import ConfigVault
 from wireguard.wireguard import WireGuard
 
 router = Router()
 
 
 @router.message(AddPeer.waiting_for_peer_name)
-async def check_peer_name(message: Message, state: FSMContext, server: WireGuard):
+async def check_peer_name(
+        message: Message,
+        state: FSMContext,
+        server_name: str,
+        server: WireGuard,
+        provisioning_pool: ProvisioningPool,
+        peer_index: PeerIndex,
+        placement: ServerPlacement,
+        vault: ConfigVault | None,
+):
     await message.bot.send_chat_action(message.chat.id, action='upload_photo')
-    client_config = server.add_peer(message.text)
+    client_config = await provisioning_pool.add_peer(server_name, server, message.text)
+    await peer_index.invalidate(server_name)
+    placement.note_added(server_name)
 
-    img_buf = BytesIO()
-    qrcode.make(client_config, image_factory=PyPNGImage).save(img_buf)
+    pubkey = vault.store(server_name, client_config) if vault is not None else None
 
-    await message.answer_photo(
-        photo=BufferedInputFile(img_buf.getvalue(), 'qr'),
+    sent = await message.answer_photo(
+        photo=BufferedInputFile(client_config_qr(client_config), 'qr'),
         caption=client_config,
         reply_markup=back_btn('config_peers'),
     )
 
+    # The QR code is sent again by its file ID
+    if pubkey is not None and sent.photo:
+        vault.set_photo(server_name, pubkey, sent.photo[-1].file_id)
+
     await state.set_state()
 
 
 @router.message(RenamePeer.waiting_for_new_name)
-async def check_new_name(message: Message, state: FSMContext, server: WireGuard):
+async def check_new_name(
+        message: Message,
+        state: FSMContext,
+        server_name: str,
+        server: WireGuard,
+        peer_index: PeerIndex,
+        vault: ConfigVault | None,
+):
+    state_data = await state.get_data()
+    pubkey = state_data.get('pubkey')
+    await asyncio.to_thread(server.rename_peer, pubkey, message.text)
+    await peer_index.update_peer(server_name, pubkey, name=message.text)
+
+    peer = await peer_index.get_peer(server_name, pubkey)
+    peer_is_enabled = peer is not None and bool(peer[2])
+    has_config = vault is not None and vault.has(server_name, pubkey)
+    await message.answer(text=f'Choose an action:', reply_markup=peer_action_kb(pubkey, peer_is_enabled, has_config))
+
+    await state.set_state()
+
+
+@router.message(SetQuota.waiting_for_limit)
+async def check_quota_limit(
+        message: Message,
+        state: FSMContext,
+        server_name: str,
+        server: WireGuard,
+        peer_index: PeerIndex,
+):
+    limit_bytes = parse_size(message.text or '')
+
+    if not limit_bytes:
+        return await message.answer('Invalid traffic limit, try again, e.g. <code>10 GB</code>')
+
     state_data = await state.get_data()
     pubkey = state_data.get('pubkey')
-    server.rename_peer(pubkey, message.text)
 
-    peer_is_enabled = server.get_peer_enabled(pubkey)
-    await message.answer(text=f'Choose an action:', reply_markup=peer_action_kb(pubkey, peer_is_enabled))
+    database = Database()
+    previous_quota = database.get_quota(server_name, pubkey)
+    database.set_quota(server_name, pubkey, limit_bytes)
+    quota = database.get_quota(server_name, pubkey)
+
+    # The new limit is above the usage of a client disabled by the quota engine
+    if previous_quota and previous_quota[2] and not quota[2]:
+        await asyncio.to_thread(server.set_peer_enabled, pubkey, True)
+        await peer_index.update_peer(server_name, pubkey, enabled=True)
+
+    await message.answer(text=quota_message(quota), reply_markup=quota_kb(pubkey, True))
+
+    await state.set_state()
+
+
+@router.message(SetExpiry.waiting_for_date)
+async def check_expiry_date(message: Message, state: FSMContext, server_name: str, expiry_scheduler: ExpiryScheduler):
+    expires_at = parse_expiry(message.text or '')
+
+    if expires_at is None:
+        return await message.answer('Invalid expiry, try again, e.g. <code>7d</code> or <code>2025-01-31 18:00</code>')
+
+    if expires_at <= time.time():
+        return await message.answer('The expiry must be in the future, try again')
+
+    state_data = await state.get_data()
+    pubkey = state_data.get('pubkey')
+
+    await expiry_scheduler.schedule(server_name, pubkey, expires_at, state_data.get('expiry_action'))
+
+    expiration = expiry_scheduler.get(server_name, pubkey)
+    await message.answer(text=expiry_message(expiration), reply_markup=expiry_kb(pubkey, True))
 
     await state.set_state()
 
@@ -5,50 +5,230 @@ from os import environ
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.types import BotCommand
 from dotenv import load_dotenv
 
 from db.database import Database
-from handlers import callbacks, commands, errors, messages
-from modules.middlewares import LoggingMiddleware, AuthCheckMiddleware, ServerCreateMiddleware
+from handlers import callbacks, commands, errors, inline, messages
+from modules.alerts import AlertManager
+from modules.collector import StatsCollector
+from modules.expiry import ExpiryScheduler
+from modules.metrics import MetricsExporter
+from modules.instrumentation import log_stats_periodically
+from modules.middlewares import (
+    LoggingMiddleware,
+    AuthCheckMiddleware,
+    ServerCreateMiddleware,
+    HandlerTimingMiddleware,
+    StatusViewMiddleware,
+    TelegramTimingMiddleware,
+)
+from modules.peer_index import PeerIndex
+from modules.placement import POLICIES, ServerPlacement
+from modules.provisioning import ProvisioningPool
+from modules.quotas import QuotaEngine
+from modules.status import StatusCache
 from modules.storages import SQLiteStorage
+from modules.vault import ConfigVault
+from modules.tracing import TracingMiddleware
 from servers.servers_file_loader import load_servers_from_file
 
 load_dotenv()
 
 
-async def main():
-    admins = [int(admin_id) for admin_id in environ['ADMIN_ID'].split(',')]
-    servers = load_servers_from_file()
-
-    default = DefaultBotProperties(parse_mode='HTML')
-    bot = Bot(token=environ['TOKEN'], default=default)
-
+def create_dispatcher(
+        admins: list[int],
+        servers: dict,
+        collector: StatsCollector,
+        expiry_scheduler: ExpiryScheduler,
+        provisioning_pool: ProvisioningPool,
+        peer_index: PeerIndex,
+        status_cache: StatusCache | None = None,
+        placement: ServerPlacement | None = None,
+        vault: ConfigVault | None = None,
+        handshake_stale_after: float = 300,
+        dashboard_timeout: float = 10,
+        slow_update_threshold: float = 0,
+        slow_update_sample_rate: float = 1,
+        storage: BaseStorage | None = None,
+) -> Dispatcher:
+    """Creates the dispatcher with all middlewares and routers.
+
+    The routers are module-level objects, so the dispatcher can be created only once per process.
+
+    Args:
+        admins (list[int]): The IDs of the users allowed to use the bot.
+        servers (dict): Server configurations.
+        collector (StatsCollector): The server stats collector.
+        expiry_scheduler (ExpiryScheduler): The peer expiry scheduler.
+        provisioning_pool (ProvisioningPool): The pool of prepared peers.
+        peer_index (PeerIndex): The index of the peers of all servers.
+        status_cache (StatusCache | None): The last peer lists shown by the status view.
+            Defaults to a new ``StatusCache``.
+        placement (ServerPlacement | None): Chooses the server for clients added to any server.
+            Defaults to a new ``ServerPlacement``.
+        vault (ConfigVault | None): Stores the configurations of new clients, None disables storing them.
+        handshake_stale_after (float): Seconds since the latest handshake after which a peer is offline.
+        dashboard_timeout (float): Seconds to wait for a single server on the dashboard.
+        slow_update_threshold (float): Updates processed longer than this number of seconds are logged,
+            ``0`` disables tracing.
+        slow_update_sample_rate (float): The share of slow updates to log.
+        storage (BaseStorage | None): The FSM storage. Defaults to ``SQLiteStorage``.
+
+    Returns:
+        Dispatcher: The configured dispatcher.
+    """
     dp = Dispatcher(
-        storage=SQLiteStorage(),
+        storage=storage or SQLiteStorage(),
         admins=admins,
         servers=servers,
+        collector=collector,
+        expiry_scheduler=expiry_scheduler,
+        provisioning_pool=provisioning_pool,
+        peer_index=peer_index,
+        status_cache=status_cache or StatusCache(),
+        placement=placement or ServerPlacement(collector),
+        vault=vault,
+        handshake_stale_after=handshake_stale_after,
+        dashboard_timeout=dashboard_timeout,
     )
 
+    if slow_update_threshold:
+        # Must be the outermost middleware to see the whole processing time
+        dp.update.middleware(TracingMiddleware(threshold=slow_update_threshold, sample_rate=slow_update_sample_rate))
+
     dp.update.middleware(LoggingMiddleware())
     dp.update.middleware(AuthCheckMiddleware())
     dp.update.middleware(ServerCreateMiddleware())
+    dp.callback_query.middleware(StatusViewMiddleware())
+    dp.message.middleware(HandlerTimingMiddleware())
+    dp.callback_query.middleware(HandlerTimingMiddleware())
+    dp.inline_query.middleware(HandlerTimingMiddleware())
 
     dp.include_routers(
         commands.router,
         callbacks.router,
+        inline.router,
         messages.router,
         errors.router,
     )
 
+    return dp
+
+
+async def main():
+    admins = [int(admin_id) for admin_id in environ['ADMIN_ID'].split(',')]
+    servers = load_servers_from_file()
+
+    default = DefaultBotProperties(parse_mode='HTML')
+    bot = Bot(token=environ['TOKEN'], default=default)
+    bot.session.middleware(TelegramTimingMiddleware())
+
+    handshake_stale_after = float(environ.get('HANDSHAKE_STALE_AFTER', 300))
+
+    collector = StatsCollector(
+        servers,
+        interval=float(environ.get('MONITORING_INTERVAL', 0)),
+        timeout=float(environ.get('MONITORING_TIMEOUT', 30)),
+    )
+
+    background_tasks = []
+    alerts = None
+
+    if environ.get('ALERTS_ENABLED', 'true').lower() == 'true':
+        alerts = AlertManager(
+            bot,
+            admins,
+            collector,
+            stale_after=handshake_stale_after,
+            min_interval=float(environ.get('ALERT_MIN_INTERVAL', 60)),
+        )
+        background_tasks.append(alerts.run())
+
+    if collector.interval > 0:
+        background_tasks.append(collector.run())
+
+        if alerts is not None:
+            collector.add_listener(alerts.on_snapshot)
+
+        quotas = QuotaEngine(collector, Database(), alerts)
+        collector.add_listener(quotas.on_snapshot)
+
+    expiry_scheduler = ExpiryScheduler(collector, Database(), alerts)
+    background_tasks.append(expiry_scheduler.run())
+
+    provisioning_pool = ProvisioningPool(
+        collector,
+        size=int(environ.get('PROVISIONING_POOL_SIZE', 0)),
+        refill_interval=float(environ.get('PROVISIONING_REFILL_INTERVAL', 300)),
+    )
+    background_tasks.append(provisioning_pool.run())
+
+    placement = ServerPlacement(
+        collector,
+        policy=POLICIES[environ.get('PLACEMENT_POLICY', 'balanced')],
+        refresh_interval=float(environ.get('PLACEMENT_REFRESH_INTERVAL', 300)),
+    )
+    collector.add_listener(placement.on_snapshot)
+    background_tasks.append(placement.run())
+
+    peer_index = PeerIndex(collector, Database(), interval=float(environ.get('PEER_INDEX_INTERVAL', 300)))
+    background_tasks.append(peer_index.run())
+
+    if metrics_port := int(environ.get('METRICS_PORT', 0)):
+        exporter = MetricsExporter(
+            collector,
+            provisioning_pool=provisioning_pool,
+            host=environ.get('METRICS_HOST', '127.0.0.1'),
+            port=metrics_port,
+            peer_labels=environ.get('METRICS_PEER_LABELS', 'false').lower() == 'true',
+        )
+        background_tasks.append(exporter.run())
+
+    if stats_log_interval := float(environ.get('STATS_LOG_INTERVAL', 0)):
+        background_tasks.append(log_stats_periodically(stats_log_interval))
+
+    status_cache = StatusCache(
+        live_interval=float(environ.get('LIVE_STATUS_INTERVAL', 10)),
+        live_duration=float(environ.get('LIVE_STATUS_DURATION', 300)),
+    )
+
+    dp = create_dispatcher(
+        admins=admins,
+        servers=servers,
+        collector=collector,
+        expiry_scheduler=expiry_scheduler,
+        provisioning_pool=provisioning_pool,
+        peer_index=peer_index,
+        status_cache=status_cache,
+        placement=placement,
+        vault=ConfigVault(Database(), vault_key) if (vault_key := environ.get('VAULT_KEY')) else None,
+        handshake_stale_after=handshake_stale_after,
+        dashboard_timeout=float(environ.get('DASHBOARD_TIMEOUT', 10)),
+        slow_update_threshold=float(environ.get('SLOW_UPDATE_THRESHOLD', 0)),
+        slow_update_sample_rate=float(environ.get('SLOW_UPDATE_SAMPLE_RATE', 1)),
+    )
+
     await bot.set_my_commands([
         BotCommand(command='start', description='start'),
         BotCommand(command='servers', description='server list'),
+        BotCommand(command='dashboard', description='state of all servers'),
         BotCommand(command='settings', description='bot settings'),
+        BotCommand(command='stats', description='operation latency statistics'),
     ])
 
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+
+    tasks = [asyncio.create_task(coro) for coro in background_tasks]
+
+    try:
+        await dp.start_polling(bot)
+    finally:
+        status_cache.stop()
+
+        for task in tasks:
+            task.cancel()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,174 @@
+import asyncio
+import html
+import logging
+import time
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+
+from modules.collector import ServerSnapshot, StatsCollector
+
+
+class AlertManager:
+    """Turns snapshot changes into alerts and pushes them to the admins.
+
+    Alerts are generated only on state transitions. Alerts raised close to each other are
+    coalesced into a single message, and no more than one message is sent per ``min_interval``.
+    """
+
+    _MAX_MESSAGE_LENGTH = 4096
+
+    def __init__(
+            self,
+            bot: Bot,
+            admins: List[int],
+            collector: StatsCollector,
+            stale_after: float = 300,
+            min_interval: float = 60,
+            coalesce_window: float = 5,
+    ) -> None:
+        """Initializes the AlertManager instance.
+
+        Args:
+            bot (Bot): The bot used to send alerts.
+            admins (List[int]): Chat IDs of the admins receiving alerts.
+            collector (StatsCollector): The collector providing snapshots.
+            stale_after (float): Seconds after the latest handshake when a peer is considered offline.
+                Defaults to 300.
+            min_interval (float): Minimal number of seconds between two alert messages. Defaults to 60.
+            coalesce_window (float): Seconds to wait for more alerts before sending a message. Defaults to 5.
+        """
+        self.bot = bot
+        self.admins = admins
+        self.collector = collector
+        self.stale_after = stale_after
+        self.min_interval = min_interval
+        self.coalesce_window = coalesce_window
+
+        # Last known online state of every peer: {server_name: {pubkey: is_online}}
+        self._peer_states: Dict[str, Dict[str, bool]] = {}
+        self._pending: List[str] = []
+        self._has_pending = asyncio.Event()
+        self._last_sent = float('-inf')
+
+    async def on_snapshot(self, snapshot: ServerSnapshot, previous: Optional[ServerSnapshot]) -> None:
+        """Compares a new snapshot with the previous one and queues alerts for every change.
+
+        Args:
+            snapshot (ServerSnapshot): The new snapshot.
+            previous (Optional[ServerSnapshot]): The previous snapshot of the same server, if any.
+        """
+        name = snapshot.server_name
+        alerts = []
+
+        if previous is None:
+            if not snapshot.reachable:
+                alerts.append(f'🔴 Server <b>{name}</b> is unreachable: {html.escape(snapshot.error, quote=False)}')
+        elif previous.reachable != snapshot.reachable:
+            if snapshot.reachable:
+                alerts.append(f'🟢 Server <b>{name}</b> is reachable again')
+            else:
+                alerts.append(f'🔴 Server <b>{name}</b> is unreachable: {html.escape(snapshot.error, quote=False)}')
+        elif snapshot.reachable and previous.interface_up != snapshot.interface_up:
+            state = 'up ⬆️' if snapshot.interface_up else 'down ⬇️'
+            alerts.append(f'Interface of server <b>{name}</b> is {state}')
+
+        # The last known peer state is kept while the server is unreachable or the interface is down,
+        # so that we don't report every peer as offline in addition to the server alert
+        if snapshot.reachable and snapshot.interface_up:
+            alerts.extend(await self._diff_peers(snapshot))
+
+        self.push(alerts)
+
+    async def _diff_peers(self, snapshot: ServerSnapshot) -> List[str]:
+        now = time.time()
+        known_states = self._peer_states.get(snapshot.server_name)
+        states = {
+            pubkey: now - stats['latest_handshake'] <= self.stale_after
+            for pubkey, stats in snapshot.peers.items()
+        }
+        self._peer_states[snapshot.server_name] = states
+
+        # The first snapshot of a server only establishes the baseline
+        if known_states is None:
+            return []
+
+        changed = [
+            pubkey for pubkey, is_online in states.items()
+            if pubkey in known_states and known_states[pubkey] != is_online
+        ]
+
+        if not changed:
+            return []
+
+        names = {pubkey: stats['name'] for pubkey, stats in snapshot.peers.items() if stats.get('name')}
+
+        if len(names) < len(changed):
+            try:
+                names = await self.collector.get_peer_names(snapshot.server_name)
+            except Exception as e:
+                logging.warning(f'Unable to resolve peer names of "{snapshot.server_name}": {e}')
+
+        alerts = []
+
+        for pubkey in changed:
+            peer_name = html.escape(names.get(pubkey, pubkey), quote=False)
+
+            if states[pubkey]:
+                alerts.append(f'🟢 Peer <b>{peer_name}</b> ({snapshot.server_name}) is back online')
+            else:
+                alerts.append(f'🟠 Peer <b>{peer_name}</b> ({snapshot.server_name}) has a stale handshake')
+
+        return alerts
+
+    def push(self, alerts: List[str]) -> None:
+        """Queues alerts to be sent with the next message.
+
+        Args:
+            alerts (List[str]): The alert lines.
+        """
+        if alerts:
+            self._pending.extend(alerts)
+            self._has_pending.set()
+
+    def _build_message(self) -> str:
+        lines = []
+        length = 0
+
+        for i, line in enumerate(self._pending):
+            # Reserve some room for the "and N more" line
+            if length + len(line) + 64 > self._MAX_MESSAGE_LENGTH:
+                lines.append(f'...and {len(self._pending) - i} more')
+                break
+            lines.append(line)
+            length += len(line) + 1
+
+        self._pending.clear()
+        self._has_pending.clear()
+        return '\n'.join(lines)
+
+    async def send(self, text: str) -> None:
+        """Sends a message to all admins concurrently.
+
+        Args:
+            text (str): The message text.
+        """
+        results = await asyncio.gather(
+            *(self.bot.send_message(admin, text) for admin in self.admins),
+            return_exceptions=True,
+        )
+
+        for admin, result in zip(self.admins, results):
+            if isinstance(result, Exception):
+                logging.warning(f'Unable to send an alert to {admin}: {result}')
+
+    async def run(self) -> None:
+        """Sends the queued alerts forever, respecting the coalescing window and the rate limit."""
+        while True:
+            await self._has_pending.wait()
+
+            delay = max(self.coalesce_window, self._last_sent + self.min_interval - time.monotonic())
+            await asyncio.sleep(delay)
+
+            self._last_sent = time.monotonic()
+            await self.send(self._build_message())
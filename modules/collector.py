@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from servers.server_factory import ServerFactory
+from wireguard.wireguard import WireGuard
+
+
+@dataclass
+class ServerSnapshot:
+    """The state of a single server as seen by the last poll."""
+
+    server_name: str
+    reachable: bool
+    interface_up: bool = False
+    peers: dict = field(default_factory=dict)
+    latency: float = 0.0
+    updated_at: float = field(default_factory=time.time)
+    error: Optional[str] = None
+
+    def count_online_peers(self, stale_after: float) -> int:
+        """Counts the peers with a handshake during the last ``stale_after`` seconds."""
+        now = time.time()
+        return sum(now - stats['latest_handshake'] <= stale_after for stats in self.peers.values())
+
+
+SnapshotListener = Callable[[ServerSnapshot, Optional[ServerSnapshot]], Awaitable[None]]
+
+
+class StatsCollector:
+    """Periodically polls all servers for cheap runtime stats and keeps the last known state."""
+
+    def __init__(self, servers: dict, interval: float = 60, timeout: float = 30) -> None:
+        """Initializes the StatsCollector instance.
+
+        Args:
+            servers (dict): Server configurations as loaded from ``servers.json``.
+            interval (float): Seconds between two polls of all servers. Defaults to 60.
+            timeout (float): Seconds to wait for a single server before it's considered unreachable.
+                Defaults to 30.
+        """
+        self.servers = servers
+        self.interval = interval
+        self.timeout = timeout
+        self.snapshots: Dict[str, ServerSnapshot] = {}
+        self._listeners: List[SnapshotListener] = []
+
+    def add_listener(self, listener: SnapshotListener) -> None:
+        """Registers a coroutine function called with ``(snapshot, previous_snapshot)`` after every poll.
+
+        Args:
+            listener (SnapshotListener): The listener to register.
+        """
+        self._listeners.append(listener)
+
+    def _create_server(self, server_name: str) -> WireGuard:
+        # The factory normalizes the data in place, so the original configuration must stay untouched
+        return ServerFactory.create_server_instance(server_name, deepcopy(self.servers[server_name]))
+
+    async def get_server(self, server_name: str) -> WireGuard:
+        """Returns the server instance without blocking the event loop on the initial connection.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            WireGuard: The server instance.
+        """
+        return await asyncio.to_thread(self._create_server, server_name)
+
+    @staticmethod
+    async def _read_stats(server: WireGuard) -> tuple[bool, dict]:
+        interface_up = await asyncio.to_thread(server.get_wg_enabled)
+        return interface_up, await server.get_peers_stats_async() if interface_up else {}
+
+    async def fetch(self, server_name: str, timeout: Optional[float] = None) -> ServerSnapshot:
+        """Polls a single server. Errors are reported in the snapshot instead of being raised.
+
+        Args:
+            server_name (str): The name of the server.
+            timeout (Optional[float]): Seconds to wait for the server. Defaults to the collector timeout.
+
+        Returns:
+            ServerSnapshot: A fresh snapshot of the server.
+        """
+        started = time.monotonic()
+
+        try:
+            async with asyncio.timeout(timeout or self.timeout):
+                server = await self.get_server(server_name)
+                interface_up, peers = await self._read_stats(server)
+        except Exception as e:
+            logging.debug(f'Failed to poll server "{server_name}": {e!r}')
+            return ServerSnapshot(
+                server_name=server_name,
+                reachable=False,
+                latency=time.monotonic() - started,
+                error=str(e) or type(e).__name__,
+            )
+
+        return ServerSnapshot(
+            server_name=server_name,
+            reachable=True,
+            interface_up=interface_up,
+            peers=peers,
+            latency=time.monotonic() - started,
+        )
+
+    async def get_peer_names(self, server_name: str) -> dict:
+        """Maps peer public keys to their names using the server configuration.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            dict: A dictionary of peer names keyed by public key.
+        """
+        server = await self.get_server(server_name)
+        config = await asyncio.to_thread(server.get_config, True)
+        return {v.get('PublicKey', k): k for k, v in config.items() if k != 'Interface'}
+
+    async def collect(self) -> None:
+        """Polls all servers concurrently and notifies the listeners about every new snapshot."""
+        snapshots = await asyncio.gather(*(self.fetch(server_name) for server_name in self.servers))
+
+        for snapshot in snapshots:
+            previous = self.snapshots.get(snapshot.server_name)
+            self.snapshots[snapshot.server_name] = snapshot
+
+            for listener in self._listeners:
+                try:
+                    await listener(snapshot, previous)
+                except Exception as e:
+                    logging.exception(f'Snapshot listener failed: {e}')
+
+    async def run(self) -> None:
+        """Polls all servers forever, waiting ``interval`` seconds between the polls."""
+        while True:
+            await self.collect()
+            await asyncio.sleep(self.interval)
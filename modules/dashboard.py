@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from modules.collector import StatsCollector, ServerSnapshot
+from modules.keyboards import dashboard_kb
+from modules.messages import dashboard_message
+
+# Telegram doesn't like a message being edited more often than once per second
+_MIN_EDIT_INTERVAL = 1.0
+
+
+async def update_dashboard(
+        message: Message,
+        servers: dict,
+        collector: StatsCollector,
+        stale_after: float,
+        timeout: float,
+) -> None:
+    """Queries all servers concurrently and edits the message as the results arrive.
+
+    Args:
+        message (Message): The bot message to render the dashboard in.
+        servers (dict): Server configurations.
+        collector (StatsCollector): The collector used to query the servers.
+        stale_after (float): Seconds since the latest handshake after which a peer is offline.
+        timeout (float): Seconds to wait for a single server.
+    """
+    server_names = list(servers.keys())
+    snapshots: dict[str, ServerSnapshot] = {}
+    last_edit = 0.0
+    rendered = None
+
+    async def edit() -> None:
+        nonlocal last_edit, rendered
+        text = dashboard_message(server_names, snapshots, stale_after)
+
+        if text == rendered:
+            return
+
+        try:
+            await message.edit_text(text=text, reply_markup=dashboard_kb())
+        except TelegramBadRequest as e:
+            if 'message is not modified' not in str(e):
+                raise
+
+        last_edit = time.monotonic()
+        rendered = text
+
+    await edit()
+
+    pending = {asyncio.create_task(collector.fetch(name, timeout)) for name in server_names}
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+        # Collect whatever else arrives until the next edit is allowed
+        delay = last_edit + _MIN_EDIT_INTERVAL - time.monotonic()
+        if delay > 0 and pending:
+            more_done, pending = await asyncio.wait(pending, timeout=delay)
+            done |= more_done
+
+        for task in done:
+            snapshot = task.result()
+            snapshots[snapshot.server_name] = snapshot
+
+        await asyncio.sleep(max(0.0, last_edit + _MIN_EDIT_INTERVAL - time.monotonic()))
+        await edit()
@@ -0,0 +1,237 @@
+import asyncio
+import heapq
+import html
+import logging
+import re
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from db.database import Database
+from modules.alerts import AlertManager
+from modules.collector import StatsCollector
+
+_DURATION_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_DATE_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def parse_expiry(text: str) -> Optional[float]:
+    """Parses an expiry given as a duration from now, such as ``12h``, ``7d`` or ``1w 3d``,
+    or as a local date, such as ``2025-01-31`` or ``2025-01-31 18:00``.
+
+    Args:
+        text (str): The text to parse.
+
+    Returns:
+        Optional[float]: The UNIX timestamp of the expiry, or None if the text is not valid.
+    """
+    text = text.strip().lower()
+
+    if re.fullmatch(r'(\s*\d+\s*[mhdw])+', text):
+        units = re.findall(r'(\d+)\s*([mhdw])', text)
+        return time.time() + sum(int(amount) * _DURATION_UNITS[unit] for amount, unit in units)
+
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).timestamp()
+        except ValueError:
+            continue
+
+    return None
+
+
+class ExpiryScheduler:
+    """Disables or deletes peers when they expire.
+
+    The expirations of all servers are kept in a single heap, and the scheduler sleeps until
+    the earliest one, so no peer is polled. Peers expiring within ``batch_window`` seconds
+    of each other are handled with a single configuration change per server.
+    The expirations are stored in the database and loaded again on start.
+    """
+
+    ACTIONS = ('disable', 'delete')
+
+    def __init__(
+            self,
+            collector: StatsCollector,
+            database: Database,
+            alerts: Optional[AlertManager] = None,
+            batch_window: float = 5,
+            retry_interval: float = 60,
+    ) -> None:
+        """Initializes the ExpiryScheduler instance.
+
+        Args:
+            collector (StatsCollector): Used to get the server instances and peer names.
+            database (Database): The database storing the expirations.
+            alerts (Optional[AlertManager]): Used to notify the admins about expired peers, if given.
+            batch_window (float): Seconds after the earliest expiration within which the peers are
+                handled together. Defaults to 5.
+            retry_interval (float): Seconds to wait before retrying if a server is unreachable. Defaults to 60.
+        """
+        self.collector = collector
+        self.database = database
+        self.alerts = alerts
+        self.batch_window = batch_window
+        self.retry_interval = retry_interval
+
+        # The heap may hold outdated entries of rescheduled or cancelled expirations,
+        # they are skipped unless they match the entry in the dictionary
+        self._heap: List[Tuple[float, str, str]] = []
+        self._expirations: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._changed = asyncio.Event()
+
+    def _add(self, server_name: str, pubkey: str, expires_at: float, action: str) -> None:
+        self._expirations[server_name, pubkey] = (expires_at, action)
+        heapq.heappush(self._heap, (expires_at, server_name, pubkey))
+
+    def _is_current(self, entry: Tuple[float, str, str]) -> bool:
+        expires_at, server_name, pubkey = entry
+        expiration = self._expirations.get((server_name, pubkey))
+        return expiration is not None and expiration[0] == expires_at
+
+    def get(self, server_name: str, pubkey: str) -> Optional[Tuple[float, str]]:
+        """Returns the expiration of a peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+
+        Returns:
+            Optional[Tuple[float, str]]: An ``(expires_at, action)`` tuple if the peer expires, else None.
+        """
+        return self._expirations.get((server_name, pubkey))
+
+    async def schedule(self, server_name: str, pubkey: str, expires_at: float, action: str) -> None:
+        """Sets the expiration of a peer, replacing the previous one.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+            expires_at (float): The UNIX timestamp of the expiration.
+            action (str): ``disable`` or ``delete``.
+        """
+        if action not in self.ACTIONS:
+            raise ValueError(f'Unknown expiry action: {action}')
+
+        await asyncio.to_thread(self.database.set_expiration, server_name, pubkey, expires_at, action)
+        self._add(server_name, pubkey, expires_at, action)
+        self._changed.set()
+
+    async def cancel(self, server_name: str, pubkey: str) -> None:
+        """Removes the expiration of a peer, if any.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+        """
+        await asyncio.to_thread(self.database.delete_expirations, [(server_name, pubkey)])
+
+        if self._expirations.pop((server_name, pubkey), None) is not None:
+            self._changed.set()
+
+    async def _load(self) -> None:
+        for server_name, pubkey, expires_at, action in await asyncio.to_thread(self.database.get_expirations):
+            self._add(server_name, pubkey, expires_at, action)
+
+        logging.info(f'Loaded {len(self._expirations)} peer expiration(s)')
+
+    async def run(self) -> None:
+        """Handles the expirations forever, waking up only at the earliest one or when they change."""
+        await self._load()
+
+        while True:
+            self._changed.clear()
+
+            while self._heap and not self._is_current(self._heap[0]):
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                await self._changed.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+
+            if delay > 0:
+                try:
+                    async with asyncio.timeout(delay):
+                        await self._changed.wait()
+                except TimeoutError:
+                    pass
+                continue
+
+            await self._expire_due()
+
+    async def _expire_due(self) -> None:
+        deadline = time.time() + self.batch_window
+        batches: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+
+        while self._heap and self._heap[0][0] <= deadline:
+            entry = heapq.heappop(self._heap)
+
+            if self._is_current(entry):
+                _, server_name, pubkey = entry
+                batches[server_name, self._expirations[server_name, pubkey][1]].append(pubkey)
+
+        await asyncio.gather(*(
+            self._expire(server_name, action, pubkeys, deadline)
+            for (server_name, action), pubkeys in batches.items()
+        ))
+
+    async def _expire(self, server_name: str, action: str, pubkeys: List[str], deadline: float) -> None:
+        if server_name not in self.collector.servers:
+            logging.warning(f'Dropping {len(pubkeys)} expiration(s) of the unknown server "{server_name}"')
+            await self._forget(server_name, pubkeys, deadline)
+            return
+
+        try:
+            # The names are resolved first, since deleted peers can't be looked up afterwards
+            names = await self.collector.get_peer_names(server_name) if self.alerts else {}
+            server = await self.collector.get_server(server_name)
+
+            if action == 'delete':
+                await asyncio.to_thread(server.delete_peers, pubkeys)
+            else:
+                await asyncio.to_thread(server.set_peers_enabled, pubkeys, False)
+        except Exception as e:
+            logging.warning(f'Unable to expire peers of "{server_name}", retrying in {self.retry_interval}s: {e}')
+
+            # The database keeps the original expirations, so nothing is lost on restart
+            for pubkey in pubkeys:
+                self._add(server_name, pubkey, time.time() + self.retry_interval, action)
+
+            self._changed.set()
+            return
+
+        await self._forget(server_name, pubkeys, deadline)
+        await asyncio.to_thread(self.database.invalidate_peer_index, server_name)
+
+        if action == 'delete':
+            for pubkey in pubkeys:
+                await asyncio.to_thread(self.database.delete_quota, server_name, pubkey)
+
+            await asyncio.to_thread(self.database.delete_client_configs, server_name, pubkeys)
+
+        logging.info(f'Expired {len(pubkeys)} peer(s) of "{server_name}": {action}')
+
+        if self.alerts is not None:
+            verb = 'deleted' if action == 'delete' else 'disabled'
+            self.alerts.push([
+                f'⏳ Peer <b>{html.escape(names.get(pubkey, pubkey), quote=False)}</b> ({server_name}) '
+                f'has expired and was {verb}'
+                for pubkey in pubkeys
+            ])
+
+    async def _forget(self, server_name: str, pubkeys: List[str], deadline: float) -> None:
+        peers = []
+
+        for pubkey in pubkeys:
+            expiration = self._expirations.get((server_name, pubkey))
+
+            # The peer may have been given a new expiration in the meantime
+            if expiration is None or expiration[0] <= deadline:
+                self._expirations.pop((server_name, pubkey), None)
+                peers.append((server_name, pubkey))
+
+        await asyncio.to_thread(self.database.delete_expirations, peers)
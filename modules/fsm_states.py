@@ -7,3 +7,11 @@ class AddPeer(StatesGroup):
 
 class RenamePeer(StatesGroup):
     waiting_for_new_name = State()
+
+
+class SetQuota(StatesGroup):
+    waiting_for_limit = State()
+
+
+class SetExpiry(StatesGroup):
+    waiting_for_date = State()
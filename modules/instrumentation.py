@@ -0,0 +1,195 @@
+import asyncio
+import inspect
+import logging
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Dict, Tuple
+
+from modules.tracing import traced_call
+
+# Geometric bucket bounds from 0.1 ms to ~2 minutes, each 25% wider than the previous one
+_BUCKET_BOUNDS = tuple(0.0001 * 1.25 ** i for i in range(64))
+
+
+class Histogram:
+    """Latency histogram with fixed logarithmic buckets, cheap enough to record every call."""
+
+    __slots__ = ('counts', 'count', 'errors', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration: float, error: bool = False) -> None:
+        self.counts[bisect_left(_BUCKET_BOUNDS, duration)] += 1
+        self.count += 1
+        self.errors += error
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def percentile(self, q: float) -> float:
+        """Estimates a percentile as the upper bound of the bucket it falls into.
+
+        Args:
+            q (float): The percentile in the ``0..1`` range.
+
+        Returns:
+            float: The estimated duration in seconds, never above the observed maximum.
+        """
+        rank = q * self.count
+        seen = 0
+
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(_BUCKET_BOUNDS[i] if i < len(_BUCKET_BOUNDS) else self.max, self.max)
+
+        return self.max
+
+
+class OperationStats:
+    """Thread-safe registry of latency histograms keyed by scope (e.g. a server name) and operation."""
+
+    def __init__(self) -> None:
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = Lock()
+
+    def record(self, scope: str, operation: str, duration: float, error: bool = False) -> None:
+        """Records a single operation.
+
+        Args:
+            scope (str): The scope of the operation, e.g. a server name.
+            operation (str): The operation name.
+            duration (float): The duration in seconds.
+            error (bool): Whether the operation failed. Defaults to False.
+        """
+        with self._lock:
+            histogram = self._histograms.get((scope, operation))
+            if histogram is None:
+                histogram = self._histograms[scope, operation] = Histogram()
+            histogram.record(duration, error)
+
+    def summary(self) -> Dict[Tuple[str, str], dict]:
+        """Summarizes all histograms.
+
+        Returns:
+            Dict[Tuple[str, str], dict]: A dictionary keyed by ``(scope, operation)`` with ``count``, ``errors``,
+            ``total``, ``max``, ``p50``, ``p95`` and ``p99`` values, durations in seconds.
+        """
+        with self._lock:
+            return {
+                key: {
+                    'count': histogram.count,
+                    'errors': histogram.errors,
+                    'total': histogram.total,
+                    'max': histogram.max,
+                    'p50': histogram.percentile(0.5),
+                    'p95': histogram.percentile(0.95),
+                    'p99': histogram.percentile(0.99),
+                }
+                for key, histogram in self._histograms.items()
+            }
+
+    def timed(self, func: Callable, scope: str, operation: str | Callable[..., str]) -> Callable:
+        """Wraps a function to record its duration and failures.
+
+        Args:
+            func (Callable): The function to wrap.
+            scope (str): The scope of the operation.
+            operation (str | Callable[..., str]): The operation name, or a function building it
+                from the call arguments.
+
+        Returns:
+            Callable: The wrapped function.
+        """
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                started = perf_counter()
+                error = True
+
+                try:
+                    result = await func(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    name = operation(*args, **kwargs) if callable(operation) else operation
+                    self.record(scope, name, perf_counter() - started, error)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = perf_counter()
+            error = True
+
+            try:
+                result = func(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                name = operation(*args, **kwargs) if callable(operation) else operation
+                self.record(scope, name, perf_counter() - started, error)
+
+        return wrapper
+
+    def log_summary(self) -> None:
+        """Writes the summary of all operations to the log."""
+        for (scope, operation), values in sorted(self.summary().items()):
+            logging.info(
+                f'[stats] {scope} {operation}: count={values["count"]} errors={values["errors"]} '
+                f'p50={values["p50"] * 1000:.1f}ms p95={values["p95"] * 1000:.1f}ms '
+                f'p99={values["p99"] * 1000:.1f}ms max={values["max"] * 1000:.1f}ms'
+            )
+
+
+operation_stats = OperationStats()
+
+
+async def log_stats_periodically(interval: float) -> None:
+    """Writes the summary of all operations to the log every ``interval`` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        operation_stats.log_summary()
+
+
+def _command_operation(command: str, *_args: Any, **_kwargs: Any) -> str:
+    """Builds the operation name from a shell command without leaking its arguments, e.g. ``execute:wg show``."""
+    words = command.split(maxsplit=2)
+    name = words[0] if words else ''
+
+    if len(words) > 1 and words[1].isalpha():
+        name += f' {words[1]}'
+
+    return f'execute:{name}'
+
+
+def instrument_server(server: Any, scope: str) -> None:
+    """Records the latency of every public method of a server instance and of its client, if any.
+
+    Args:
+        server (Any): The WireGuard server instance.
+        scope (str): The scope to record the operations in, usually the server name.
+    """
+    for name in dir(type(server)):
+        if not name.startswith('_') and callable(getattr(server, name)):
+            method = operation_stats.timed(getattr(server, name), scope, name)
+            setattr(server, name, traced_call(method, f'backend:{name}'))
+
+    client = getattr(server, 'client', None)
+
+    if client is not None and not getattr(client, '_instrumented', False):
+        client.execute = operation_stats.timed(client.execute, scope, _command_operation)
+        client.get_file_contents = operation_stats.timed(client.get_file_contents, scope, 'get_file_contents')
+        client.put_file_contents = operation_stats.timed(client.put_file_contents, scope, 'put_file_contents')
+
+        if hasattr(client, 'connect'):
+            client.connect = operation_stats.timed(client.connect, scope, 'connect')
+
+        client._instrumented = True
@@ -27,6 +27,15 @@ def servers_kb(servers):
     for name in servers:
         kb.button(text=name, callback_data=f'server:{name}')
 
+    kb.button(text='Add client anywhere 🎯', callback_data='add_peer_anywhere')
+    kb.button(text='Dashboard 📊', callback_data='dashboard')
+    return kb.adjust(1).as_markup()
+
+
+def dashboard_kb():
+    kb = InlineKeyboardBuilder()
+    kb.button(text='Refresh 🔄', callback_data='dashboard')
+    kb.button(text='⬅ Go to server list', callback_data='servers')
     return kb.adjust(1).as_markup()
 
 
@@ -44,32 +53,62 @@ def wg_options_kb(interface_is_up):
     return kb.adjust(1, 2).as_markup()
 
 
-def peer_list_kb():
+def peer_list_kb(live=False):
     kb = InlineKeyboardBuilder()
-    kb.button(text='Refresh 🔄', callback_data='get_peers')
+    if live:
+        kb.button(text='Stop live ⏹', callback_data='get_peers')
+    else:
+        kb.button(text='Refresh 🔄', callback_data='get_peers')
+        kb.button(text='Live ▶️', callback_data='live_status')
     kb.button(text='⬅ Back', callback_data='server:')
-    return kb.adjust(1).as_markup()
+    return kb.adjust(2, 1).as_markup()
 
 
 def peers_kb(peers):
     kb = InlineKeyboardBuilder()
-    kb.button(text='Add 🆕', callback_data='add_peer')
-    for name, pubkey in peers.items():
-        kb.button(text=f'{name}', callback_data=f'peer:{pubkey}')
+    # The builder copies the whole markup on every call, so all buttons are added at once
+    kb.add(
+        InlineKeyboardButton(text='Add 🆕', callback_data='add_peer'),
+        *(InlineKeyboardButton(text=f'{name}', callback_data=f'peer:{pubkey}') for name, pubkey in peers.items()),
+    )
     kb.adjust(1, 2)
     kb.row(InlineKeyboardButton(text='⬅ Back', callback_data='server:'), width=1)
     return kb.as_markup()
 
 
-def peer_action_kb(pubkey, peer_is_enabled):
+def peer_action_kb(pubkey, peer_is_enabled, has_config=False):
     kb = InlineKeyboardBuilder()
     kb.button(text='Rename ✏️', callback_data=f'selected_peer:name:{pubkey}')
     if peer_is_enabled:
         kb.button(text='Disable 📵', callback_data=f'selected_peer:off:{pubkey}')
     else:
         kb.button(text='Enable ✅', callback_data=f'selected_peer:on:{pubkey}')
+    kb.button(text='Quota 📊', callback_data=f'quota:{pubkey}')
+    kb.button(text='Expiry ⏳', callback_data=f'expiry:{pubkey}')
+    if has_config:
+        kb.button(text='Resend config/QR 📨', callback_data=f'resend_config:{pubkey}')
     kb.button(text='Delete 🗑', callback_data=f'selected_peer:del:{pubkey}')
     kb.button(text='⬅ Back', callback_data='config_peers')
+    return kb.adjust(2, 2, 1).as_markup()
+
+
+def quota_kb(pubkey, has_quota):
+    kb = InlineKeyboardBuilder()
+    kb.button(text='Set limit ✏️', callback_data=f'quota_set:{pubkey}')
+    if has_quota:
+        kb.button(text='Reset usage 🔄', callback_data=f'quota_reset:{pubkey}')
+        kb.button(text='Remove quota 🗑', callback_data=f'quota_del:{pubkey}')
+    kb.button(text='⬅ Back', callback_data=f'peer:{pubkey}')
+    return kb.adjust(1, 2, 1).as_markup()
+
+
+def expiry_kb(pubkey, has_expiry):
+    kb = InlineKeyboardBuilder()
+    kb.button(text='Disable on date 📵', callback_data=f'expiry_set:disable:{pubkey}')
+    kb.button(text='Delete on date 🗑', callback_data=f'expiry_set:delete:{pubkey}')
+    if has_expiry:
+        kb.button(text='Remove expiry ❌', callback_data=f'expiry_del:{pubkey}')
+    kb.button(text='⬅ Back', callback_data=f'peer:{pubkey}')
     return kb.adjust(2, 1).as_markup()
 
 
@@ -1,3 +1,19 @@
+import html
+from datetime import datetime
+from io import BytesIO
+
+import qrcode
+from humanize import naturaldelta, naturalsize, naturaltime
+from qrcode.image.pure import PyPNGImage
+
+
+def client_config_qr(client_config: str) -> bytes:
+    """Renders a client configuration as a PNG QR code."""
+    img_buf = BytesIO()
+    qrcode.make(client_config, image_factory=PyPNGImage).save(img_buf)
+    return img_buf.getvalue()
+
+
 def peers_message(peers):
     if not peers:
         return 'Interface is inactive'
@@ -18,3 +34,98 @@ def peers_message(peers):
         except KeyError:
             message += 'unconnected\n\n'
     return message
+
+
+def status_message(snapshot, refreshing=False, live_until=None):
+    # A live message mustn't change with the age alone, otherwise it would be edited on every refresh
+    if live_until is not None:
+        updated = f'🔴 Live until {datetime.fromtimestamp(live_until):%H:%M:%S}'
+    else:
+        updated = f'Updated {naturaltime(snapshot.age)}'
+    if refreshing:
+        updated += ', refreshing...'
+    return f'{peers_message(snapshot.peers).rstrip()}\n\n<i>{updated}</i>'
+
+
+def server_menu_message(server_name, health):
+    message = f'Server <b>{server_name}</b>'
+    if health is None:
+        return message
+    memory = f'{naturalsize(health["memory_used"], True)} of {naturalsize(health["memory_total"], True)}'
+    message += f'\n\n<b>CPU load:</b> {health["cpu_load"]:.0f}%' \
+               f'\n<b>Memory:</b> {memory}' \
+               f'\n<b>Uptime:</b> {naturaldelta(health["uptime"])}'
+    if health['rx_rate'] is not None:
+        rates = f'{naturalsize(health["rx_rate"], True)}/s ⬇️ {naturalsize(health["tx_rate"], True)}/s ⬆️'
+        message += f'\n<b>Interface traffic:</b> {rates}'
+    return message
+
+
+def quota_message(quota):
+    if quota is None:
+        return 'No traffic quota is set for this client'
+    limit_bytes, used_bytes, exceeded = quota
+    message = f'<b>Traffic quota:</b> {naturalsize(used_bytes, True)} of {naturalsize(limit_bytes, True)} used'
+    if exceeded:
+        message += '\nThe quota is exceeded, the client has been disabled 📵'
+    return message
+
+
+def expiry_message(expiration):
+    if expiration is None:
+        return 'No expiry is set for this client'
+    expires_at, action = expiration
+    date = datetime.fromtimestamp(expires_at)
+    verb = 'deleted' if action == 'delete' else 'disabled'
+    return f'<b>Expires:</b> {date:%Y-%m-%d %H:%M} ({naturaltime(date)}), the client will be {verb}'
+
+
+def dashboard_message(server_names, snapshots, stale_after):
+    width = max([len(name) for name in server_names] + [6])
+    rows = [f'{"Server":<{width}}  {"WG":<4}  {"Online":>9}  {"Traffic":>10}  {"Latency":>8}']
+
+    for name in server_names:
+        snapshot = snapshots.get(name)
+        if snapshot is None:
+            rows.append(f'{name:<{width}}  ...')
+        elif not snapshot.reachable:
+            rows.append(f'{name:<{width}}  unreachable')
+        else:
+            online = f'{snapshot.count_online_peers(stale_after)}/{len(snapshot.peers)}'
+            traffic = naturalsize(sum(stats['rx'] + stats['tx'] for stats in snapshot.peers.values()), True)
+            latency = f'{snapshot.latency * 1000:.0f} ms'
+            state = 'up' if snapshot.interface_up else 'down'
+            rows.append(f'{name:<{width}}  {state:<4}  {online:>9}  {traffic:>10}  {latency:>8}')
+
+    table = html.escape('\n'.join(rows))
+    pending = len(server_names) - len(snapshots)
+    footer = f'\nWaiting for {pending} server(s)...' if pending else ''
+    return f'<b>Dashboard</b>\n<pre>{table}</pre>{footer}'
+
+
+def stats_message(summary, max_length=4000):
+    if not summary:
+        return 'No operations recorded yet'
+
+    header = f'{"Operation":<28} {"n":>6} {"err":>4} {"p50":>7} {"p95":>7} {"p99":>7}'
+    sections = {}
+
+    for (scope, operation), values in summary.items():
+        sections.setdefault(scope, []).append((operation, values))
+
+    lines = []
+    for scope in sorted(sections):
+        lines.append(f'\n[{scope}]')
+        # The operations taking the most time in total come first
+        for operation, values in sorted(sections[scope], key=lambda item: -item[1]['total']):
+            p50, p95, p99 = (f'{values[key] * 1000:.0f}ms' for key in ('p50', 'p95', 'p99'))
+            lines.append(f'{operation[:28]:<28} {values["count"]:>6} {values["errors"]:>4} {p50:>7} {p95:>7} {p99:>7}')
+
+    text = header
+    for line in lines:
+        if len(text) + len(line) > max_length:
+            text += '\n...'
+            break
+        text += '\n' + line
+
+    return f'<pre>{html.escape(text)}</pre>'
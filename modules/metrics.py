@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from modules.collector import StatsCollector
+from modules.instrumentation import operation_stats
+from modules.provisioning import ProvisioningPool
+from servers.server_factory import ServerFactory
+
+Labels = Dict[str, str]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Accumulates samples and renders them in the Prometheus text exposition format."""
+
+    def __init__(self) -> None:
+        self._families: Dict[str, Tuple[str, str, List[Tuple[str, Labels, float]]]] = {}
+
+    def add(
+            self,
+            name: str,
+            metric_type: str,
+            help_text: str,
+            value: float,
+            labels: Labels,
+            suffix: str = '',
+    ) -> None:
+        """Adds a sample to a metric family.
+
+        Args:
+            name (str): The metric family name.
+            metric_type (str): The metric type, ``gauge``, ``counter`` or ``summary``.
+            help_text (str): The metric description.
+            value (float): The sample value.
+            labels (Labels): The sample labels.
+            suffix (str): The sample name suffix, such as ``_sum`` or ``_count`` for summaries.
+        """
+        family = self._families.setdefault(name, (metric_type, help_text, []))
+        family[2].append((name + suffix, labels, value))
+
+    def render(self) -> str:
+        """Renders all metric families.
+
+        Returns:
+            str: The metrics in the text exposition format.
+        """
+        lines = []
+
+        for name, (metric_type, help_text, samples) in self._families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+            for sample_name, labels, value in samples:
+                label_str = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f'{sample_name}{{{label_str}}} {value}' if label_str else f'{sample_name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Serves server and peer metrics over HTTP for Prometheus.
+
+    Metrics are rendered from the snapshots kept by the collector, so a scrape
+    never reaches out to the servers.
+    """
+
+    _CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(
+            self,
+            collector: StatsCollector,
+            provisioning_pool: Optional[ProvisioningPool] = None,
+            host: str = '127.0.0.1',
+            port: int = 9586,
+            peer_labels: bool = False,
+    ) -> None:
+        """Initializes the MetricsExporter instance.
+
+        Args:
+            collector (StatsCollector): The collector providing snapshots.
+            provisioning_pool (Optional[ProvisioningPool]): The pool of prepared peers, if its usage is exported.
+            host (str): The address to listen on. Defaults to ``127.0.0.1``.
+            port (int): The port to listen on. Defaults to 9586.
+            peer_labels (bool): Export per-peer metrics labelled by public key. Defaults to False,
+                in which case the peer traffic is exported only per server.
+        """
+        self.collector = collector
+        self.provisioning_pool = provisioning_pool
+        self.host = host
+        self.port = port
+        self.peer_labels = peer_labels
+
+    def collect(self) -> MetricsRegistry:
+        """Builds the metrics from the current snapshots.
+
+        Returns:
+            MetricsRegistry: The registry with all samples.
+        """
+        registry = MetricsRegistry()
+
+        for server_name, snapshot in self.collector.snapshots.items():
+            server_labels = {'server': server_name}
+
+            registry.add('wg_assistant_server_up', 'gauge', 'Whether the server responded to the last poll',
+                         int(snapshot.reachable), server_labels)
+            registry.add('wg_assistant_interface_up', 'gauge', 'Whether the WireGuard interface is up',
+                         int(snapshot.interface_up), server_labels)
+            registry.add('wg_assistant_peers', 'gauge', 'Number of active peers',
+                         len(snapshot.peers), server_labels)
+            registry.add('wg_assistant_poll_duration_seconds', 'gauge', 'Duration of the last server poll',
+                         round(snapshot.latency, 6), server_labels)
+            registry.add('wg_assistant_poll_timestamp_seconds', 'gauge', 'Time of the last server poll',
+                         round(snapshot.updated_at, 3), server_labels)
+
+            if not self.peer_labels:
+                registry.add('wg_assistant_receive_bytes', 'gauge', 'Bytes received from all peers',
+                             sum(stats['rx'] for stats in snapshot.peers.values()), server_labels)
+                registry.add('wg_assistant_transmit_bytes', 'gauge', 'Bytes sent to all peers',
+                             sum(stats['tx'] for stats in snapshot.peers.values()), server_labels)
+                continue
+
+            for pubkey, stats in snapshot.peers.items():
+                labels = {'server': server_name, 'public_key': pubkey, 'allowed_ips': stats['allowed_ips']}
+
+                if stats.get('name'):
+                    labels['name'] = stats['name']
+
+                registry.add('wg_assistant_peer_receive_bytes_total', 'counter', 'Bytes received from the peer',
+                             stats['rx'], labels)
+                registry.add('wg_assistant_peer_transmit_bytes_total', 'counter', 'Bytes sent to the peer',
+                             stats['tx'], labels)
+                registry.add('wg_assistant_peer_latest_handshake_seconds', 'gauge',
+                             'UNIX timestamp of the latest handshake with the peer',
+                             stats['latest_handshake'], labels)
+
+        if self.provisioning_pool is not None and self.provisioning_pool.size > 0:
+            pool = self.provisioning_pool
+
+            for server_name in self.collector.servers:
+                server_labels = {'server': server_name}
+
+                registry.add('wg_assistant_provisioning_pool_peers', 'gauge', 'Number of prepared peers',
+                             pool.available(server_name), server_labels)
+                registry.add('wg_assistant_provisioning_hits_total', 'counter',
+                             'Peers added with prepared keys and address', pool.hits[server_name], server_labels)
+                registry.add('wg_assistant_provisioning_misses_total', 'counter',
+                             'Peers added while no prepared peer was available', pool.misses[server_name],
+                             server_labels)
+
+        for server_name in self.collector.servers:
+            pool = getattr(ServerFactory.get_created_server(server_name), 'pool', None)
+
+            if pool is None:
+                continue
+
+            stats = pool.stats()
+            server_labels = {'server': server_name}
+
+            registry.add('wg_assistant_routeros_connections', 'gauge', 'Number of open RouterOS API connections',
+                         stats['idle'] + stats['in_use'], server_labels)
+            registry.add('wg_assistant_routeros_connections_in_use', 'gauge',
+                         'Number of RouterOS API connections serving a request', stats['in_use'], server_labels)
+
+            for key, help_text in (
+                    ('created', 'RouterOS API connections opened'),
+                    ('reused', 'Requests served by an already open RouterOS API connection'),
+                    ('discarded', 'RouterOS API connections closed after an error or being idle'),
+                    ('failed', 'Failed attempts to open a RouterOS API connection'),
+                    ('waits', 'Requests that waited for a RouterOS API connection'),
+            ):
+                registry.add(f'wg_assistant_routeros_connections_{key}_total', 'counter', help_text,
+                             stats[key], server_labels)
+
+        for (scope, operation), values in operation_stats.summary().items():
+            labels = {'scope': scope, 'operation': operation}
+            name = 'wg_assistant_operation_duration_seconds'
+            help_text = 'Duration of backend, handler and Telegram operations'
+
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+                registry.add(name, 'summary', help_text, round(values[key], 6), labels | {'quantile': quantile})
+
+            registry.add(name, 'summary', help_text, round(values['total'], 6), labels, suffix='_sum')
+            registry.add(name, 'summary', help_text, values['count'], labels, suffix='_count')
+            registry.add('wg_assistant_operation_errors_total', 'counter', 'Number of failed operations',
+                         values['errors'], labels)
+
+        return registry
+
+    async def handle_metrics(self, _request: web.Request) -> web.Response:
+        return web.Response(text=self.collect().render(), headers={'Content-Type': self._CONTENT_TYPE})
+
+    async def run(self) -> None:
+        """Serves the ``/metrics`` endpoint until cancelled."""
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+            logging.info(f'Metrics are served on http://{self.host}:{self.port}/metrics')
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
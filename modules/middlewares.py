@@ -1,26 +1,33 @@
 import logging
+from time import perf_counter
 from typing import Callable, Dict, Awaitable, Any
 
-from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType, Response
+from aiogram.types import CallbackQuery, TelegramObject
 
+from modules.instrumentation import operation_stats
+from modules.tracing import TracedMiddleware, add_span
 from servers.server_factory import ServerFactory
 
 
-class LoggingMiddleware(BaseMiddleware):
-    async def __call__(
+class LoggingMiddleware(TracedMiddleware):
+    async def process(
             self,
             handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
             event: TelegramObject,
             data: Dict[str, Any],
     ) -> Any:
-        event_dict = event.model_dump(exclude_none=True)
-        logging.debug(f'Incoming update: {event_dict}')
+        # Serializing an update is expensive, so it's done only if the message will be logged
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug('Incoming update: %s', event.model_dump(exclude_none=True))
         return await handler(event, data)
 
 
-class AuthCheckMiddleware(BaseMiddleware):
-    async def __call__(
+class AuthCheckMiddleware(TracedMiddleware):
+    async def process(
             self,
             handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
             event: TelegramObject,
@@ -30,6 +37,9 @@ class AuthCheckMiddleware(BaseMiddleware):
         admins = data.get('admins')
 
         if user_id not in admins:
+            if event.inline_query is not None:
+                return await event.inline_query.answer([], cache_time=0, is_personal=True)
+
             if event.message is None:
                 return await event.callback_query.answer('You have been blocked 🛑', show_alert=True)
 
@@ -38,14 +48,17 @@ class AuthCheckMiddleware(BaseMiddleware):
         return await handler(event, data)
 
 
-class ServerCreateMiddleware(BaseMiddleware):
-    async def __call__(
+class ServerCreateMiddleware(TracedMiddleware):
+    async def process(
             self,
             handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
             event: TelegramObject,
             data: Dict[str, Any],
     ) -> Any:
-        if event.message is not None and event.message.text.startswith('/'):
+        # Commands and inline queries don't work with the selected server
+        if event.inline_query is not None or (
+                event.message is not None and (event.message.text or '').startswith('/')
+        ):
             return await handler(event, data)
 
         state = data['state']
@@ -72,3 +85,58 @@ class ServerCreateMiddleware(BaseMiddleware):
             data.update(server_name=server_name, server=server)
 
         return await handler(event, data)
+
+
+class StatusViewMiddleware(BaseMiddleware):
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: CallbackQuery,
+            data: Dict[str, Any],
+    ) -> Any:
+        # Any button pressed under a status view leaves it, so a pending refresh mustn't edit the message
+        if event.message is not None:
+            data['status_cache'].close_view(event.message.chat.id, event.message.message_id)
+        return await handler(event, data)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        operation = handler_object.callback.__name__ if handler_object else 'unknown'
+        started = perf_counter()
+        error = True
+
+        try:
+            result = await handler(event, data)
+            error = False
+            return result
+        finally:
+            duration = perf_counter() - started
+            operation_stats.record('handlers', operation, duration, error)
+            add_span(f'handler:{operation}', duration)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        started = perf_counter()
+        error = True
+
+        try:
+            response = await make_request(bot, method)
+            error = False
+            return response
+        finally:
+            duration = perf_counter() - started
+            operation_stats.record('telegram', method.__api_method__, duration, error)
+            add_span(f'telegram:{method.__api_method__}', duration)
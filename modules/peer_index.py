@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from db.database import Database
+from modules.collector import StatsCollector
+
+
+class PeerIndex:
+    """Keeps the names, addresses and states of the peers of all servers in the database,
+    so the management menus don't have to download and parse the server configurations.
+
+    A server is synchronized incrementally: Linux hosts are only read again when the checksum
+    of the configuration file changes, and only the changed peers are written to the index.
+    Changes made by the bot are applied to the index right away, changes made elsewhere
+    are picked up every ``interval`` seconds.
+    """
+
+    def __init__(self, collector: StatsCollector, database: Database, interval: float = 300) -> None:
+        """Initializes the PeerIndex instance.
+
+        Args:
+            collector (StatsCollector): Used to get the server instances.
+            database (Database): The database storing the index.
+            interval (float): Seconds between two synchronizations of all servers, ``0`` disables
+                them, in which case the servers are synchronized only when the index is outdated.
+                Defaults to 300.
+        """
+        self.collector = collector
+        self.database = database
+        self.interval = interval
+
+        # Concurrent requests for the same server share a single synchronization
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def sync(self, server_name: str, force: bool = False) -> None:
+        """Synchronizes the index with a server.
+
+        Args:
+            server_name (str): The name of the server.
+            force (bool): Read the peers even if the configuration version hasn't changed. Defaults to False.
+        """
+        lock = self._locks[server_name]
+        waited = lock.locked()
+
+        async with lock:
+            # Another request has just done the same
+            if waited and not force and await asyncio.to_thread(self.database.get_peer_sync, server_name):
+                return
+
+            server = await self.collector.get_server(server_name)
+            version = await asyncio.to_thread(server.get_config_version)
+            last_sync = await asyncio.to_thread(self.database.get_peer_sync, server_name)
+
+            if not force and version is not None and last_sync is not None and last_sync[0] == version:
+                await asyncio.to_thread(self.database.update_peer_index, server_name, [], [], version, time.time())
+                return
+
+            metadata = await asyncio.to_thread(server.get_peers_metadata)
+
+            if metadata is None:
+                raise ConnectionError(f'Unable to read the peers of "{server_name}"')
+
+            indexed = {
+                pubkey: (pubkey, name, address, enabled, remote_id)
+                for pubkey, name, address, enabled, remote_id
+                in await asyncio.to_thread(self.database.get_indexed_peers, server_name)
+            }
+
+            changed = []
+
+            for pubkey, peer in metadata.items():
+                row = (pubkey, peer['name'], peer['address'], int(peer['enabled']), peer['id'])
+
+                if indexed.get(pubkey) != row:
+                    changed.append(row)
+
+            deleted = [pubkey for pubkey in indexed if pubkey not in metadata]
+
+            await asyncio.to_thread(
+                self.database.update_peer_index, server_name, changed, deleted, version, time.time(),
+            )
+
+            if changed or deleted:
+                logging.debug(f'Peer index of "{server_name}": {len(changed)} changed, {len(deleted)} deleted')
+
+    async def _ensure_synced(self, server_name: str) -> None:
+        if await asyncio.to_thread(self.database.get_peer_sync, server_name) is None:
+            await self.sync(server_name)
+
+    async def get_peers(self, server_name: str) -> List[Tuple]:
+        """Returns the indexed peers of a server, synchronizing the index first if it's outdated.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            List[Tuple]: A list of ``(pubkey, name, address, enabled, remote_id)`` tuples.
+        """
+        await self._ensure_synced(server_name)
+        return await asyncio.to_thread(self.database.get_indexed_peers, server_name)
+
+    async def get_peer(self, server_name: str, pubkey: str) -> Optional[Tuple]:
+        """Returns an indexed peer, synchronizing the index first if it's outdated or misses the peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+
+        Returns:
+            Optional[Tuple]: A ``(name, address, enabled, remote_id)`` tuple if the peer exists, else None.
+        """
+        await self._ensure_synced(server_name)
+        peer = await asyncio.to_thread(self.database.get_indexed_peer, server_name, pubkey)
+
+        if peer is None:
+            await self.sync(server_name)
+            peer = await asyncio.to_thread(self.database.get_indexed_peer, server_name, pubkey)
+
+        return peer
+
+    async def get_names(self, server_name: str) -> Dict[str, str]:
+        """Maps the peer public keys of a server to their names.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            Dict[str, str]: A dictionary of peer names keyed by public key.
+        """
+        return {pubkey: name for pubkey, name, *_ in await self.get_peers(server_name)}
+
+    async def find(self, name: Optional[str] = None, address: Optional[str] = None) -> List[Tuple]:
+        """Finds peers of all servers by their exact name or address, without contacting the servers.
+
+        Args:
+            name (Optional[str]): The name of the peer.
+            address (Optional[str]): The address of the peer, e.g. ``10.0.0.2/32``.
+
+        Returns:
+            List[Tuple]: A list of ``(server_name, pubkey, name, address, enabled)`` tuples.
+        """
+        return await asyncio.to_thread(self.database.find_indexed_peers, name, address)
+
+    async def search(self, text: str, limit: int = 50) -> List[Tuple]:
+        """Searches the peers of all servers by a part of the name, address or public key,
+        without contacting the servers.
+
+        Args:
+            text (str): The text to search for.
+            limit (int): The maximum number of peers to return. Defaults to 50.
+
+        Returns:
+            List[Tuple]: A list of ``(id, server_name, pubkey, name, address, enabled)`` tuples.
+        """
+        return await asyncio.to_thread(self.database.search_indexed_peers, text, limit)
+
+    async def get_by_id(self, peer_id: int) -> Optional[Tuple]:
+        """Returns a peer found by ``search``.
+
+        Args:
+            peer_id (int): The ID of the peer.
+
+        Returns:
+            Optional[Tuple]: A ``(server_name, pubkey, name, address, enabled)`` tuple if the peer is indexed, else None.
+        """
+        return await asyncio.to_thread(self.database.get_indexed_peer_by_id, peer_id)
+
+    async def invalidate(self, server_name: str) -> None:
+        """Marks the index of a server as outdated, e.g. after a peer was added.
+
+        Args:
+            server_name (str): The name of the server.
+        """
+        await asyncio.to_thread(self.database.invalidate_peer_index, server_name)
+
+    async def update_peer(self, server_name: str, pubkey: str, **fields) -> None:
+        """Applies a change made by the bot to an indexed peer.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the peer.
+            **fields: The new ``name``, ``address`` or ``enabled`` values.
+        """
+        await asyncio.to_thread(self.database.update_indexed_peer, server_name, pubkey, **fields)
+
+    async def delete_peers(self, server_name: str, pubkeys: List[str]) -> None:
+        """Removes peers deleted by the bot from the index.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkeys (List[str]): The public keys of the peers.
+        """
+        await asyncio.to_thread(self.database.delete_indexed_peers, server_name, pubkeys)
+
+    async def run(self) -> None:
+        """Synchronizes all servers every ``interval`` seconds until cancelled."""
+        if self.interval <= 0:
+            return
+
+        while True:
+            results = await asyncio.gather(
+                *(self.sync(server_name) for server_name in self.collector.servers),
+                return_exceptions=True,
+            )
+
+            for server_name, result in zip(self.collector.servers, results):
+                if isinstance(result, Exception):
+                    logging.warning(f'Unable to synchronize the peer index of "{server_name}": {result}')
+
+            await asyncio.sleep(self.interval)
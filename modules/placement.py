@@ -0,0 +1,250 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules.collector import ServerSnapshot, StatsCollector
+from wireguard.wireguard import WireGuard
+
+
+@dataclass
+class ServerLoad:
+    """What is known about the load of a server without requesting it. Unknown values are None."""
+
+    server_name: str
+    reachable: Optional[bool] = None
+    interface_up: Optional[bool] = None
+    peers: Optional[int] = None
+    free_ips: Optional[int] = None
+    # Bytes per second received and sent by all peers between the last two polls
+    traffic_rate: Optional[float] = None
+    # Percent of all CPUs
+    cpu_load: Optional[float] = None
+
+
+# Returns the score of a server, the higher the better, or None if the server can't take a new peer
+ScoringPolicy = Callable[[ServerLoad], Optional[float]]
+
+
+def _is_available(load: ServerLoad) -> bool:
+    return load.reachable is not False and load.interface_up is not False and load.free_ips != 0
+
+
+def balanced_policy(load: ServerLoad) -> Optional[float]:
+    """Prefers the servers with the lowest share of used addresses, traffic and CPU load, equally weighted.
+
+    The traffic is relative to 100 Mbit/s. Unknown values count as half of the maximum.
+    """
+    if not _is_available(load):
+        return None
+
+    if load.peers is not None and load.free_ips is not None:
+        address_usage = load.peers / (load.peers + load.free_ips)
+    else:
+        address_usage = 0.5
+
+    traffic = min(load.traffic_rate / 12.5e6, 1.0) if load.traffic_rate is not None else 0.5
+    cpu = min(load.cpu_load / 100, 1.0) if load.cpu_load is not None else 0.5
+
+    return -(address_usage + traffic + cpu)
+
+
+def fewest_peers_policy(load: ServerLoad) -> Optional[float]:
+    """Prefers the servers with the fewest peers."""
+    if not _is_available(load):
+        return None
+
+    return -load.peers if load.peers is not None else float('-inf')
+
+
+def most_free_ips_policy(load: ServerLoad) -> Optional[float]:
+    """Prefers the servers with the most free addresses."""
+    if not _is_available(load):
+        return None
+
+    return load.free_ips if load.free_ips is not None else float('-inf')
+
+
+POLICIES: Dict[str, ScoringPolicy] = {
+    'balanced': balanced_policy,
+    'fewest_peers': fewest_peers_policy,
+    'most_free_ips': most_free_ips_policy,
+}
+
+
+class ServerPlacement:
+    """Chooses the server for a new peer from the last known load of all servers.
+
+    The peer count, the free addresses and the CPU load of every server are read in the background
+    every ``refresh_interval`` seconds, the traffic is taken from the collector snapshots,
+    so choosing a server never requests one. Until a server has been read, its unknown values
+    are left to the scoring policy.
+    """
+
+    def __init__(
+            self,
+            collector: StatsCollector,
+            policy: ScoringPolicy = balanced_policy,
+            refresh_interval: float = 300,
+            timeout: float = 30,
+    ) -> None:
+        """Initializes the ServerPlacement instance.
+
+        Args:
+            collector (StatsCollector): The collector providing snapshots and server instances.
+            policy (ScoringPolicy): Scores the servers. Defaults to ``balanced_policy``.
+            refresh_interval (float): Seconds between two reads of all servers. Defaults to 300.
+            timeout (float): Seconds to wait for a single server. Defaults to 30.
+        """
+        self.collector = collector
+        self.policy = policy
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+
+        self._reachable: Dict[str, bool] = {}
+        self._peers: Dict[str, int] = {}
+        self._free_ips: Dict[str, int] = {}
+        self._cpu_loads: Dict[str, float] = {}
+        self._traffic_rates: Dict[str, float] = {}
+        # Peers added since the last read of the server
+        self._added: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def _traffic_rate(snapshot: ServerSnapshot, previous: Optional[ServerSnapshot]) -> Optional[float]:
+        if previous is None or not previous.reachable or snapshot.updated_at <= previous.updated_at:
+            return None
+
+        transferred = 0
+
+        for pubkey, stats in snapshot.peers.items():
+            last = previous.peers.get(pubkey)
+
+            # The counters of a new peer, or of a reset one, are all new traffic
+            if last is None or stats['rx'] < last['rx'] or stats['tx'] < last['tx']:
+                transferred += stats['rx'] + stats['tx']
+            else:
+                transferred += stats['rx'] - last['rx'] + stats['tx'] - last['tx']
+
+        return transferred / (snapshot.updated_at - previous.updated_at)
+
+    async def on_snapshot(self, snapshot: ServerSnapshot, previous: Optional[ServerSnapshot]) -> None:
+        """Updates the traffic rate of a server.
+
+        Args:
+            snapshot (ServerSnapshot): The new snapshot.
+            previous (Optional[ServerSnapshot]): The previous snapshot of the server.
+        """
+        if not snapshot.reachable:
+            self._traffic_rates.pop(snapshot.server_name, None)
+        elif (rate := self._traffic_rate(snapshot, previous)) is not None:
+            self._traffic_rates[snapshot.server_name] = rate
+
+    @staticmethod
+    def _read(server: WireGuard) -> Tuple[int, int, Optional[float]]:
+        config = server.get_config(as_dict=True)
+
+        try:
+            health = server.get_host_health()
+        except Exception as e:
+            # The addresses are still worth knowing
+            logging.debug(f'Unable to get the host health: {e!r}')
+            health = None
+
+        peers = sum(key != 'Interface' for key in config)
+        # The addresses reserved by the provisioning pool can't be given to another peer
+        free_ips = server.count_available_ips(config, server.reserved_ips)
+        return peers, free_ips, health['cpu_load'] if health is not None else None
+
+    async def refresh(self, server_name: str) -> None:
+        """Reads the peer count, the free addresses and the CPU load of a server.
+
+        Args:
+            server_name (str): The name of the server.
+        """
+        try:
+            async with asyncio.timeout(self.timeout):
+                server = await self.collector.get_server(server_name)
+                peers, free_ips, cpu_load = await asyncio.to_thread(self._read, server)
+        except Exception as e:
+            logging.debug(f'Unable to read the load of "{server_name}": {e!r}')
+            self._reachable[server_name] = False
+            return
+
+        self._reachable[server_name] = True
+        self._peers[server_name] = peers
+        self._free_ips[server_name] = free_ips
+        self._added.pop(server_name, None)
+
+        if cpu_load is not None:
+            self._cpu_loads[server_name] = cpu_load
+        else:
+            self._cpu_loads.pop(server_name, None)
+
+    def note_added(self, server_name: str) -> None:
+        """Accounts a peer added to a server until the next read of the server.
+
+        Args:
+            server_name (str): The name of the server.
+        """
+        self._added[server_name] += 1
+
+    def get_load(self, server_name: str) -> ServerLoad:
+        """Returns the last known load of a server.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            ServerLoad: The load of the server.
+        """
+        added = self._added.get(server_name, 0)
+        load = ServerLoad(
+            server_name=server_name,
+            reachable=self._reachable.get(server_name),
+            traffic_rate=self._traffic_rates.get(server_name),
+            cpu_load=self._cpu_loads.get(server_name),
+        )
+
+        if server_name in self._peers:
+            load.peers = self._peers[server_name] + added
+            load.free_ips = max(self._free_ips[server_name] - added, 0)
+
+        # The monitoring polls more often than the servers are read here
+        if (snapshot := self.collector.snapshots.get(server_name)) is not None:
+            load.reachable = snapshot.reachable
+            load.interface_up = snapshot.interface_up if snapshot.reachable else None
+
+        return load
+
+    def rank(self) -> List[Tuple[str, float]]:
+        """Ranks the servers able to take a new peer.
+
+        Returns:
+            List[Tuple[str, float]]: Pairs of a server name and its score, the best server first.
+        """
+        scores = []
+
+        for server_name in self.collector.servers:
+            score = self.policy(self.get_load(server_name))
+
+            if score is not None:
+                scores.append((server_name, score))
+
+        # The order of the servers file breaks ties
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+    def choose(self) -> Optional[str]:
+        """Chooses the server for a new peer.
+
+        Returns:
+            Optional[str]: The name of the best server, or None if no server can take a new peer.
+        """
+        ranking = self.rank()
+        return ranking[0][0] if ranking else None
+
+    async def run(self) -> None:
+        """Reads the load of all servers every ``refresh_interval`` seconds until cancelled."""
+        while True:
+            await asyncio.gather(*(self.refresh(server_name) for server_name in self.collector.servers))
+            await asyncio.sleep(self.refresh_interval)
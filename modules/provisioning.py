@@ -0,0 +1,190 @@
+import asyncio
+import logging
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Set, Tuple
+
+from modules.collector import StatsCollector
+from wireguard.keys import generate_key_pair
+from wireguard.wireguard import WireGuard
+
+
+@dataclass
+class ProvisionedPeer:
+    """A key pair and a reserved address ready to be given to a new peer."""
+
+    privkey: str
+    pubkey: str
+    address: str
+
+
+@dataclass
+class _ServerFacts:
+    """What a client configuration needs to know about the server, besides the peer itself."""
+
+    server_pubkey: str
+    server_port: int
+    server_config: dict
+
+
+class ProvisioningPool:
+    """Keeps a few key pairs and reserved addresses ready for every server, so that adding
+    a peer only has to commit it instead of generating keys and scanning the configuration.
+
+    The pool is topped up in the background after every use and every ``refill_interval``
+    seconds. The addresses are reserved only in memory, in ``WireGuard.reserved_ips`` of the
+    server instance, and released when the pool stops.
+    """
+
+    def __init__(self, collector: StatsCollector, size: int = 3, refill_interval: float = 300) -> None:
+        """Initializes the ProvisioningPool instance.
+
+        Args:
+            collector (StatsCollector): Used to get the server instances.
+            size (int): The maximum number of prepared peers per server, ``0`` disables the pool. Defaults to 3.
+            refill_interval (float): Seconds between two checks of the prepared peers against
+                the server configurations. Defaults to 300.
+        """
+        self.collector = collector
+        self.size = size
+        self.refill_interval = refill_interval
+
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+
+        self._pools: Dict[str, Deque[ProvisionedPeer]] = defaultdict(deque)
+        self._facts: Dict[str, _ServerFacts] = {}
+        self._servers: Dict[str, WireGuard] = {}
+        self._refill = asyncio.Event()
+
+    def available(self, server_name: str) -> int:
+        """Returns the number of prepared peers of a server."""
+        return len(self._pools[server_name])
+
+    async def add_peer(self, server_name: str, server: WireGuard, name: str) -> str:
+        """Adds a peer using prepared keys and address if there are any, otherwise as usual.
+
+        Args:
+            server_name (str): The name of the server.
+            server (WireGuard): The server instance.
+            name (str): The name of the peer.
+
+        Returns:
+            str: The WireGuard client configuration for the new peer.
+        """
+        pool = self._pools[server_name]
+        facts = self._facts.get(server_name)
+
+        if pool and facts is not None:
+            peer = pool.popleft()
+            self._refill.set()
+
+            try:
+                await asyncio.to_thread(server.commit_peer, name, peer.privkey, peer.pubkey, peer.address)
+            except Exception as e:
+                # The peer is added as usual then, e.g. if the address was taken outside the bot
+                logging.warning(f'Unable to add a prepared peer to "{server_name}": {e}')
+            else:
+                self.hits[server_name] += 1
+
+                return server.protocol.build_client_config(
+                    privkey=peer.privkey,
+                    address=peer.address,
+                    server_pubkey=facts.server_pubkey,
+                    endpoint=server.endpoint,
+                    server_port=facts.server_port,
+                    server_config=facts.server_config,
+                )
+            finally:
+                server.reserved_ips.discard(peer.address)
+
+        if self.size > 0:
+            self.misses[server_name] += 1
+            self._refill.set()
+
+        return await asyncio.to_thread(server.add_peer, name)
+
+    @staticmethod
+    def _prepare(
+            server: WireGuard,
+            addresses: List[str],
+            size: int,
+    ) -> Tuple[_ServerFacts, Set[str], List[ProvisionedPeer]]:
+        server_config = server.get_config(as_dict=True)
+        used_ips = {section.get('AllowedIPs') for key, section in server_config.items() if key != 'Interface'}
+
+        # Peers added outside the bot may have taken a reserved address in the meantime
+        stale = {address for address in addresses if address in used_ips}
+        peers = []
+
+        for _ in range(size - len(addresses) + len(stale)):
+            address = server.get_available_ip(server_config, server.reserved_ips)
+
+            if address is None:
+                break
+
+            server.reserved_ips.add(address)
+            peers.append(ProvisionedPeer(*generate_key_pair(), address))
+
+        facts = _ServerFacts(
+            server_pubkey=server.get_server_pubkey(),
+            server_port=server_config['Interface'].get('ListenPort'),
+            server_config=server_config,
+        )
+
+        return facts, stale, peers
+
+    async def _top_up(self, server_name: str) -> None:
+        pool = self._pools[server_name]
+
+        try:
+            server = await self.collector.get_server(server_name)
+            self._servers[server_name] = server
+
+            # The pool is only changed here on the event loop, the thread gets a copy of the addresses
+            facts, stale, peers = await asyncio.to_thread(
+                self._prepare, server, [peer.address for peer in pool], self.size,
+            )
+        except Exception as e:
+            # Stale facts must not be used to build client configurations
+            self._facts.pop(server_name, None)
+            logging.warning(f'Unable to prepare peers for "{server_name}": {e}')
+            return
+
+        for peer in [peer for peer in pool if peer.address in stale]:
+            pool.remove(peer)
+            server.reserved_ips.discard(peer.address)
+
+        pool.extend(peers)
+        self._facts[server_name] = facts
+
+    def release(self) -> None:
+        """Forgets all prepared peers and releases their addresses."""
+        for server_name, pool in self._pools.items():
+            server = self._servers.get(server_name)
+
+            if server is not None:
+                server.reserved_ips.difference_update(peer.address for peer in pool)
+
+            pool.clear()
+
+        self._facts.clear()
+
+    async def run(self) -> None:
+        """Tops up the pools of all servers until cancelled."""
+        if self.size <= 0:
+            return
+
+        try:
+            while True:
+                self._refill.clear()
+
+                await asyncio.gather(*(self._top_up(server_name) for server_name in self.collector.servers))
+
+                try:
+                    async with asyncio.timeout(self.refill_interval):
+                        await self._refill.wait()
+                except TimeoutError:
+                    pass
+        finally:
+            self.release()
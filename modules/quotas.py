@@ -0,0 +1,126 @@
+import asyncio
+import html
+import logging
+import re
+from typing import Optional
+
+from db.database import Database
+from modules.alerts import AlertManager
+from modules.collector import ServerSnapshot, StatsCollector
+
+_SIZE_UNITS = {
+    '': 1000 ** 3,
+    'b': 1,
+    'k': 1000, 'kb': 1000, 'kib': 1024,
+    'm': 1000 ** 2, 'mb': 1000 ** 2, 'mib': 1024 ** 2,
+    'g': 1000 ** 3, 'gb': 1000 ** 3, 'gib': 1024 ** 3,
+    't': 1000 ** 4, 'tb': 1000 ** 4, 'tib': 1024 ** 4,
+}
+
+
+def parse_size(text: str) -> Optional[int]:
+    """Parses a human-readable traffic size such as ``10 GB``, ``1.5GiB`` or ``500 mb``.
+
+    A number without a unit is treated as gigabytes, the same as ``g`` and ``gb``.
+
+    Args:
+        text (str): The text to parse.
+
+    Returns:
+        Optional[int]: The size in bytes, or None if the text is not a valid size.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:[.,]\d+)?)\s*([a-z]*)\s*', text.lower())
+
+    if not match or match.group(2) not in _SIZE_UNITS:
+        return None
+
+    return int(float(match.group(1).replace(',', '.')) * _SIZE_UNITS[match.group(2)])
+
+
+class QuotaEngine:
+    """Accumulates peer traffic from collector snapshots and disables peers that exceed their quota.
+
+    The WireGuard counters are reset when the interface restarts or a peer is re-enabled,
+    so a counter lower than the previous one is treated as a reset and counted from zero.
+    """
+
+    def __init__(self, collector: StatsCollector, database: Database, alerts: Optional[AlertManager] = None) -> None:
+        """Initializes the QuotaEngine instance.
+
+        Args:
+            collector (StatsCollector): The collector providing snapshots and server instances.
+            database (Database): The database storing quotas.
+            alerts (Optional[AlertManager]): Used to notify the admins about disabled peers, if given.
+        """
+        self.collector = collector
+        self.database = database
+        self.alerts = alerts
+
+    @staticmethod
+    def _delta(current: int, last: Optional[int]) -> int:
+        if last is None:
+            return 0
+        return current - last if current >= last else current
+
+    async def on_snapshot(self, snapshot: ServerSnapshot, _previous: Optional[ServerSnapshot]) -> None:
+        """Accounts the traffic of a new snapshot and disables the peers over the limit in one batch.
+
+        Args:
+            snapshot (ServerSnapshot): The new snapshot.
+            _previous (Optional[ServerSnapshot]): The previous snapshot, not used.
+        """
+        if not snapshot.reachable or not snapshot.interface_up:
+            return
+
+        server_name = snapshot.server_name
+        quotas = await asyncio.to_thread(self.database.get_quotas, server_name)
+        usage = []
+        exceeded = []
+
+        for pubkey, limit_bytes, used_bytes, last_rx, last_tx, is_exceeded in quotas:
+            stats = snapshot.peers.get(pubkey)
+
+            # Disabled peers are missing from the runtime stats
+            if stats is None:
+                continue
+
+            used_bytes += self._delta(stats['rx'], last_rx) + self._delta(stats['tx'], last_tx)
+
+            if used_bytes >= limit_bytes and not is_exceeded:
+                exceeded.append(pubkey)
+                is_exceeded = True
+
+            usage.append((used_bytes, stats['rx'], stats['tx'], int(is_exceeded), server_name, pubkey))
+
+        # The usage is stored only after the peers are disabled, so that a failed attempt
+        # is repeated with the next snapshot instead of marking the peers as exceeded
+        if exceeded:
+            await self._disable_peers(snapshot, exceeded)
+
+        if usage:
+            await asyncio.to_thread(self.database.update_quota_usage, usage)
+
+    async def _disable_peers(self, snapshot: ServerSnapshot, pubkeys: list[str]) -> None:
+        server_name = snapshot.server_name
+        server = await self.collector.get_server(server_name)
+        await asyncio.to_thread(server.set_peers_enabled, pubkeys, False)
+        await asyncio.to_thread(self.database.invalidate_peer_index, server_name)
+
+        logging.info(f'Disabled {len(pubkeys)} peer(s) of "{server_name}" due to exceeded traffic quota')
+
+        if self.alerts is None:
+            return
+
+        names = {pubkey: snapshot.peers[pubkey].get('name') for pubkey in pubkeys}
+
+        if not all(names.values()):
+            try:
+                names = await self.collector.get_peer_names(server_name)
+            except Exception as e:
+                logging.warning(f'Unable to resolve peer names of "{server_name}": {e}')
+
+        self.alerts.push([
+            f'📵 Peer <b>{html.escape(names.get(pubkey) or pubkey, quote=False)}</b> ({server_name}) '
+            f'exceeded its traffic quota'
+            for pubkey in pubkeys
+        ])
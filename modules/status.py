@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+from modules.keyboards import peer_list_kb
+from modules.messages import status_message
+from modules.peer_index import PeerIndex
+from wireguard.wireguard import WireGuard
+
+MessageKey = Tuple[int, int]
+
+# Telegram doesn't like a message being edited more often than once per second
+_MIN_EDIT_INTERVAL = 1.0
+
+
+@dataclass
+class StatusSnapshot:
+    """The peer list of a server as shown by the status view."""
+
+    peers: Optional[dict]
+    updated_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.updated_at
+
+
+@dataclass
+class LiveView:
+    """A status message refreshed automatically until ``expires_at``."""
+
+    message: Message
+    server_name: str
+    expires_at: float
+    rendered: Optional[str] = None
+
+
+class StatusCache:
+    """Keeps the last peer list of every server, so the status view can be shown
+    right away and refreshed in the background.
+
+    Concurrent refreshes of the same server share a single request. The cache also tracks
+    which messages currently show a status view, so a late refresh doesn't overwrite
+    a menu the admin has navigated to in the meantime.
+    """
+
+    def __init__(self, fresh_for: float = 5, live_interval: float = 10, live_duration: float = 300) -> None:
+        """Initializes the StatusCache instance.
+
+        Args:
+            fresh_for (float): Seconds a peer list is shown without being refreshed. Defaults to 5.
+            live_interval (float): Seconds between two refreshes of the live status messages. Defaults to 10.
+            live_duration (float): Seconds a status message stays live. Defaults to 300.
+        """
+        self.fresh_for = fresh_for
+        self.live_interval = live_interval
+        self.live_duration = live_duration
+
+        self._snapshots: Dict[str, StatusSnapshot] = {}
+        self._fetches: Dict[str, asyncio.Task] = {}
+        self._views: Dict[MessageKey, Tuple[str, int]] = {}
+        self._next_view = 0
+
+        self._live: Dict[MessageKey, LiveView] = {}
+        self._tickers: Dict[str, asyncio.Task] = {}
+        self._next_edit: Dict[int, float] = defaultdict(float)
+
+    def get(self, server_name: str) -> Optional[StatusSnapshot]:
+        """Returns the last peer list of a server.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            Optional[StatusSnapshot]: The snapshot, or None if the server hasn't been requested yet.
+        """
+        return self._snapshots.get(server_name)
+
+    def is_fresh(self, server_name: str) -> bool:
+        snapshot = self._snapshots.get(server_name)
+        return snapshot is not None and snapshot.age < self.fresh_for
+
+    async def _fetch(self, server_name: str, server: WireGuard, peer_index: PeerIndex) -> StatusSnapshot:
+        names = await peer_index.get_names(server_name)
+        peers = await asyncio.to_thread(server.get_peers, names)
+
+        snapshot = StatusSnapshot(peers=peers, updated_at=time.time())
+        self._snapshots[server_name] = snapshot
+        return snapshot
+
+    async def refresh(self, server_name: str, server: WireGuard, peer_index: PeerIndex) -> StatusSnapshot:
+        """Requests the peer list of a server, joining the request already in flight if there is one.
+
+        Args:
+            server_name (str): The name of the server.
+            server (WireGuard): The server instance.
+            peer_index (PeerIndex): Used to name the peers.
+
+        Returns:
+            StatusSnapshot: The fresh snapshot.
+        """
+        task = self._fetches.get(server_name)
+
+        if task is None:
+            task = asyncio.create_task(self._fetch(server_name, server, peer_index))
+            self._fetches[server_name] = task
+
+            def forget(_task: asyncio.Task) -> None:
+                if self._fetches.get(server_name) is _task:
+                    del self._fetches[server_name]
+
+            task.add_done_callback(forget)
+
+        # A cancelled caller must not cancel the request shared with the others
+        return await asyncio.shield(task)
+
+    def open_view(self, chat_id: int, message_id: int, server_name: str) -> int:
+        """Marks a message as showing the status of a server.
+
+        Args:
+            chat_id (int): The chat ID of the message.
+            message_id (int): The ID of the message.
+            server_name (str): The name of the server.
+
+        Returns:
+            int: The view token to pass to ``is_view_open``.
+        """
+        self._next_view += 1
+        self._views[(chat_id, message_id)] = (server_name, self._next_view)
+        return self._next_view
+
+    def close_view(self, chat_id: int, message_id: int) -> None:
+        """Marks a message as no longer showing a status, e.g. after any of its buttons was pressed.
+
+        Args:
+            chat_id (int): The chat ID of the message.
+            message_id (int): The ID of the message.
+        """
+        self._views.pop((chat_id, message_id), None)
+        self._live.pop((chat_id, message_id), None)
+
+    def is_view_open(self, chat_id: int, message_id: int, token: int) -> bool:
+        view = self._views.get((chat_id, message_id))
+        return view is not None and view[1] == token
+
+    def finish_view(self, chat_id: int, message_id: int, token: int) -> None:
+        """Forgets a view once its refresh has been shown, unless it was opened again or made live since.
+
+        Args:
+            chat_id (int): The chat ID of the message.
+            message_id (int): The ID of the message.
+            token (int): The token returned by ``open_view``.
+        """
+        key = (chat_id, message_id)
+
+        if self.is_view_open(chat_id, message_id, token) and key not in self._live:
+            del self._views[key]
+
+    def start_live(self, message: Message, server_name: str, server: WireGuard, peer_index: PeerIndex) -> None:
+        """Makes a status message refresh automatically for ``live_duration`` seconds.
+
+        All live messages of a server are refreshed by a single request per tick,
+        and a message is edited only when its content has changed.
+
+        Args:
+            message (Message): The status message.
+            server_name (str): The name of the server.
+            server (WireGuard): The server instance.
+            peer_index (PeerIndex): Used to name the peers.
+        """
+        key = (message.chat.id, message.message_id)
+        self.open_view(*key, server_name)
+        self._live[key] = LiveView(message, server_name, time.time() + self.live_duration)
+
+        if server_name not in self._tickers:
+            self._tickers[server_name] = asyncio.create_task(self._tick(server_name, server, peer_index))
+
+    def stop(self) -> None:
+        """Stops refreshing all live status messages."""
+        for ticker in self._tickers.values():
+            ticker.cancel()
+
+    async def _tick(self, server_name: str, server: WireGuard, peer_index: PeerIndex) -> None:
+        try:
+            while True:
+                views = [view for view in self._live.values() if view.server_name == server_name]
+
+                if not views:
+                    return
+
+                try:
+                    snapshot = await self.refresh(server_name, server, peer_index)
+                except Exception as e:
+                    logging.warning(f'Unable to refresh the live status of "{server_name}": {e}')
+                else:
+                    chats: Dict[int, List[LiveView]] = defaultdict(list)
+
+                    for view in views:
+                        chats[view.message.chat.id].append(view)
+
+                    await asyncio.gather(*(self._render_chat(chat_views, snapshot) for chat_views in chats.values()))
+
+                await asyncio.sleep(self.live_interval)
+        finally:
+            self._tickers.pop(server_name, None)
+
+    async def _render_chat(self, views: List[LiveView], snapshot: StatusSnapshot) -> None:
+        # The messages of a chat are edited one by one to respect the per-chat rate limit
+        for view in views:
+            message = view.message
+            key = (message.chat.id, message.message_id)
+            expired = time.time() >= view.expires_at
+            text = status_message(snapshot, live_until=None if expired else view.expires_at)
+
+            if not expired and text == view.rendered:
+                continue
+
+            await asyncio.sleep(max(0.0, self._next_edit[message.chat.id] - time.monotonic()))
+
+            # The admin may have left the view in the meantime
+            if self._live.get(key) is not view:
+                continue
+
+            try:
+                await message.edit_text(text=text, reply_markup=peer_list_kb(live=not expired))
+                view.rendered = text
+            except TelegramRetryAfter as e:
+                self._next_edit[message.chat.id] = time.monotonic() + e.retry_after
+                continue
+            except TelegramBadRequest as e:
+                if 'message is not modified' not in str(e):
+                    logging.debug(f'Live status of message {key} stopped: {e}')
+                    expired = True
+
+            self._next_edit[message.chat.id] = time.monotonic() + _MIN_EDIT_INTERVAL
+
+            if expired:
+                self.close_view(*key)
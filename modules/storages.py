@@ -5,12 +5,15 @@ from typing import Dict, Any, Optional, cast
 from aiogram.fsm.state import State
 from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
 
+from modules.tracing import traced_coroutine
+
 
 class SQLiteStorage(BaseStorage):
     def __init__(self, database_name: str = 'wg_assistant.db') -> None:
         self.con = sqlite3.connect(database_name)
         self.cur = self.con.cursor()
 
+    @traced_coroutine('storage')
     async def set_state(self, key: StorageKey, state: StateType = None) -> None:
         chat_id = key.chat_id
         if state is None:
@@ -22,12 +25,14 @@ class SQLiteStorage(BaseStorage):
             )
         self.con.commit()
 
+    @traced_coroutine('storage')
     async def get_state(self, key: StorageKey) -> Optional[str]:
         chat_id = key.chat_id
         self.cur.execute('SELECT state FROM states WHERE chat_id = ?', (chat_id,))
         result = self.cur.fetchone()
         return cast(Optional[str], result[0]) if result else None
 
+    @traced_coroutine('storage')
     async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
         chat_id = key.chat_id
         if not data:
@@ -36,6 +41,7 @@ class SQLiteStorage(BaseStorage):
             self.cur.execute('REPLACE INTO data (chat_id, data) VALUES (?, ?)', (chat_id, json.dumps(data)))
         self.con.commit()
 
+    @traced_coroutine('storage')
     async def get_data(self, key: StorageKey) -> Dict[str, Any]:
         chat_id = key.chat_id
         self.cur.execute('SELECT data FROM data WHERE chat_id = ?', (chat_id,))
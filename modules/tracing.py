@@ -0,0 +1,207 @@
+import inspect
+import logging
+import random
+from abc import abstractmethod
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+
+class UpdateTrace:
+    """Time spent in the different stages of processing a single update."""
+
+    __slots__ = ('update_id', 'spans', '_lock')
+
+    def __init__(self, update_id: int) -> None:
+        self.update_id = update_id
+        self.spans: Dict[str, float] = {}
+        # Backend calls record their spans from worker threads
+        self._lock = Lock()
+
+    def add(self, name: str, duration: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def format(self, total: float) -> str:
+        spans = ', '.join(f'{name}={duration:.3f}s' for name, duration in self.spans.items())
+        return f'Slow update {self.update_id} took {total:.3f}s: {spans}'
+
+
+_current_trace: ContextVar[Optional[UpdateTrace]] = ContextVar('current_trace', default=None)
+_in_traced_call: ContextVar[bool] = ContextVar('in_traced_call', default=False)
+
+
+def add_span(name: str, duration: float) -> None:
+    """Adds a span to the trace of the update being processed, if it's traced.
+
+    Args:
+        name (str): The span name, e.g. ``telegram:sendMessage``.
+        duration (float): The span duration in seconds.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration)
+
+
+def traced_call(func: Callable, name: str) -> Callable:
+    """Wraps a blocking or coroutine function to add its duration to the current trace.
+
+    Nested traced calls are not recorded separately, so that the time of a backend method
+    calling other backend methods is counted once.
+
+    Args:
+        func (Callable): The function to wrap.
+        name (str): The span name.
+
+    Returns:
+        Callable: The wrapped function.
+    """
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            trace = _current_trace.get()
+
+            if trace is None or _in_traced_call.get():
+                return await func(*args, **kwargs)
+
+            token = _in_traced_call.set(True)
+            started = perf_counter()
+
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                trace.add(name, perf_counter() - started)
+                _in_traced_call.reset(token)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        trace = _current_trace.get()
+
+        if trace is None or _in_traced_call.get():
+            return func(*args, **kwargs)
+
+        token = _in_traced_call.set(True)
+        started = perf_counter()
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace.add(name, perf_counter() - started)
+            _in_traced_call.reset(token)
+
+    return wrapper
+
+
+def traced_coroutine(name: str) -> Callable:
+    """Decorator adding the duration of a coroutine method to the current trace.
+
+    Args:
+        name (str): The span name.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @wraps(method)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current_trace.get() is None:
+                return await method(*args, **kwargs)
+
+            started = perf_counter()
+
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                add_span(name, perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+class TracedMiddleware(BaseMiddleware):
+    """Base class for middlewares that records the time spent in the middleware itself.
+
+    Subclasses implement ``process`` instead of ``__call__``. The time spent in the rest of
+    the chain is not attributed to the middleware.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        trace = _current_trace.get()
+
+        if trace is None:
+            return await self.process(handler, event, data)
+
+        downstream = 0.0
+
+        async def timed_handler(inner_event: TelegramObject, inner_data: Dict[str, Any]) -> Any:
+            nonlocal downstream
+            handler_started = perf_counter()
+
+            try:
+                return await handler(inner_event, inner_data)
+            finally:
+                downstream += perf_counter() - handler_started
+
+        started = perf_counter()
+
+        try:
+            return await self.process(timed_handler, event, data)
+        finally:
+            trace.add(f'middleware:{type(self).__name__}', perf_counter() - started - downstream)
+
+    @abstractmethod
+    async def process(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        """Processes the event in place of ``__call__``, which adds the time it took to the trace."""
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outermost update middleware that traces every update and reports a sample of the slow ones."""
+
+    def __init__(self, threshold: float, sample_rate: float = 1.0) -> None:
+        """Initializes the TracingMiddleware instance.
+
+        Args:
+            threshold (float): Updates processed longer than this number of seconds are slow.
+            sample_rate (float): The share of slow updates to report, from 0 to 1. Defaults to 1.
+        """
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any],
+    ) -> Any:
+        trace = UpdateTrace(event.update_id)
+        token = _current_trace.set(trace)
+        started = perf_counter()
+
+        try:
+            return await handler(event, data)
+        finally:
+            total = perf_counter() - started
+            _current_trace.reset(token)
+
+            if total >= self.threshold and random.random() < self.sample_rate:
+                logging.warning(trace.format(total))
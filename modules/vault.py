@@ -0,0 +1,110 @@
+import logging
+import re
+import time
+from typing import Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from db.database import Database
+from wireguard.keys import derive_public_key
+
+_PRIVATE_KEY_RE = re.compile(r'^PrivateKey\s*=\s*(\S+)\s*$', re.MULTILINE)
+
+
+class ConfigVault:
+    """Keeps the configurations of the clients added by the bot, so they can be sent again
+    without changing the server.
+
+    The configurations contain the private keys of the clients, so they are encrypted with
+    Fernet before they are stored in the database. The Telegram file ID of the QR code is
+    stored along with them, so the code isn't rendered and uploaded again.
+    """
+
+    def __init__(self, database: Database, key: str) -> None:
+        """Initializes the ConfigVault instance.
+
+        Args:
+            database (Database): The database storing the configurations.
+            key (str): The Fernet key, as generated by ``Fernet.generate_key()``.
+
+        Raises:
+            ValueError: If the key isn't a valid Fernet key.
+        """
+        self.database = database
+        self._fernet = Fernet(key)
+
+    @staticmethod
+    def get_pubkey(config: str) -> Optional[str]:
+        """Returns the public key of the client of a configuration.
+
+        Args:
+            config (str): The client configuration.
+
+        Returns:
+            Optional[str]: The public key, or None if the configuration has no valid private key.
+        """
+        match = _PRIVATE_KEY_RE.search(config)
+
+        if match is None:
+            return None
+
+        try:
+            return derive_public_key(match.group(1))
+        except ValueError:
+            return None
+
+    def store(self, server_name: str, config: str) -> Optional[str]:
+        """Stores the configuration of a new client.
+
+        Args:
+            server_name (str): The name of the server.
+            config (str): The client configuration.
+
+        Returns:
+            Optional[str]: The public key of the client, or None if the configuration wasn't stored.
+        """
+        pubkey = self.get_pubkey(config)
+
+        if pubkey is None:
+            logging.warning(f'Unable to store a client configuration of "{server_name}": no private key')
+            return None
+
+        self.database.set_client_config(server_name, pubkey, self._fernet.encrypt(config.encode()), time.time())
+        return pubkey
+
+    def get(self, server_name: str, pubkey: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Returns the stored configuration of a client.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the client.
+
+        Returns:
+            Optional[Tuple[str, Optional[str]]]: The configuration and the file ID of its QR code, if it was sent,
+            or None if no configuration readable with the current key is stored.
+        """
+        stored = self.database.get_client_config(server_name, pubkey)
+
+        if stored is None:
+            return None
+
+        try:
+            return self._fernet.decrypt(stored[0]).decode(), stored[1]
+        except InvalidToken:
+            logging.warning(f'Unable to decrypt the stored configuration of a client of "{server_name}", '
+                            f'it was encrypted with another key')
+            return None
+
+    def has(self, server_name: str, pubkey: str) -> bool:
+        """Checks if the configuration of a client is stored, without decrypting it."""
+        return self.database.get_client_config(server_name, pubkey) is not None
+
+    def set_photo(self, server_name: str, pubkey: str, photo_file_id: str) -> None:
+        """Remembers the Telegram file ID of the QR code of a stored configuration.
+
+        Args:
+            server_name (str): The name of the server.
+            pubkey (str): The public key of the client.
+            photo_file_id (str): The file ID of the sent QR code.
+        """
+        self.database.set_client_config_photo(server_name, pubkey, photo_file_id)
@@ -1,7 +1,12 @@
 from enum import Enum
+from threading import Lock
 
+from modules.instrumentation import instrument_server, operation_stats
+from modules.tracing import traced_call
 from wireguard.client.local import LocalClient
+from wireguard.client.base import BaseClient
 from wireguard.client.remote import RemoteClient
+from wireguard.dump import HostDumpReader
 from wireguard.linux import Linux
 from wireguard.protocol.amnezia_wg import AmneziaWGProtocol
 from wireguard.protocol.base import BaseProtocol
@@ -23,6 +28,13 @@ class Protocol(Enum):
 class ServerFactory:
     _instance = None
     _created_servers = {}
+    # Servers are created in worker threads, every key is created by one of them at a time
+    _lock = Lock()
+    _key_locks: dict[tuple, Lock] = {}
+    # The interfaces of a host share its client and the reader of its runtime state,
+    # keyed by (host, port, username), or None for the local host
+    _clients: dict[tuple | None, BaseClient] = {}
+    _dump_readers: dict[tuple | None, HostDumpReader] = {}
 
     def __new__(cls):
         if cls._instance is None:
@@ -46,6 +58,22 @@ class ServerFactory:
         if server_name in cls._created_servers:
             return cls._created_servers[server_name]
 
+        # The other requests of the server wait for the instance instead of creating their own
+        with cls._get_key_lock(('server', server_name)):
+            if server_name in cls._created_servers:
+                return cls._created_servers[server_name]
+
+            return cls._create_server(server_name, server_data)
+
+    @classmethod
+    def _get_key_lock(cls, key: tuple) -> Lock:
+        """Return the lock serializing the creation of an object shared under a key."""
+        with cls._lock:
+            return cls._key_locks.setdefault(key, Lock())
+
+    @classmethod
+    def _create_server(cls, server_name: str, server_data: dict) -> WireGuard:
+        """Create a server instance and remember it. Must be called with the lock of the server held."""
         server_type = server_data.get('type')
         protocol_type = Protocol(server_data.get('protocol', Protocol.WIREGUARD.value))
         data = server_data.get('data')
@@ -55,11 +83,27 @@ class ServerFactory:
 
         cls._prepare_data(data)
         protocol = cls._get_protocol(protocol_type)
-        instance = cls._create_instance(server_type, data, protocol)
+
+        # Creating an instance includes establishing the connection to the host
+        create = traced_call(operation_stats.timed(cls._create_instance, server_name, 'create'), 'backend:create')
+        instance = create(server_type, data, protocol)
+        instrument_server(instance, server_name)
 
         cls._created_servers[server_name] = instance
         return instance
 
+    @classmethod
+    def get_created_server(cls, server_name: str) -> WireGuard | None:
+        """Return a server instance only if it has already been created, without connecting to the host.
+
+        Args:
+            server_name (str): The name of the server.
+
+        Returns:
+            WireGuard | None: The server instance, or None if it hasn't been requested yet.
+        """
+        return cls._created_servers.get(server_name)
+
     @staticmethod
     def _prepare_data(data: dict):
         """Prepare and normalize server data for backward compatibility."""
@@ -86,8 +130,8 @@ class ServerFactory:
         """Instantiate and return the appropriate server type."""
         match server_type:
             case ServerType.LINUX.value:
-                client = ServerFactory._get_linux_client(data)
-                return Linux(**data, client=client, protocol=protocol)
+                client, dump_reader = ServerFactory._get_linux_client(data)
+                return Linux(**data, client=client, protocol=protocol, dump_reader=dump_reader)
 
             case ServerType.ROUTEROS.value:
                 return RouterOS(**data, protocol=protocol)
@@ -95,13 +139,23 @@ class ServerFactory:
             case _:
                 raise ValueError(f'Unhandled server type: {server_type}')
 
-    @staticmethod
-    def _get_linux_client(data: dict) -> LocalClient | RemoteClient:
-        """Determine and return the appropriate client for Linux servers."""
+    @classmethod
+    def _get_linux_client(cls, data: dict) -> tuple[LocalClient | RemoteClient, HostDumpReader]:
+        """Determine and return the appropriate client for Linux servers, along with the reader
+        of the host state. Servers on the same host share both."""
         credential_keys = ['server', 'port', 'username', 'password']
         credentials = {key: data.pop(key, None) for key in credential_keys}
 
         if any(value is None for value in credentials.values()):
-            return LocalClient()
-
-        return RemoteClient(**credentials)
+            key = None
+        else:
+            key = (credentials['server'], int(credentials['port']), credentials['username'])
+
+        # The interfaces of a host are created concurrently, and must not connect to it twice
+        with cls._get_key_lock(('client', key)):
+            if key not in cls._clients:
+                client = LocalClient() if key is None else RemoteClient(**credentials)
+                cls._dump_readers[key] = HostDumpReader(client)
+                cls._clients[key] = client
+
+        return cls._clients[key], cls._dump_readers[key]
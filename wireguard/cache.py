@@ -0,0 +1,125 @@
+import time
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Dict, Tuple
+
+
+class FactCache:
+    """Read-through cache of server facts that rarely change, such as the server public key.
+
+    Every fact has its own time to live. A value loaded while the fact was being invalidated
+    is returned to the caller but not stored, so a mutation never leaves a stale value behind.
+    """
+
+    def __init__(self, ttls: Dict[str, float]) -> None:
+        """Initializes the FactCache instance.
+
+        Args:
+            ttls (Dict[str, float]): Seconds each fact is kept for, ``math.inf`` keeps it until invalidated.
+                Facts missing here are not cached.
+        """
+        self.ttls = ttls
+
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def get(self, fact: str, loader: Callable[[], Any]) -> Any:
+        """Returns a cached fact, loading it if it's missing or expired.
+
+        Args:
+            fact (str): The name of the fact.
+            loader (Callable[[], Any]): Loads the fact from the server. None results are not cached.
+
+        Returns:
+            Any: The value of the fact.
+        """
+        ttl = self.ttls.get(fact, 0)
+
+        with self._lock:
+            cached = self._values.get(fact)
+
+            if cached is not None and time.monotonic() < cached[0]:
+                return cached[1]
+
+            generation = self._generations.get(fact, 0)
+
+        # The lock isn't held while the server is being requested
+        value = loader()
+
+        if value is not None and ttl > 0:
+            with self._lock:
+                if self._generations.get(fact, 0) == generation:
+                    self._values[fact] = (time.monotonic() + ttl, value)
+
+        return value
+
+    def set(self, fact: str, value: Any) -> None:
+        """Stores a fact that was read from the server along with other data.
+
+        Args:
+            fact (str): The name of the fact.
+            value (Any): The value of the fact.
+        """
+        ttl = self.ttls.get(fact, 0)
+
+        if value is not None and ttl > 0:
+            with self._lock:
+                self._values[fact] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, *facts: str) -> None:
+        """Drops facts, so they are loaded again on the next request.
+
+        Args:
+            *facts (str): The names of the facts, all facts if none are given.
+        """
+        with self._lock:
+            for fact in facts or tuple(self._values) + tuple(self.ttls):
+                self._values.pop(fact, None)
+                self._generations[fact] = self._generations.get(fact, 0) + 1
+
+
+def cached_fact(fact: str) -> Callable[..., Any]:
+    """Decorator caching the result of a WireGuard method without arguments in ``self.facts``.
+
+    Args:
+        fact (str): The name of the fact.
+
+    Returns:
+        Callable[..., Any]: The decorated method.
+    """
+
+    def decorator(method: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(method)
+        def wrapper(self) -> Any:
+            return self.facts.get(fact, lambda: method(self))
+
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*facts: str) -> Callable[..., Any]:
+    """Decorator for WireGuard methods changing cached facts.
+
+    The facts are invalidated once the method has finished, even if it has failed,
+    since the change may have been applied partially.
+
+    Args:
+        *facts (str): The names of the changed facts, all facts if none are given.
+
+    Returns:
+        Callable[..., Any]: The decorated method.
+    """
+
+    def decorator(method: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs) -> Any:
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.facts.invalidate(*facts)
+
+        return wrapper
+
+    return decorator
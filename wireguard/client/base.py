@@ -1,7 +1,22 @@
+import asyncio
+import hashlib
 from abc import ABC, abstractmethod
+from io import StringIO
 from typing import Tuple, Any
 
 
+def content_version(contents: str) -> str:
+    """Get the version of file contents, as printed by ``sha256sum``.
+
+    Args:
+        contents (str): The file contents.
+
+    Returns:
+        str: The SHA-256 hex digest of the contents.
+    """
+    return hashlib.sha256(contents.encode()).hexdigest()
+
+
 class BaseClient(ABC):
     """Abstract base class for all clients."""
 
@@ -20,6 +35,27 @@ class BaseClient(ABC):
                 - stderr (Any): The standard error stream.
         """
 
+    async def execute_async(self, command: str) -> Tuple[Any, Any, Any]:
+        """Execute a command without blocking the event loop.
+
+        Implementations should override this method if they can wait for the command natively,
+        by default it runs ``execute`` in a thread.
+
+        Args:
+            command (str): The command to execute.
+
+        Returns:
+            Tuple[Any, Any, Any]: A tuple containing ``None``, the standard output and the standard error
+            streams, which are already read, so reading them doesn't block.
+        """
+
+        def run() -> Tuple[Any, Any, Any]:
+            _, stdout, stderr = self.execute(command)
+            streams = [stream.read() for stream in (stdout, stderr)]
+            return None, *(StringIO(s.decode('utf-8') if isinstance(s, bytes) else s) for s in streams)
+
+        return await asyncio.to_thread(run)
+
     @abstractmethod
     def get_file_contents(self, path: str) -> str:
         """Retrieve the contents of a file.
@@ -33,9 +69,29 @@ class BaseClient(ABC):
 
     @abstractmethod
     def put_file_contents(self, path: str, contents: str) -> None:
-        """Write contents to a file.
+        """Write contents to a file, replacing it atomically.
+
+        Args:
+            path (str): The path to the file.
+            contents (str): The contents to write to the file.
+        """
+
+    def replace_file_contents(self, path: str, contents: str, version: str) -> bool:
+        """Write contents to a file only if it hasn't changed since it was read.
+
+        Implementations should override this method if they can check the version
+        and replace the file with a single request.
 
         Args:
             path (str): The path to the file.
             contents (str): The contents to write to the file.
+            version (str): The ``content_version`` of the file contents that were read.
+
+        Returns:
+            bool: True if the file was written, False if it has been changed in the meantime.
         """
+        if content_version(self.get_file_contents(path)) != version:
+            return False
+
+        self.put_file_contents(path, contents)
+        return True
@@ -1,20 +1,124 @@
-from subprocess import Popen, PIPE
-from typing import Tuple, Any
+import asyncio
+import os
+import re
+import shlex
+import subprocess
+from io import StringIO
+from tempfile import mkstemp
+from typing import Tuple, Any, Optional
 
-from .base import BaseClient
+from .base import BaseClient, content_version
+
+# Commands using any of these need a shell, e.g. pipes, redirections and process substitution
+_SHELL_SYNTAX = re.compile(r'[|&;<>()$`*?\[\]~\n]')
 
 
 class LocalClient(BaseClient):
-    """Class that provides a client for local interaction with a host."""
+    """Class that provides a client for local interaction with a host.
+
+    Commands are started directly from their arguments, a shell is started only for commands using
+    its syntax. Every process is waited for, so none is left behind as a zombie, and killed
+    if it runs longer than ``timeout`` seconds.
+    """
+
+    def __init__(self, timeout: float = 30) -> None:
+        """Initializes the LocalClient instance.
+
+        Args:
+            timeout (float): Seconds a command may run before it's killed. Defaults to 30.
+        """
+        self.timeout = timeout
+
+    @staticmethod
+    def _get_args(command: str) -> list[str]:
+        if _SHELL_SYNTAX.search(command):
+            return ['/bin/bash', '-c', command]
+
+        return shlex.split(command)
+
+    @staticmethod
+    def _not_found(error: FileNotFoundError) -> Tuple[None, StringIO, StringIO]:
+        # Reported the way a shell would, since the callers check the standard error
+        return None, StringIO(), StringIO(f'{error.filename}: command not found\n')
 
     def execute(self, command: str) -> Tuple[Any, Any, Any]:
-        process = Popen(command, shell=True, stdout=PIPE, stderr=PIPE, text=True, executable='/bin/bash')
-        return None, process.stdout, process.stderr
+        try:
+            result = subprocess.run(self._get_args(command), capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f'"{command}" did not finish within {self.timeout} seconds')
+        except FileNotFoundError as e:
+            return self._not_found(e)
+
+        return None, StringIO(result.stdout), StringIO(result.stderr)
+
+    async def execute_async(self, command: str) -> Tuple[Any, Any, Any]:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._get_args(command),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError as e:
+            return self._not_found(e)
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except TimeoutError:
+            raise TimeoutError(f'"{command}" did not finish within {self.timeout} seconds')
+        finally:
+            # Also reached when the caller is cancelled
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        return None, StringIO(stdout.decode('utf-8')), StringIO(stderr.decode('utf-8'))
 
     def get_file_contents(self, path: str) -> str:
         with open(path, 'r', encoding='utf-8') as f:
             return f.read()
 
     def put_file_contents(self, path: str, contents: str) -> None:
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(contents)
+        self._write_file(path, contents)
+
+    def replace_file_contents(self, path: str, contents: str, version: str) -> bool:
+        return self._write_file(path, contents, version)
+
+    @staticmethod
+    def _write_file(path: str, contents: str, version: Optional[str] = None) -> bool:
+        """Write a temporary file next to the target and rename it over the target,
+        so the file is never left half-written.
+
+        Args:
+            path (str): The path to the file.
+            contents (str): The contents to write to the file.
+            version (Optional[str]): If given, the file is replaced only if its current contents have this version.
+
+        Returns:
+            bool: True if the file was written, False if its version didn't match.
+        """
+        fd, tmp_path = mkstemp(dir=os.path.dirname(path) or '.', prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(contents)
+                f.flush()
+                os.fsync(f.fileno())
+
+            try:
+                stat = os.stat(path)
+                os.chmod(tmp_path, stat.st_mode & 0o7777)
+                os.chown(tmp_path, stat.st_uid, stat.st_gid)
+            except (FileNotFoundError, PermissionError):
+                pass
+
+            if version is not None:
+                with open(path, 'r', encoding='utf-8') as f:
+                    if content_version(f.read()) != version:
+                        return False
+
+            os.replace(tmp_path, path)
+            tmp_path = None
+            return True
+        finally:
+            if tmp_path is not None:
+                os.unlink(tmp_path)
@@ -1,5 +1,9 @@
+import logging
+import shlex
 from functools import wraps
-from typing import Tuple, Any, Callable
+from threading import Lock
+from typing import Tuple, Any, Callable, Optional
+from uuid import uuid4
 
 from paramiko.client import SSHClient, AutoAddPolicy
 from paramiko.ssh_exception import SSHException, NoValidConnectionsError
@@ -8,7 +12,11 @@ from .base import BaseClient
 
 
 class RemoteClient(BaseClient):
-    """Class that provides a client for remote interaction with a host."""
+    """Class that provides a client for remote interaction with a host.
+
+    The servers on the same host share the client, every command runs on its own channel
+    of the same SSH transport.
+    """
 
     def __init__(
             self,
@@ -22,6 +30,7 @@ class RemoteClient(BaseClient):
         self.username = username
         self.password = password
 
+        self._connect_lock = Lock()
         self.client = SSHClient()
         self.client.set_missing_host_key_policy(AutoAddPolicy())
         self.connect()
@@ -38,15 +47,22 @@ class RemoteClient(BaseClient):
 
         Returns:
             Callable: Decorated function.
+
+        Raises:
+            ConnectionError: If the last attempt fails as well.
         """
 
         def decorator(func):
             @wraps(func)
             def wrapper(self, *args, **kwargs):
-                for _ in range(max_retries):
+                for attempt in range(max_retries):
                     try:
                         return func(self, *args, **kwargs)
-                    except (SSHException, ConnectionError):
+                    except (SSHException, ConnectionError) as e:
+                        # The caller mustn't mistake a failed call for a result
+                        if attempt == max_retries - 1:
+                            raise ConnectionError(f'Error communicating with WireGuard server host: {e}') from e
+
                         self.connect()
 
             return wrapper
@@ -62,6 +78,18 @@ class RemoteClient(BaseClient):
         Raises:
             ConnectionError: If the connection to the WireGuard server host fails.
         """
+        failed_transport = self.client.get_transport()
+
+        with self._connect_lock:
+            # Another thread sharing the client may have reconnected already
+            transport = self.client.get_transport()
+
+            if transport is not None and transport is not failed_transport and transport.is_active():
+                return
+
+            self._connect()
+
+    def _connect(self) -> None:
         try:
             self.client.connect(
                 hostname=self.server,
@@ -84,6 +112,62 @@ class RemoteClient(BaseClient):
 
     @_retry_on_ssh_exception()
     def put_file_contents(self, path: str, content: str) -> None:
-        sftp = self.client.open_sftp()
-        with sftp.file(path, mode='w') as f:
-            f.write(content)
+        if not self._write_file(path, content):
+            raise OSError(f'Unable to replace {path}')
+
+    @_retry_on_ssh_exception()
+    def replace_file_contents(self, path: str, contents: str, version: str) -> bool:
+        return self._write_file(path, contents, version)
+
+    def _write_file(self, path: str, contents: str, version: Optional[str] = None) -> bool:
+        """Upload a temporary file next to the target and rename it over the target,
+        so the file is never left half-written.
+
+        The version is checked on the host by the same command that renames the file.
+
+        Args:
+            path (str): The path to the file.
+            contents (str): The contents to write to the file.
+            version (Optional[str]): If given, the file is replaced only if its current contents have this version.
+
+        Returns:
+            bool: True if the file was written, False if its version didn't match.
+        """
+        tmp_path = f'{path}.{uuid4().hex[:8]}.tmp'
+        target, tmp = shlex.quote(path), shlex.quote(tmp_path)
+        replace = (
+            f'chmod --reference={target} {tmp} 2>/dev/null; chown --reference={target} {tmp} 2>/dev/null; '
+            f'mv -f {tmp} {target} && echo replaced'
+        )
+
+        if version is not None:
+            replace = f'if [ "$(sha256sum < {target} | cut -c1-64)" = {shlex.quote(version)} ]; ' \
+                      f'then {replace}; else rm -f {tmp}; fi'
+
+        try:
+            with self.client.open_sftp() as sftp:
+                with sftp.file(tmp_path, mode='w') as f:
+                    f.write(contents)
+
+            _, stdout, _ = self.client.exec_command(replace)
+            output = stdout.read()
+        except Exception:
+            self._remove_file(tmp_path)
+            raise
+
+        if isinstance(output, bytes):
+            output = output.decode('utf-8')
+
+        return output.strip() == 'replaced'
+
+    def _remove_file(self, path: str) -> None:
+        """Remove a file left behind by a failed write, if the host can still be reached.
+
+        Args:
+            path (str): The path to the file.
+        """
+        try:
+            with self.client.open_sftp() as sftp:
+                sftp.remove(path)
+        except (OSError, SSHException) as e:
+            logging.debug(f'Unable to remove {path}: {e}')
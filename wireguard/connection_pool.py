@@ -0,0 +1,215 @@
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+from typing import Callable, Iterator
+
+from routeros_api import RouterOsApiPool
+from routeros_api.api import RouterOsApi
+from routeros_api.exceptions import RouterOsApiConnectionError
+
+
+class RouterOSConnectionPool:
+    """A bounded pool of RouterOS API sessions shared by the threads calling a server.
+
+    A RouterOS device accepts several API sessions, so concurrent requests use their own connections
+    instead of waiting for a single socket. A connection that fails is closed and never handed out again.
+    After a failed login new connections are refused for an exponentially growing time, so an
+    unreachable router doesn't make every request wait for the connection timeout.
+    """
+
+    def __init__(
+            self,
+            connect: Callable[[], RouterOsApiPool],
+            size: int = 4,
+            timeout: float = 5,
+            acquire_timeout: float = 30,
+            max_idle: float = 300,
+            max_backoff: float = 60,
+    ) -> None:
+        """Initializes the RouterOSConnectionPool instance.
+
+        Args:
+            connect (Callable[[], RouterOsApiPool]): Creates a new, not yet opened connection to the router.
+            size (int): The maximum number of open connections. Defaults to 4.
+            timeout (float): The socket timeout of the connections in seconds. Defaults to 5.
+            acquire_timeout (float): Seconds to wait for a connection while all of them are in use. Defaults to 30.
+            max_idle (float): Seconds after which an unused connection is closed. Defaults to 300.
+            max_backoff (float): The maximum number of seconds new connections are refused
+                after failed attempts. Defaults to 60.
+        """
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.max_backoff = max_backoff
+
+        # Pairs of a connection and the time it was released, the most recently used last
+        self._idle: deque[tuple[RouterOsApiPool, float]] = deque()
+        self._in_use = 0
+        self._condition = Condition()
+        self._closed = False
+
+        self._failures = 0
+        self._retry_at = 0.0
+
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.failed = 0
+        self.waits = 0
+
+    def stats(self) -> dict[str, int]:
+        """Returns the usage counters of the pool.
+
+        Returns:
+            dict[str, int]: The numbers of ``idle`` and ``in_use`` connections, and the total numbers
+            of ``created``, ``reused``, ``discarded`` and ``failed`` connections and of ``waits`` for a connection.
+        """
+        with self._condition:
+            return {
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'failed': self.failed,
+                'waits': self.waits,
+            }
+
+    @staticmethod
+    def _disconnect(connection: RouterOsApiPool) -> None:
+        try:
+            connection.disconnect()
+        except Exception as e:
+            logging.debug(f'Error closing a RouterOS API connection: {e}')
+
+    def _take(self) -> RouterOsApiPool | None:
+        """Takes an idle connection or reserves a place for a new one, waiting while the pool is full.
+
+        Returns:
+            RouterOsApiPool | None: An idle connection, or None if a new one has to be opened.
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        expired = []
+
+        with self._condition:
+            waited = False
+
+            while True:
+                if self._closed:
+                    raise ConnectionError('The RouterOS connection pool is closed')
+
+                now = time.monotonic()
+
+                # The most recently used connections are the least likely to have been dropped
+                while self._idle and now - self._idle[0][1] > self.max_idle:
+                    expired.append(self._idle.popleft()[0])
+
+                if self._idle:
+                    connection = self._idle.pop()[0]
+                    self.reused += 1
+                    break
+
+                if self._in_use < self.size:
+                    if now < self._retry_at:
+                        raise ConnectionError(
+                            f'RouterOS API is unavailable, retrying in {self._retry_at - now:.0f} seconds'
+                        )
+
+                    connection = None
+                    break
+
+                if not waited:
+                    self.waits += 1
+                    waited = True
+
+                if now >= deadline or not self._condition.wait(deadline - now):
+                    raise ConnectionError(f'No RouterOS API connection available within {self.acquire_timeout} seconds')
+
+            # The place in the pool is taken before a new connection is opened
+            self._in_use += 1
+            self.discarded += len(expired)
+
+        for idle in expired:
+            self._disconnect(idle)
+
+        return connection
+
+    def _open(self) -> RouterOsApiPool:
+        connection = self.connect()
+        connection.set_timeout(self.timeout)
+
+        try:
+            connection.get_api()
+        except RouterOsApiConnectionError as e:
+            self._disconnect(connection)
+
+            with self._condition:
+                self.failed += 1
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(2 ** (self._failures - 1), self.max_backoff)
+
+            raise ConnectionError(f'Error connecting to RouterOS API: {e}')
+
+        with self._condition:
+            self.created += 1
+            self._failures = 0
+            self._retry_at = 0.0
+
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[RouterOsApi]:
+        """Lends a connection for the duration of a ``with`` block.
+
+        A connection error raised in the block closes the connection, any other exception returns it to the pool.
+
+        Yields:
+            RouterOsApi: The API of the connection.
+
+        Raises:
+            ConnectionError: If no connection could be opened.
+        """
+        connection = self._take()
+        healthy = False
+
+        try:
+            if connection is None:
+                connection = self._open()
+
+            yield connection.get_api()
+            healthy = True
+        except RouterOsApiConnectionError:
+            raise
+        except Exception:
+            # Errors reported by the router leave the connection usable
+            healthy = connection is not None
+            raise
+        finally:
+            with self._condition:
+                self._in_use -= 1
+
+                if healthy and not self._closed:
+                    self._idle.append((connection, time.monotonic()))
+                    connection = None
+                elif connection is not None:
+                    self.discarded += 1
+
+                self._condition.notify()
+
+            if connection is not None:
+                self._disconnect(connection)
+
+    def close(self) -> None:
+        """Closes all connections. Connections in use are closed once they are released."""
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._condition.notify_all()
+
+        for connection in idle:
+            self._disconnect(connection)
@@ -0,0 +1,99 @@
+import logging
+import time
+from threading import Lock
+from typing import Dict, Optional, Set, Tuple
+
+from wireguard.client.base import BaseClient
+
+
+class HostDumpReader:
+    """Reads the runtime state of all WireGuard interfaces of a host with a single command.
+
+    The interfaces of a host that share a client also share a reader. Every protocol used on the host
+    is registered, and one ``show all dump`` per protocol is run in a single command, whose output is
+    reused for ``max_age`` seconds. Concurrent reads wait for the one in progress instead of starting another.
+    """
+
+    def __init__(self, client: BaseClient, max_age: float = 1.0) -> None:
+        """Initializes the HostDumpReader instance.
+
+        Args:
+            client (BaseClient): The client of the host.
+            max_age (float): Seconds the output of a read is reused for. Defaults to 1.
+        """
+        self.client = client
+        self.max_age = max_age
+
+        self._commands: Set[str] = set()
+        # The per-interface dumps keyed by (command, interface name), and the time they were read
+        self._dumps: Dict[Tuple[str, str], str] = {}
+        self._read_at = 0.0
+        self._lock = Lock()
+
+    def register(self, command: str) -> None:
+        """Adds a protocol to the batched reads.
+
+        Args:
+            command (str): The command of the protocol, e.g. ``wg`` or ``awg``.
+        """
+        with self._lock:
+            if command not in self._commands:
+                self._commands.add(command)
+                self._read_at = 0.0
+
+    def _read(self) -> None:
+        commands = sorted(self._commands)
+        # Every section starts with a marker line, since the protocols don't print their names
+        _, stdout, _ = self.client.execute('; '.join(f'echo "# {command}"; {command} show all dump' for command in commands))
+        output = stdout.read()
+
+        if isinstance(output, bytes):
+            output = output.decode('utf-8')
+
+        dumps: Dict[Tuple[str, str], list] = {}
+        command = None
+
+        for line in output.splitlines():
+            if line.startswith('# '):
+                command = line[2:].strip()
+                continue
+
+            interface_name, _, fields = line.partition('\t')
+
+            if command is not None and fields:
+                dumps.setdefault((command, interface_name), []).append(fields)
+
+        self._dumps = {key: '\n'.join(lines) + '\n' for key, lines in dumps.items()}
+        self._read_at = time.monotonic()
+
+        logging.debug(f'Read {len(self._dumps)} WireGuard interfaces with a single command')
+
+    def invalidate(self) -> None:
+        """Drops the last read, so the next request reads the host again.
+
+        Waits for a read in progress, which may have started before the state was changed.
+        """
+        with self._lock:
+            self._read_at = 0.0
+
+    def get_dump(self, command: str, interface_name: str) -> Optional[str]:
+        """Returns the state of an interface, reading the host if the last read is outdated.
+
+        Args:
+            command (str): The command of the protocol of the interface, e.g. ``wg``.
+            interface_name (str): The name of the interface.
+
+        Returns:
+            Optional[str]: The output ``<command> show <interface> dump`` would print,
+            or None if the interface is down.
+        """
+        with self._lock:
+            # A protocol missing from the last read needs a new one
+            if command not in self._commands:
+                self._commands.add(command)
+                self._read_at = 0.0
+
+            if time.monotonic() - self._read_at >= self.max_age:
+                self._read()
+
+            return self._dumps.get((command, interface_name))
@@ -0,0 +1,39 @@
+import os
+from base64 import b64decode, b64encode
+from typing import Tuple
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+
+def generate_key_pair() -> Tuple[str, str]:
+    """Generate a WireGuard private-public key pair locally, as ``wg genkey | wg pubkey`` does.
+
+    Returns:
+        Tuple[str, str]: A tuple containing base64-encoded private key and public key strings.
+    """
+    private_bytes = bytearray(os.urandom(32))
+
+    # Clamp the scalar the same way as "wg genkey", so the key looks like any other
+    private_bytes[0] &= 248
+    private_bytes[31] = (private_bytes[31] & 127) | 64
+
+    privkey = b64encode(private_bytes).decode()
+    return privkey, derive_public_key(privkey)
+
+
+def derive_public_key(privkey: str) -> str:
+    """Derive the public key of a WireGuard private key locally, as ``wg pubkey`` does.
+
+    Args:
+        privkey (str): The base64-encoded private key.
+
+    Returns:
+        str: The base64-encoded public key.
+    """
+    public_bytes = X25519PrivateKey.from_private_bytes(b64decode(privkey)).public_key().public_bytes(
+        Encoding.Raw,
+        PublicFormat.Raw,
+    )
+
+    return b64encode(public_bytes).decode()
@@ -1,17 +1,42 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
 from functools import wraps
-from typing import Callable, Any, Tuple
+from tempfile import mkstemp
+from threading import Event, Lock, RLock
+from typing import Callable, Any, List, Optional, Tuple
 
 from wgconfig import WGConfig
 
-from wireguard.client.base import BaseClient
+from wireguard.cache import cached_fact, invalidates
+from wireguard.client.base import BaseClient, content_version
+from wireguard.dump import HostDumpReader
 from wireguard.protocol.base import BaseProtocol
 from wireguard.wireguard import WireGuard
 
 
+@dataclass
+class _Mutation:
+    """A configuration change waiting to be applied with others in a single update."""
+
+    apply: Callable[[], Any]
+    done: Event = field(default_factory=Event)
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
 class Linux(WireGuard):
     """Class for a WireGuard server deployed on a Linux host."""
 
-    _TMP_CONFIG_PATH = '/tmp/wg0.conf'
+    # Attempts to apply a change while the configuration keeps being changed on the host
+    _WRITE_ATTEMPTS = 3
+
+    # Interface rates are computed from the previous health sample if it's recent enough,
+    # otherwise the counters are read twice, this many seconds apart
+    _RATE_SAMPLE_MAX_AGE = 300
+    _RATE_SAMPLE_INTERVAL = 0.5
 
     def __init__(
             self,
@@ -19,7 +44,9 @@ class Linux(WireGuard):
             protocol: BaseProtocol,
             endpoint: str,
             interface_name: str = 'wg0',
-            path_to_config: str = '/etc/wireguard/wg0.conf'
+            path_to_config: str = '/etc/wireguard/wg0.conf',
+            coalesce_window: float = 0.05,
+            dump_reader: Optional[HostDumpReader] = None,
     ) -> None:
         """Initialize a new instance of Linux WireGuard.
 
@@ -30,6 +57,11 @@ class Linux(WireGuard):
             interface_name (str, optional): The WireGuard interface name. Default is ``wg0``.
             path_to_config (str, optional): The path to the WireGuard configuration file.
                 Default is ``/etc/wireguard/wg0.conf``.
+            coalesce_window (float, optional): Seconds a peer change waits for other changes,
+                so they are all applied with a single configuration update. Default is 0.05.
+            dump_reader (Optional[HostDumpReader], optional): Reads the state of all interfaces of the host
+                at once, shared by the interfaces using the same client. Default is None, in which case
+                the interface is read on its own.
 
         Returns:
             None
@@ -39,7 +71,33 @@ class Linux(WireGuard):
         self.client = client
         self.path_to_config = path_to_config
 
-        self.wg_config = WGConfig(self._TMP_CONFIG_PATH)
+        # Every instance needs its own scratch file since configuration operations
+        # may also run from background threads
+        fd, self._tmp_config_path = mkstemp(suffix='.conf')
+        os.close(fd)
+
+        self._config_lock = RLock()
+        self.wg_config = WGConfig(self._tmp_config_path)
+
+        self.coalesce_window = coalesce_window
+        self._pending: List[_Mutation] = []
+        self._pending_lock = Lock()
+        self._batch_deadline = 0.0
+
+        self.dump_reader = dump_reader
+
+        if dump_reader is not None:
+            dump_reader.register(protocol.get_command())
+
+        # The time and the interface byte counters of the previous health sample
+        self._traffic_sample: Optional[Tuple[float, int, int]] = None
+
+    def __del__(self) -> None:
+        # The scratch file holds the whole configuration, including the private key of the interface
+        try:
+            os.unlink(self._tmp_config_path)
+        except (AttributeError, OSError):
+            pass
 
     def _generate_key_pair(self) -> Tuple[str, str]:
         """Generate a WireGuard private-public key pair.
@@ -75,58 +133,215 @@ class Linux(WireGuard):
         def decorator(method: Callable[..., Any]) -> Callable[..., Any]:
             @wraps(method)
             def wrapper(self, *args, **kwargs) -> Any:
-                with open(self._TMP_CONFIG_PATH, 'w') as f:
-                    f.write(self.client.get_file_contents(self.path_to_config))
-
-                self.wg_config.read_file()
-                result = method(self, *args, **kwargs)
+                with self._config_lock:
+                    if not rewrite_config:
+                        self._download_config()
+                        return method(self, *args, **kwargs)
 
-                if rewrite_config:
-                    self.wg_config.write_file()
+                    result = None
 
-                    with open(self._TMP_CONFIG_PATH, 'r') as f:
-                        self.client.put_file_contents(self.path_to_config, f.read())
+                    def apply() -> bool:
+                        nonlocal result
+                        result = method(self, *args, **kwargs)
+                        return True
 
-                    self.sync_config()
-
-                return result
+                    self._rewrite_config(apply)
+                    return result
 
             return wrapper
 
         return decorator
 
+    @staticmethod
+    def _queued_mutation(method: Callable[..., Any]) -> Callable[..., Any]:
+        """Decorator for peer changes applied through the mutation queue.
+
+        Changes requested within ``coalesce_window`` seconds of each other, e.g. by several admins
+        or background tasks, are applied with a single download, upload and ``syncconf``
+        of the configuration. Every caller still gets its own result or exception.
+
+        Args:
+            method (Callable[..., Any]): The method changing ``self.wg_config``.
+
+        Returns:
+            Callable[..., Any]: A decorated method that queues the change and waits for it to be applied.
+        """
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs) -> Any:
+            mutation = _Mutation(lambda: method(self, *args, **kwargs))
+
+            with self._pending_lock:
+                if not self._pending:
+                    self._batch_deadline = time.monotonic() + self.coalesce_window
+                self._pending.append(mutation)
+                deadline = self._batch_deadline
+
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+            # Whoever gets the lock first applies all pending changes, including those of the waiting callers
+            with self._config_lock:
+                if not mutation.done.is_set():
+                    with self._pending_lock:
+                        batch, self._pending = self._pending, []
+
+                    self._apply_mutations(batch)
+
+            if mutation.error is not None:
+                raise mutation.error
+
+            return mutation.result
+
+        return wrapper
+
+    def _apply_mutations(self, batch: List[_Mutation]) -> None:
+        """Apply queued changes with a single configuration update. Must be called with the config lock held.
+
+        Args:
+            batch (List[_Mutation]): The changes to apply.
+
+        Returns:
+            None
+        """
+
+        def apply() -> bool:
+            for mutation in batch:
+                mutation.error = None
+                config, lines = self.wg_config, list(self.wg_config.lines)
+
+                try:
+                    mutation.result = mutation.apply()
+                except Exception as e:
+                    mutation.error = e
+
+                    # A failed change mustn't be written along with the others, even partially
+                    self.wg_config = config
+                    config.lines = lines
+                    config.invalidate_data()
+
+            return any(mutation.error is None for mutation in batch)
+
+        try:
+            self._rewrite_config(apply)
+        except Exception as e:
+            for mutation in batch:
+                mutation.error = mutation.error or e
+        finally:
+            for mutation in batch:
+                mutation.done.set()
+
+    def _download_config(self) -> str:
+        """Download the configuration to the scratch file and read it into ``self.wg_config``.
+
+        Returns:
+            str: The version of the downloaded configuration.
+        """
+        contents = self.client.get_file_contents(self.path_to_config)
+
+        with open(self._tmp_config_path, 'w') as f:
+            f.write(contents)
+
+        self.wg_config.read_file()
+        return content_version(contents)
+
+    def _rewrite_config(self, apply: Callable[[], bool]) -> None:
+        """Apply changes to the configuration and replace it on the host, then synchronize the interface.
+
+        The configuration is replaced only if it hasn't been changed on the host since it was downloaded.
+        Otherwise, the new configuration is downloaded and the changes are applied to it again.
+
+        Args:
+            apply (Callable[[], bool]): Applies the changes to ``self.wg_config`` and returns
+                whether there is anything to write. Must be safe to call again.
+
+        Returns:
+            None
+
+        Raises:
+            RuntimeError: If the configuration was changed on the host during every attempt.
+        """
+        for _ in range(self._WRITE_ATTEMPTS):
+            version = self._download_config()
+
+            if not apply():
+                return
+
+            self.wg_config.write_file()
+
+            with open(self._tmp_config_path, 'r') as f:
+                contents = f.read()
+
+            if self.client.replace_file_contents(self.path_to_config, contents, version):
+                self.sync_config()
+                return
+
+            logging.warning(f'{self.path_to_config} was changed on the host, applying the changes again')
+
+        raise RuntimeError(f'{self.path_to_config} keeps being changed on the host')
+
+    def _read_config(self) -> dict:
+        """Parse the configuration downloaded by a ``_config_operation``.
+
+        Returns:
+            dict: The WireGuard server configuration as a dictionary.
+        """
+        with open(self._tmp_config_path, 'r') as f:
+            return self.protocol.parse_config_to_dict(f.read())
+
     def sync_config(self) -> None:
         """Synchronizes the WireGuard configuration without disrupting current peer sessions.
 
         Returns:
             None
         """
-        self.client.execute(
-            f"{self.protocol.get_command()} syncconf {self.interface_name} "
-            f"<({self.protocol.get_quick_command()} strip {self.path_to_config})"
-        )
-
+        try:
+            self.client.execute(
+                f"{self.protocol.get_command()} syncconf {self.interface_name} "
+                f"<({self.protocol.get_quick_command()} strip {self.path_to_config})"
+            )
+        finally:
+            self._invalidate_dump()
+
+    def _invalidate_dump(self) -> None:
+        """Drops the shared state of the host read before a change of the interface or its peers."""
+        if self.dump_reader is not None:
+            self.dump_reader.invalidate()
+
+    @invalidates()
     def reboot_host(self) -> None:
-        self.client.execute('reboot')
+        try:
+            self.client.execute('reboot')
+        finally:
+            self._invalidate_dump()
 
     def get_config(self, as_dict: bool = False) -> str | dict:
         _, stdout, _ = self.client.execute(f'cat {self.path_to_config}')
         config = ''.join(stdout.readlines())
         return self.protocol.parse_config_to_dict(config) if as_dict else config
 
+    @invalidates('wg_enabled')
     def set_wg_enabled(self, enabled: bool) -> None:
         state = 'up' if enabled else 'down'
-        self.client.execute(f'{self.protocol.get_quick_command()} {state} {self.interface_name}')
 
+        try:
+            self.client.execute(f'{self.protocol.get_quick_command()} {state} {self.interface_name}')
+        finally:
+            self._invalidate_dump()
+
+    @cached_fact('wg_enabled')
     def get_wg_enabled(self) -> bool:
+        if self.dump_reader is not None:
+            return self.dump_reader.get_dump(self.protocol.get_command(), self.interface_name) is not None
+
         _, stdout, _ = self.client.execute(f'{self.protocol.get_command()} show {self.interface_name}')
         return bool(stdout.readline())
 
+    @cached_fact('server_pubkey')
     def get_server_pubkey(self) -> str | None:
         _, stdout, stderr = self.client.execute(f'{self.protocol.get_command()} show {self.interface_name} public-key')
         return None if stderr.readline() else stdout.readline().strip()
 
-    def get_peers(self) -> dict:
+    def get_peers(self, names: Optional[dict] = None) -> dict:
         _, stdout, stderr = self.client.execute(f'{self.protocol.get_command()} show {self.interface_name}')
 
         if stderr.read():
@@ -139,8 +354,9 @@ class Linux(WireGuard):
 
         str_blocks = stdout_str.split('\n\n')
 
-        config = self.get_config(as_dict=True)
-        peer_names = {v.get('PublicKey', k): k for k, v in config.items()}
+        if names is None:
+            config = self.get_config(as_dict=True)
+            names = {v.get('PublicKey', k): k for k, v in config.items()}
 
         peers = {}
 
@@ -150,16 +366,178 @@ class Linux(WireGuard):
 
             if key != self.interface_name:
                 inside_dict = {k.strip(): v.strip() for k, v in (item.split(':', 1) for item in unit)}
-                peers[peer_names.get(key, key)] = inside_dict
+                peers[names.get(key, key)] = inside_dict
 
         return peers
 
-    @_config_operation(rewrite_config=True)
-    def add_peer(self, name: str) -> str:
-        server_config = self.get_config(as_dict=True)
+    @cached_fact('host_health')
+    def get_host_health(self) -> Optional[dict]:
+        previous = self._traffic_sample
+        command = 'cat /proc/loadavg /proc/uptime; nproc; cat /proc/meminfo /proc/net/dev'
+
+        resample = previous is None or time.monotonic() - previous[0] > self._RATE_SAMPLE_MAX_AGE
+
+        if resample:
+            command += f'; sleep {self._RATE_SAMPLE_INTERVAL}; cat /proc/net/dev'
+
+        _, stdout, _ = self.client.execute(command)
+        output = stdout.read()
+        now = time.monotonic()
+
+        if isinstance(output, bytes):
+            output = output.decode('utf-8')
+
+        memory = {}
+        counters = []
+
+        try:
+            lines = output.splitlines()
+            load, uptime, cpus = float(lines[0].split()[0]), float(lines[1].split()[0]), int(lines[2])
+
+            # Both /proc/meminfo and /proc/net/dev are "key: values" lines
+            for line in lines[3:]:
+                key, _, values = line.partition(':')
+                key = key.strip()
+
+                if key in ('MemTotal', 'MemAvailable'):
+                    memory[key] = int(values.split()[0]) * 1024
+                elif key == self.interface_name:
+                    fields = values.split()
+                    counters.append((int(fields[0]), int(fields[8])))
+        except (IndexError, ValueError) as e:
+            logging.debug(f'Unable to parse the host health: {e!r}')
+            return None
+
+        rx_rate = tx_rate = None
+
+        if counters:
+            if resample:
+                start, elapsed = counters[0], self._RATE_SAMPLE_INTERVAL
+            else:
+                start, elapsed = previous[1:], now - previous[0]
+
+            delta_rx, delta_tx = counters[-1][0] - start[0], counters[-1][1] - start[1]
+
+            # The counters start over when the interface is recreated
+            if (len(counters) > 1 or not resample) and elapsed > 0 and delta_rx >= 0 and delta_tx >= 0:
+                rx_rate, tx_rate = delta_rx / elapsed, delta_tx / elapsed
+
+            self._traffic_sample = (now, *counters[-1])
+
+        return {
+            'cpu_load': load / max(cpus, 1) * 100,
+            'memory_used': memory.get('MemTotal', 0) - memory.get('MemAvailable', 0),
+            'memory_total': memory.get('MemTotal', 0),
+            'uptime': uptime,
+            'rx_rate': rx_rate,
+            'tx_rate': tx_rate,
+        }
+
+    def get_config_version(self) -> Optional[str]:
+        _, stdout, stderr = self.client.execute(f'sha256sum {self.path_to_config}')
+
+        if stderr.read():
+            return None
+
+        output = stdout.readline().split()
+        return output[0] if output else None
+
+    @_config_operation()
+    def get_peers_metadata(self) -> dict:
+        config = self._read_config()
+
+        # The names are kept in comments, which only the protocol knows how to read
+        names = {section.get('PublicKey'): name for name, section in config.items() if name != 'Interface'}
+        peers = self.wg_config.get_peers(keys_only=False, include_disabled=True, include_details=True)
+
+        return {
+            pubkey: {
+                'name': names.get(pubkey, pubkey),
+                'address': peer.get('AllowedIPs'),
+                'enabled': not peer.get('_disabled', False),
+                'id': None,
+            }
+            for pubkey, peer in peers.items()
+        }
+
+    def get_peers_stats(self) -> dict:
+        if self.dump_reader is not None:
+            return self._parse_dump(self.dump_reader.get_dump(self.protocol.get_command(), self.interface_name) or '')
+
+        _, stdout, stderr = self.client.execute(f'{self.protocol.get_command()} show {self.interface_name} dump')
+        return self._parse_dump(self._read_output(stdout, stderr))
+
+    async def get_peers_stats_async(self) -> dict:
+        # The shared read serves the other interfaces of the host as well, so it's done in a thread
+        if self.dump_reader is not None:
+            return await asyncio.to_thread(self.get_peers_stats)
+
+        command = f'{self.protocol.get_command()} show {self.interface_name} dump'
+        _, stdout, stderr = await self.client.execute_async(command)
+        return self._parse_dump(self._read_output(stdout, stderr))
+
+    @staticmethod
+    def _read_output(stdout: Any, stderr: Any) -> str:
+        """Read the output of a command.
+
+        Args:
+            stdout (Any): The standard output stream of the command.
+            stderr (Any): The standard error stream of the command.
+
+        Returns:
+            str: The standard output, or an empty string if the command reported an error.
+        """
+        if stderr.read():
+            return ''
+
+        output = stdout.read()
+        return output.decode('utf-8') if isinstance(output, bytes) else output
+
+    @staticmethod
+    def _parse_dump(dump: str) -> dict:
+        """Parse the output of ``wg show <interface> dump``.
+
+        Args:
+            dump (str): The output of the command.
+
+        Returns:
+            dict: The peer statistics as returned by ``get_peers_stats``.
+        """
+        peers = {}
+
+        # The first line describes the interface itself, the rest are tab-separated peer lines
+        for line in dump.splitlines()[1:]:
+            pubkey, _, endpoint, allowed_ips, handshake, rx, tx, _ = line.split('\t')
+            peers[pubkey] = {
+                'endpoint': None if endpoint == '(none)' else endpoint,
+                'allowed_ips': allowed_ips,
+                'latest_handshake': int(handshake),
+                'rx': int(rx),
+                'tx': int(tx),
+            }
 
+        return peers
+
+    def add_peer(self, name: str) -> str:
+        # The keys are generated once, even if the peer has to be added to a newer configuration again
         privkey, pubkey = self._generate_key_pair()
-        peer_ip = self.get_available_ip(server_config)
+        return self._add_peer(name, privkey, pubkey)
+
+    @_config_operation(rewrite_config=True)
+    def _add_peer(self, name: str, privkey: str, pubkey: str) -> str:
+        """Add a peer with the given keys to the downloaded configuration.
+
+        Args:
+            name (str): The name of the peer.
+            privkey (str): The private key of the peer.
+            pubkey (str): The public key of the peer.
+
+        Returns:
+            str: The WireGuard client configuration for the new peer.
+        """
+        # The configuration has just been downloaded by the decorator
+        server_config = self._read_config()
+        peer_ip = self.get_available_ip(server_config, self.reserved_ips)
         server_pubkey = self.get_server_pubkey()
         server_port = server_config.get('Interface').get('ListenPort')
 
@@ -177,21 +555,50 @@ class Linux(WireGuard):
 
         return client_config
 
-    @_config_operation(rewrite_config=True)
+    @_queued_mutation
+    def commit_peer(self, name: str, privkey: str, pubkey: str, address: str) -> None:
+        # The configuration may have been changed on the host since the address was reserved
+        peers = self.wg_config.get_peers(keys_only=False, include_disabled=True)
+
+        if any(peer.get('AllowedIPs') == address for peer in peers.values()):
+            raise ValueError(f'The address {address} is already in use')
+
+        self.wg_config = self.protocol.add_peer(self.wg_config, pubkey, name)
+        self.wg_config.add_attr(pubkey, 'AllowedIPs', address)
+
+    @_queued_mutation
     def delete_peer(self, pubkey: str) -> None:
         self.wg_config.del_peer(pubkey)
 
-    @_config_operation(rewrite_config=True)
+    def _existing_peers(self, pubkeys: list[str]) -> list[str]:
+        """Filter out the peers missing from the configuration, e.g. removed on the host by hand."""
+        peers = self.wg_config.get_peers(keys_only=True, include_disabled=True)
+        return [pubkey for pubkey in pubkeys if pubkey in peers]
+
+    @_queued_mutation
+    def delete_peers(self, pubkeys: list[str]) -> None:
+        for pubkey in self._existing_peers(pubkeys):
+            self.wg_config.del_peer(pubkey)
+
+    @_queued_mutation
     def set_peer_enabled(self, pubkey: str, enabled: bool) -> None:
         if enabled:
             self.wg_config.enable_peer(pubkey)
         else:
             self.wg_config.disable_peer(pubkey)
 
+    @_queued_mutation
+    def set_peers_enabled(self, pubkeys: list[str], enabled: bool) -> None:
+        for pubkey in self._existing_peers(pubkeys):
+            if enabled:
+                self.wg_config.enable_peer(pubkey)
+            else:
+                self.wg_config.disable_peer(pubkey)
+
     @_config_operation()
     def get_peer_enabled(self, pubkey: str) -> bool:
         return self.wg_config.get_peer_enabled(pubkey)
 
-    @_config_operation(rewrite_config=True)
+    @_queued_mutation
     def rename_peer(self, pubkey: str, new_name: str) -> None:
         self.wg_config = self.protocol.rename_peer(self.wg_config, pubkey, new_name)
@@ -1,18 +1,33 @@
 import logging
+import re
+import time
 from functools import wraps
+from threading import local
 from typing import Any, Callable
 
 from humanize import naturalsize
 from routeros_api import RouterOsApiPool
-from routeros_api.exceptions import RouterOsApiConnectionError
+from routeros_api.api import RouterOsApi
+from routeros_api.exceptions import RouterOsApiCommunicationError, RouterOsApiConnectionError
 
+from wireguard.cache import cached_fact, invalidates
+from wireguard.connection_pool import RouterOSConnectionPool
 from wireguard.protocol.base import BaseProtocol
+from wireguard.subscription import PeerSubscription
 from wireguard.wireguard import WireGuard
 
 
 class RouterOS(WireGuard):
     """Class for WireGuard server deployed on RouterOS."""
 
+    # The interface record also holds its state, so it's kept only briefly. The peers are kept
+    # longer, since the bot updates them after its own changes
+    FACT_TTLS = WireGuard.FACT_TTLS | {'interface': 5, 'peers': 300}
+
+    _PEER_PROPERTIES = '.id,name,public-key,allowed-address,disabled'
+
+    _DURATION_UNITS = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+
     def __init__(
             self,
             server: str,
@@ -22,6 +37,9 @@ class RouterOS(WireGuard):
             protocol: BaseProtocol,
             endpoint: str,
             interface_name: str = 'wireguard1',
+            subscribe: bool = False,
+            resync_interval: float = 300,
+            pool_size: int = 4,
     ) -> None:
         """Initialize a new instance of the RouterOS WireGuard client.
 
@@ -33,6 +51,11 @@ class RouterOS(WireGuard):
             protocol (BaseProtocol): The WireGuard protocol.
             endpoint (str): The WireGuard server endpoint.
             interface_name (str, optional): The WireGuard interface name. Default is ``wireguard1``.
+            subscribe (bool, optional): Keep the peers up to date by listening to the changes pushed
+                by the router over a second connection, instead of requesting them. Default is False.
+            resync_interval (float, optional): Seconds between two full reads of the peers
+                when subscribed. Default is 300.
+            pool_size (int, optional): The maximum number of API sessions opened at the same time. Default is 4.
 
         Returns:
             None
@@ -44,18 +67,34 @@ class RouterOS(WireGuard):
         self.username = username
         self.password = password
 
-        self.connection = None
-        self.api = None
+        self.pool = RouterOSConnectionPool(self._create_connection, size=pool_size)
+        self.subscription = None
+
+        # Every thread calling the server uses its own connection from the pool
+        self._local = local()
 
         self.connect()
 
+        if subscribe:
+            self.subscription = PeerSubscription(self._create_connection, interface_name, resync_interval)
+            self.subscription.start()
+
     def __del__(self):
-        self.connection.disconnect()
+        if self.subscription is not None:
+            self.subscription.stop()
+
+        self.pool.close()
+
+    @property
+    def api(self) -> RouterOsApi | None:
+        """The API of the connection lent to the current call, None outside of a call."""
+        return getattr(self._local, 'api', None)
 
     @staticmethod
     def _exception_handler(func: Callable) -> Callable:
-        """Decorator to handle RouterOS API connection errors.
-        Reconnects and retries the function once if a connection error occurs.
+        """Decorator lending a pooled connection to the function as ``self.api``.
+        Retries the function once on another connection if a connection error occurs,
+        the broken connection is closed. Other errors are raised to the caller.
 
         Args:
             func (Callable): The function that might raise a connection error.
@@ -66,14 +105,24 @@ class RouterOS(WireGuard):
 
         @wraps(func)
         def wrapper(self, *args: Any, **kwargs: Any) -> Any:
-            try:
+            # Nested calls use the connection of the outermost one
+            if self.api is not None:
                 return func(self, *args, **kwargs)
-            except RouterOsApiConnectionError:
-                logging.warning('RouterOS API connection error, reconnecting...')
-                self.connect()
-                return func(self, *args, **kwargs)
-            except Exception as e:
-                logging.exception(f'An unexpected error occurred: {e}')
+
+            for attempt in range(2):
+                try:
+                    with self.pool.connection() as api:
+                        self._local.api = api
+
+                        try:
+                            return func(self, *args, **kwargs)
+                        finally:
+                            self._local.api = None
+                except RouterOsApiConnectionError:
+                    if attempt:
+                        raise
+
+                    logging.warning('RouterOS API connection error, reconnecting...')
 
         return wrapper
 
@@ -97,6 +146,30 @@ class RouterOS(WireGuard):
 
         return '\n'.join(lines) + '\n'
 
+    @classmethod
+    def _parse_duration(cls, value: str | None) -> int | None:
+        """Convert a RouterOS duration string to seconds.
+
+        Both the ``1w2d3h4m5s`` and the ``01:02:03`` notations are supported.
+
+        Args:
+            value (str | None): The duration string, e.g. the ``last-handshake`` peer property.
+
+        Returns:
+            int | None: The duration in seconds, or None if the value is empty.
+        """
+        if not value:
+            return None
+
+        if ':' in value:
+            days, _, clock = value.rpartition('d')
+            hours, minutes, seconds = clock.split(':')
+            return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+
+        units = re.findall(r'(\d+)(ms|[wdhms])', value)
+        return int(sum(int(amount) * cls._DURATION_UNITS[unit] for amount, unit in units))
+
+    @cached_fact('interface')
     @_exception_handler
     def _get_interface(self) -> dict[str, Any] | None:
         """Retrieve the WireGuard interface details by its name.
@@ -108,6 +181,52 @@ class RouterOS(WireGuard):
         return interface[0] if interface else None
 
     @_exception_handler
+    def _read_peers(self) -> list[dict[str, Any]]:
+        """Retrieve all properties of all peers, including the traffic counters.
+
+        The router is always requested, since the subscription isn't notified about every change
+        of the counters, and the handshake times it received are relative to when they were sent.
+
+        Returns:
+            list[dict[str, Any]]: The peer records.
+        """
+        return self.api.get_resource('/interface/wireguard/peers').get(interface=self.interface_name)
+
+    @_exception_handler
+    def _fetch_peers(self) -> dict[str, dict[str, Any]] | None:
+        """Retrieve the static properties of all peers with a single request and cache them.
+
+        Returns:
+            dict[str, dict[str, Any]] | None: The ``id``, ``name``, ``public-key``, ``allowed-address``
+            and ``disabled`` properties of the peers keyed by public key, or None if an error occurred.
+        """
+        raw_peers = self.subscription.get_peers() if self.subscription is not None else None
+
+        if raw_peers is None:
+            raw_peers = self.api.get_resource('/interface/wireguard/peers').call(
+                'print',
+                {'proplist': self._PEER_PROPERTIES},
+                {'interface': self.interface_name},
+            )
+
+        peers = {peer.get('public-key'): peer for peer in raw_peers}
+        self.facts.set('peers', peers)
+        return peers
+
+    def _get_peers(self) -> dict[str, dict[str, Any]] | None:
+        """Retrieve the static properties of all peers, from the cache if possible.
+
+        The cached peers are updated in place by the methods changing them. A live subscription
+        is always up to date, so it's preferred over the cache.
+
+        Returns:
+            dict[str, dict[str, Any]] | None: The peer properties keyed by public key, as returned by ``_fetch_peers``.
+        """
+        if self.subscription is not None and self.subscription.live:
+            return self._fetch_peers()
+
+        return self.facts.get('peers', self._fetch_peers)
+
     def _get_peer(self, pubkey: str) -> dict[str, Any] | None:
         """Retrieve the WireGuard peer details by its public key.
 
@@ -117,11 +236,40 @@ class RouterOS(WireGuard):
         Returns:
             dict[str, Any] | None: A dictionary containing the peer details if found, otherwise None.
         """
-        peer = self.api.get_resource('/interface/wireguard/peers').get(public_key=pubkey)
-        return peer[0] if peer else None
+        peer = (self._get_peers() or {}).get(pubkey)
 
-    def connect(self) -> None:
-        self.connection = RouterOsApiPool(
+        # The peer may have been added on the router after the peers were cached
+        if peer is None:
+            peer = (self._fetch_peers() or {}).get(pubkey)
+
+        return peer
+
+    def _update_peer(self, pubkey: str, action: Callable[[dict[str, Any]], None]) -> None:
+        """Apply an action to a cached peer, reloading the peers once if its cached ID is outdated.
+
+        Args:
+            pubkey (str): The public key of the peer.
+            action (Callable[[dict[str, Any]], None]): Changes the peer on the router and in the cache.
+
+        Returns:
+            None
+        """
+        peer = self._get_peer(pubkey)
+
+        if peer is None:
+            return
+
+        try:
+            action(peer)
+        except RouterOsApiCommunicationError:
+            # The peer may have been removed and created again on the router
+            peer = (self._fetch_peers() or {}).get(pubkey)
+
+            if peer is not None:
+                action(peer)
+
+    def _create_connection(self) -> RouterOsApiPool:
+        return RouterOsApiPool(
             host=self.server,
             username=self.username,
             password=self.password,
@@ -129,33 +277,34 @@ class RouterOS(WireGuard):
             plaintext_login=True,
         )
 
-        self.connection.set_timeout(5)
-
-        try:
-            self.api = self.connection.get_api()
-        except RouterOsApiConnectionError as e:
-            raise ConnectionError(f'Error connecting to RouterOS API: {e}')
+    def connect(self) -> None:
+        # The first connection is opened right away, so an unreachable router is reported on creation
+        with self.pool.connection():
+            pass
 
+    @invalidates()
     @_exception_handler
     def reboot_host(self) -> None:
         self.api.get_binary_resource('/').call('system/reboot')
 
+    @cached_fact('interface_config')
     @_exception_handler
-    def get_config(self, as_dict: bool = False) -> str | dict:
+    def get_interface_config(self) -> dict | None:
         interface = self._get_interface()
         address = self.api.get_resource('/ip/address').get(interface=self.interface_name)[0]
 
-        config = {
-            'Interface': {
-                'PrivateKey': interface.get('private-key'),
-                'ListenPort': interface.get('listen-port'),
-                'Address': address.get('address'),
-            }
+        return {
+            'PrivateKey': interface.get('private-key'),
+            'ListenPort': interface.get('listen-port'),
+            'Address': address.get('address'),
         }
 
-        peers = self.api.get_resource('/interface/wireguard/peers').get(interface=self.interface_name)
+    @_exception_handler
+    def get_config(self, as_dict: bool = False) -> str | dict:
+        config = {'Interface': dict(self.get_interface_config())}
 
-        for peer in peers:
+        # The peers are always requested, since new addresses are chosen based on them
+        for peer in self._fetch_peers().values():
             peer_name = peer.get('name')
             config[peer_name] = {
                 'PublicKey': peer.get('public-key'),
@@ -164,6 +313,7 @@ class RouterOS(WireGuard):
 
         return config if as_dict else self._format_config_as_string(config)
 
+    @invalidates('interface')
     @_exception_handler
     def set_wg_enabled(self, enabled: bool) -> None:
         interface = self._get_interface()
@@ -177,15 +327,49 @@ class RouterOS(WireGuard):
         interface = self._get_interface()
         return bool(interface and interface.get('disabled') == 'false')
 
+    @cached_fact('server_pubkey')
     def get_server_pubkey(self) -> str | None:
         interface = self._get_interface()
         if interface:
             return interface.get('public-key')
         return None
 
+    @cached_fact('host_health')
     @_exception_handler
-    def get_peers(self) -> dict:
-        raw_peers = self.api.get_resource('/interface/wireguard/peers').get(interface=self.interface_name)
+    def get_host_health(self) -> dict | None:
+        # Both commands are sent before any reply is read, so they take a single round trip
+        resource_reply = self.api.get_resource('/system/resource').call_async('print')
+        traffic_reply = self.api.get_resource('/interface').call_async(
+            'monitor-traffic',
+            {'interface': self.interface_name, 'once': ''},
+        )
+
+        resource = resource_reply.get()[0]
+
+        try:
+            traffic = traffic_reply.get()[0]
+        except (IndexError, RouterOsApiCommunicationError):
+            traffic = {}
+
+        total_memory = int(resource.get('total-memory', 0))
+        rx_bits, tx_bits = traffic.get('rx-bits-per-second'), traffic.get('tx-bits-per-second')
+
+        return {
+            'cpu_load': float(resource.get('cpu-load', 0)),
+            'memory_used': total_memory - int(resource.get('free-memory', 0)),
+            'memory_total': total_memory,
+            'uptime': self._parse_duration(resource.get('uptime')) or 0,
+            'rx_rate': int(rx_bits) / 8 if rx_bits is not None else None,
+            'tx_rate': int(tx_bits) / 8 if tx_bits is not None else None,
+        }
+
+    def get_config_version(self) -> str | None:
+        # Only a live subscription knows whether the peers have changed without requesting them
+        return self.subscription.version if self.subscription is not None else None
+
+    @_exception_handler
+    def get_peers(self, names: dict | None = None) -> dict:
+        raw_peers = self._read_peers()
 
         return {
             peer['name']: {
@@ -197,10 +381,63 @@ class RouterOS(WireGuard):
             for peer in raw_peers
         }
 
+    @_exception_handler
+    def get_peers_metadata(self) -> dict:
+        # Only the static properties are requested, the traffic counters change all the time
+        return {
+            pubkey: {
+                'name': peer.get('name'),
+                'address': peer.get('allowed-address'),
+                'enabled': peer.get('disabled') != 'true',
+                'id': peer.get('id'),
+            }
+            for pubkey, peer in self._fetch_peers().items()
+        }
+
+    @_exception_handler
+    def get_peers_stats(self) -> dict:
+        raw_peers = self._read_peers()
+        now = int(time.time())
+        peers = {}
+
+        for peer in raw_peers:
+            # Disabled peers are not part of the runtime state, as with "wg show" on Linux
+            if peer.get('disabled') == 'true':
+                continue
+
+            address = peer.get('current-endpoint-address')
+            handshake = self._parse_duration(peer.get('last-handshake'))
+
+            peers[peer.get('public-key')] = {
+                'name': peer.get('name'),
+                'endpoint': f'{address}:{peer.get('current-endpoint-port')}' if address else None,
+                'allowed_ips': peer.get('allowed-address'),
+                'latest_handshake': now - handshake if handshake is not None else 0,
+                'rx': int(peer.get('rx', 0)),
+                'tx': int(peer.get('tx', 0)),
+            }
+
+        return peers
+
+    def _cache_peer(self, peer: dict[str, Any]) -> None:
+        """Add a peer created by the bot to the cached peers.
+
+        Args:
+            peer (dict[str, Any]): The peer properties as returned by the router.
+
+        Returns:
+            None
+        """
+        peers = self._get_peers()
+
+        if peers is not None:
+            peers[peer['public-key']] = {
+                key: peer.get(key) for key in ('id', 'name', 'public-key', 'allowed-address', 'disabled')
+            }
+
     @_exception_handler
     def add_peer(self, name: str) -> str:
         server_config = self.get_config(as_dict=True)
-        interface = self._get_interface()
 
         peers_resource = self.api.get_resource('/interface/wireguard/peers')
 
@@ -208,36 +445,122 @@ class RouterOS(WireGuard):
             name=name,
             interface=self.interface_name,
             private_key='auto',
-            allowed_address=self.get_available_ip(server_config),
+            allowed_address=self.get_available_ip(server_config, self.reserved_ips),
         )
 
         peer = peers_resource.get(name=name)[0]
+        self._cache_peer(peer)
 
         client_config = self.protocol.build_client_config(
             privkey=peer.get('private-key'),
             address=peer.get('allowed-address'),
             server_pubkey=self.get_server_pubkey(),
             endpoint=self.endpoint,
-            server_port=interface.get('listen-port'),
+            server_port=server_config['Interface'].get('ListenPort'),
             server_config=server_config,
         )
 
         return client_config
 
+    @_exception_handler
+    def commit_peer(self, name: str, privkey: str, pubkey: str, address: str) -> None:
+        response = self.api.get_resource('/interface/wireguard/peers').add(
+            name=name,
+            interface=self.interface_name,
+            public_key=pubkey,
+            private_key=privkey,
+            allowed_address=address,
+        )
+
+        # The router replies with the ID of the new peer
+        peer_id = getattr(response, 'done_message', {}).get('ret')
+
+        if peer_id:
+            self._cache_peer({
+                'id': peer_id,
+                'name': name,
+                'public-key': pubkey,
+                'allowed-address': address,
+                'disabled': 'false',
+            })
+        else:
+            self.facts.invalidate('peers')
+
     @_exception_handler
     def delete_peer(self, pubkey: str) -> None:
-        peer = self._get_peer(pubkey)
-        if peer:
+        def remove(peer: dict[str, Any]) -> None:
             self.api.get_resource('/interface/wireguard/peers').remove(id=peer['id'])
+            (self._get_peers() or {}).pop(pubkey, None)
+
+        self._update_peer(pubkey, remove)
+
+    def _update_peers(self, pubkeys: list[str], action: Callable[[str], None]) -> None:
+        """Apply an action to several cached peers at once, reloading the peers once if any of them
+        is missing or has an outdated ID.
+
+        Args:
+            pubkeys (list[str]): The public keys of the peers.
+            action (Callable[[str], None]): Changes the peers with the given comma-separated IDs,
+                as accepted by the ``set`` and ``remove`` commands.
+
+        Returns:
+            None
+        """
+        peers = self._get_peers() or {}
+
+        if any(pubkey not in peers for pubkey in pubkeys):
+            peers = self._fetch_peers() or {}
+
+        peer_ids = ','.join(peers[pubkey]['id'] for pubkey in pubkeys if pubkey in peers)
+
+        if not peer_ids:
+            return
+
+        try:
+            action(peer_ids)
+        except RouterOsApiCommunicationError:
+            peers = self._fetch_peers() or {}
+            peer_ids = ','.join(peers[pubkey]['id'] for pubkey in pubkeys if pubkey in peers)
+
+            if peer_ids:
+                action(peer_ids)
+
+    @_exception_handler
+    def delete_peers(self, pubkeys: list[str]) -> None:
+        def remove(peer_ids: str) -> None:
+            self.api.get_resource('/interface/wireguard/peers').remove(id=peer_ids)
+            peers = self._get_peers() or {}
+
+            for pubkey in pubkeys:
+                peers.pop(pubkey, None)
+
+        self._update_peers(pubkeys, remove)
 
     @_exception_handler
     def set_peer_enabled(self, pubkey: str, enabled: bool) -> None:
-        peer = self._get_peer(pubkey)
-        if peer:
+        def update(peer: dict[str, Any]) -> None:
             self.api.get_resource('/interface/wireguard/peers').set(
                 id=peer['id'],
                 disabled='no' if enabled else 'yes'
             )
+            peer['disabled'] = 'false' if enabled else 'true'
+
+        self._update_peer(pubkey, update)
+
+    @_exception_handler
+    def set_peers_enabled(self, pubkeys: list[str], enabled: bool) -> None:
+        def update(peer_ids: str) -> None:
+            self.api.get_resource('/interface/wireguard/peers').set(
+                id=peer_ids,
+                disabled='no' if enabled else 'yes'
+            )
+            peers = self._get_peers() or {}
+
+            for pubkey in pubkeys:
+                if pubkey in peers:
+                    peers[pubkey]['disabled'] = 'false' if enabled else 'true'
+
+        self._update_peers(pubkeys, update)
 
     def get_peer_enabled(self, pubkey: str) -> bool:
         peer = self._get_peer(pubkey)
@@ -247,9 +570,11 @@ class RouterOS(WireGuard):
 
     @_exception_handler
     def rename_peer(self, pubkey: str, new_name: str) -> None:
-        peer = self._get_peer(pubkey)
-        if peer:
+        def update(peer: dict[str, Any]) -> None:
             self.api.get_resource('/interface/wireguard/peers').set(
                 id=peer['id'],
                 name=new_name
             )
+            peer['name'] = new_name
+
+        self._update_peer(pubkey, update)
@@ -0,0 +1,179 @@
+import logging
+import socket
+import time
+import uuid
+from threading import Event, Lock, Thread
+from typing import Any, Callable
+
+from routeros_api import RouterOsApiPool
+from routeros_api.exceptions import RouterOsApiConnectionError
+
+
+class PeerSubscription:
+    """Mirrors the WireGuard peers of a RouterOS interface by listening to the changes pushed by the router.
+
+    The peers are read once per connection, after which the ``listen`` command streams every change.
+    Only the static properties of the peers are reliable, the traffic counters and the handshake times,
+    relative to when they were sent, are outdated between the changes. A listening connection can't serve other requests,
+    so the subscription opens its own. The peers are read again every ``resync_interval`` seconds
+    in case an update was lost, and while the connection is down ``get_peers`` returns None,
+    so the caller falls back to requesting the router.
+    """
+
+    _PATH = '/interface/wireguard/peers'
+
+    def __init__(
+            self,
+            connect: Callable[[], RouterOsApiPool],
+            interface_name: str,
+            resync_interval: float = 300,
+            max_backoff: float = 60,
+    ) -> None:
+        """Initializes the PeerSubscription instance.
+
+        Args:
+            connect (Callable[[], RouterOsApiPool]): Creates a new connection to the router.
+            interface_name (str): The WireGuard interface name.
+            resync_interval (float): Seconds between two full reads of the peers. Defaults to 300.
+            max_backoff (float): The maximum number of seconds between two reconnection attempts. Defaults to 60.
+        """
+        self.connect = connect
+        self.interface_name = interface_name
+        self.resync_interval = resync_interval
+        self.max_backoff = max_backoff
+
+        self._peers: dict[str, dict[str, Any]] = {}
+        self._live = False
+        self._version = 0
+        # Distinguishes the versions of two subscriptions, e.g. before and after a restart of the bot
+        self._session = uuid.uuid4().hex[:8]
+
+        self._lock = Lock()
+        self._stopped = Event()
+        self._connection: RouterOsApiPool | None = None
+        self._thread: Thread | None = None
+
+    @property
+    def live(self) -> bool:
+        return self._live
+
+    @property
+    def version(self) -> str | None:
+        """A value changing with every change of the peers, or None while the subscription isn't live."""
+        with self._lock:
+            return f'{self._session}:{self._version}' if self._live else None
+
+    def get_peers(self) -> list[dict[str, Any]] | None:
+        """Returns the peers as last reported by the router.
+
+        Returns:
+            list[dict[str, Any]] | None: Copies of the peer records, as returned by the ``print`` command,
+            or None while the subscription isn't live.
+        """
+        with self._lock:
+            if not self._live:
+                return None
+
+            return [dict(peer) for peer in self._peers.values()]
+
+    def start(self) -> None:
+        """Starts listening in a background thread."""
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name=f'routeros-listen-{self.interface_name}', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stops listening and closes the connection."""
+        self._stopped.set()
+
+        with self._lock:
+            self._live = False
+
+        # Shutting the socket down interrupts the blocked read
+        if (connection := self._connection) is not None:
+            try:
+                # The pool wraps the socket of the connection
+                connection.socket.socket.shutdown(socket.SHUT_RDWR)
+            except (AttributeError, OSError):
+                pass
+
+    def _run(self) -> None:
+        backoff = 1.0
+
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception as e:
+                if self._stopped.is_set():
+                    break
+
+                if self._live:
+                    logging.warning(
+                        f'RouterOS peer subscription of "{self.interface_name}" interrupted, '
+                        f'requesting the router until it is restored: {e!r}'
+                    )
+
+                with self._lock:
+                    self._live = False
+
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                if self._connection is not None:
+                    self._connection.disconnect()
+                    self._connection = None
+
+    def _listen(self) -> None:
+        """Reads the peers and applies the changes until a full read is due again."""
+        self._connection = self.connect()
+        # A quiet router is read again once the socket times out
+        self._connection.set_timeout(self.resync_interval)
+        resource = self._connection.get_api().get_resource(self._PATH)
+
+        # The changes are requested first, so none made during the full read are missed.
+        # Changes received before the read reply are applied after it, which ends in the same state
+        changes = iter(resource.call_async('listen'))
+        peers = {peer['id']: peer for peer in resource.get(interface=self.interface_name)}
+        synced_at = time.monotonic()
+
+        with self._lock:
+            self._peers = peers
+            self._version += 1
+            self._live = True
+
+        logging.debug(f'RouterOS peer subscription of "{self.interface_name}": {len(peers)} peers')
+
+        while time.monotonic() - synced_at < self.resync_interval:
+            try:
+                change = next(changes)
+            except StopIteration:
+                raise RouterOsApiConnectionError('The router ended the subscription')
+            except RouterOsApiConnectionError:
+                if self._stopped.is_set() or time.monotonic() - synced_at < self.resync_interval:
+                    raise
+                # The socket timed out without any change
+                return
+
+            self._apply(change)
+
+    def _apply(self, change: dict[str, Any]) -> None:
+        """Applies a change reported by the router.
+
+        Args:
+            change (dict[str, Any]): The changed peer record, or its ID along with ``.dead`` if it was removed.
+        """
+        peer_id = change.get('id')
+
+        if peer_id is None:
+            return
+
+        with self._lock:
+            if change.get('.dead') in ('yes', 'true', True) or change.get('interface') != self.interface_name:
+                # A peer moved to another interface is gone as well
+                if self._peers.pop(peer_id, None) is None:
+                    return
+            else:
+                self._peers[peer_id] = change
+
+            self._version += 1
@@ -1,13 +1,24 @@
+import asyncio
+import math
 from abc import ABC, abstractmethod
 from ipaddress import IPv4Interface, IPv4Address
-from typing import Optional
+from typing import Collection, Optional
 
+from wireguard.cache import FactCache, cached_fact
 from wireguard.protocol.base import BaseProtocol
 
 
 class WireGuard(ABC):
     """Abstract base class for all WireGuard implementations."""
 
+    # Seconds the facts read by the ``cached_fact`` methods are kept for
+    FACT_TTLS = {
+        'server_pubkey': math.inf,
+        'interface_config': 600,
+        'wg_enabled': 5,
+        'host_health': 10,
+    }
+
     def __init__(
             self,
             protocol: BaseProtocol,
@@ -28,12 +39,19 @@ class WireGuard(ABC):
         self.endpoint = endpoint
         self.interface_name = interface_name
 
+        # Addresses promised to pre-provisioned peers, which must not be given to new peers
+        self.reserved_ips: set[str] = set()
+
+        self.facts = FactCache(self.FACT_TTLS)
+
     @staticmethod
-    def get_available_ip(config: dict) -> Optional[str]:
+    def get_available_ip(config: dict, exclude: Collection[str] = ()) -> Optional[str]:
         """Get an available IP address based on the provided configuration.
 
         Args:
             config (dict): A dictionary containing network configuration data.
+            exclude (Collection[str], optional): Addresses in the format 'X.X.X.X/32'
+                to be treated as used, e.g. reserved ones.
 
         Returns:
             Optional[str]: The next available IP address in the format 'X.X.X.X/32',
@@ -47,18 +65,42 @@ class WireGuard(ABC):
         network = interface_ip.network
 
         # Extract all used IP addresses and convert them to IPv4Address objects
-        used_ips = [IPv4Address(config[key]['AllowedIPs'].split('/')[0]) for key in config if
-                    key != 'Interface']
+        used_ips = {IPv4Address(config[key]['AllowedIPs'].split('/')[0]) for key in config if
+                    key != 'Interface'}
 
         # Iterate through the possible IP range in the network and find the first available IP,
-        # skipping the interface IP.
+        # skipping the interface IP. The excluded addresses are only tested for membership,
+        # since they may be changed by another thread.
         for ip in network.hosts():
-            if ip != interface_ip.ip and ip not in used_ips:
+            if ip != interface_ip.ip and ip not in used_ips and f'{ip}/32' not in exclude:
                 return f'{ip}/32'
 
         # If no available IP is found, return None
         return None
 
+    @staticmethod
+    def count_available_ips(config: dict, exclude: Collection[str] = ()) -> int:
+        """Count the addresses ``get_available_ip`` can still give to new peers.
+
+        Args:
+            config (dict): A dictionary containing network configuration data.
+            exclude (Collection[str], optional): Addresses in the format 'X.X.X.X/32'
+                to be treated as used, e.g. reserved ones.
+
+        Returns:
+            int: The number of free host addresses in the interface subnet.
+        """
+        interface_ip = IPv4Interface(config['Interface']['Address'])
+        network = interface_ip.network
+        hosts = network.num_addresses - 2 if network.prefixlen < 31 else network.num_addresses
+
+        used_ips = {IPv4Address(config[key]['AllowedIPs'].split('/')[0]) for key in config if key != 'Interface'}
+        used_ips.add(interface_ip.ip)
+        # Copied at once, since the excluded addresses may be changed by another thread
+        used_ips.update(IPv4Address(address.split('/')[0]) for address in set(exclude))
+
+        return max(hosts - sum(ip in network for ip in used_ips), 0)
+
     @abstractmethod
     def reboot_host(self) -> None:
         """Reboot the host system.
@@ -79,6 +121,19 @@ class WireGuard(ABC):
             str | dict: The WireGuard server configuration.
         """
 
+    @cached_fact('interface_config')
+    def get_interface_config(self) -> Optional[dict]:
+        """Get the ``Interface`` section of the WireGuard server configuration.
+
+        Unlike ``get_config``, the result is cached, since the interface settings rarely change.
+
+        Returns:
+            Optional[dict]: The interface settings, such as ``ListenPort`` and ``Address``,
+            or None if an error occurred.
+        """
+        config = self.get_config(as_dict=True)
+        return config.get('Interface') if config else None
+
     @abstractmethod
     def set_wg_enabled(self, enabled: bool) -> None:
         """Enable or disable the WireGuard interface.
@@ -107,13 +162,76 @@ class WireGuard(ABC):
         """
 
     @abstractmethod
-    def get_peers(self) -> dict:
+    def get_peers(self, names: Optional[dict] = None) -> dict:
         """Get a list of all configured peers.
 
+        Args:
+            names (dict, optional): Peer names keyed by public key. If not given,
+                the names are looked up on the server if needed.
+
         Returns:
             list: A list of peer.
         """
 
+    def get_config_version(self) -> Optional[str]:
+        """Get a fingerprint of the configuration that changes whenever the configuration does.
+
+        Implementations should override this method if the fingerprint is cheaper to get
+        than the peers themselves.
+
+        Returns:
+            Optional[str]: The fingerprint, or None if the configuration has to be read to find out.
+        """
+        return None
+
+    @abstractmethod
+    def get_peers_metadata(self) -> dict:
+        """Get the names, addresses and states of all configured peers, including disabled ones.
+
+        Unlike ``get_peers``, the runtime state of the interface is not requested.
+
+        Returns:
+            dict: A dictionary keyed by peer public key. Each value contains ``name`` (str),
+            ``address`` (str), ``enabled`` (bool) and ``id`` (str | None, the identifier of
+            the peer on the server, if the backend has one).
+        """
+
+    @abstractmethod
+    def get_peers_stats(self) -> dict:
+        """Get machine-readable runtime statistics of all active peers.
+
+        Unlike ``get_peers``, this method returns raw values and does not resolve peer names,
+        so it can be called frequently by background tasks.
+
+        Returns:
+            dict: A dictionary keyed by peer public key. Each value contains ``endpoint`` (str | None),
+            ``allowed_ips`` (str), ``latest_handshake`` (int, UNIX timestamp or 0 if there was none),
+            ``rx`` and ``tx`` (int, bytes). Backends that know peer names also provide ``name``.
+        """
+
+    def get_host_health(self) -> Optional[dict]:
+        """Get the load of the host running the WireGuard server.
+
+        Implementations should override this method if the host can report it.
+
+        Returns:
+            Optional[dict]: A dictionary with ``cpu_load`` (float, percent of all CPUs), ``memory_used``
+            and ``memory_total`` (int, bytes), ``uptime`` (float, seconds), and ``rx_rate`` and ``tx_rate``
+            of the WireGuard interface (float | None, bytes per second), or None if the load is unknown.
+        """
+        return None
+
+    async def get_peers_stats_async(self) -> dict:
+        """Get the same statistics as ``get_peers_stats`` without blocking the event loop.
+
+        Implementations should override this method if they can request the host asynchronously,
+        by default ``get_peers_stats`` runs in a thread.
+
+        Returns:
+            dict: The statistics as returned by ``get_peers_stats``.
+        """
+        return await asyncio.to_thread(self.get_peers_stats)
+
     @abstractmethod
     def add_peer(self, name: str) -> str:
         """Add a new peer to the WireGuard server.
@@ -125,6 +243,23 @@ class WireGuard(ABC):
             str: The WireGuard client configuration for the new peer.
         """
 
+    @abstractmethod
+    def commit_peer(self, name: str, privkey: str, pubkey: str, address: str) -> None:
+        """Add a peer whose keys and address were prepared in advance.
+
+        Unlike ``add_peer``, no keys are generated and no address is looked up,
+        so the peer is created with the least possible number of requests.
+
+        Args:
+            name (str): The name of the peer.
+            privkey (str): The private key of the peer.
+            pubkey (str): The public key of the peer.
+            address (str): The address of the peer in the format 'X.X.X.X/32'.
+
+        Returns:
+            None
+        """
+
     @abstractmethod
     def delete_peer(self, pubkey: str) -> None:
         """Delete a peer from the WireGuard server.
@@ -136,6 +271,21 @@ class WireGuard(ABC):
             None
         """
 
+    def delete_peers(self, pubkeys: list[str]) -> None:
+        """Delete several peers from the WireGuard server at once.
+
+        Implementations should override this method if they can apply all changes
+        with a single configuration update, skipping the peers missing from the server.
+
+        Args:
+            pubkeys (list[str]): The public keys of the peers to be deleted.
+
+        Returns:
+            None
+        """
+        for pubkey in pubkeys:
+            self.delete_peer(pubkey)
+
     @abstractmethod
     def set_peer_enabled(self, pubkey: str, enabled: bool) -> None:
         """Enables or disables a WireGuard peer based on its public key.
@@ -148,6 +298,22 @@ class WireGuard(ABC):
             None
         """
 
+    def set_peers_enabled(self, pubkeys: list[str], enabled: bool) -> None:
+        """Enables or disables several WireGuard peers at once.
+
+        Implementations should override this method if they can apply all changes
+        with a single configuration update, skipping the peers missing from the server.
+
+        Args:
+            pubkeys (list[str]): The public keys of the peers to enable or disable.
+            enabled (bool): If True, enables the peers. If False, disables the peers.
+
+        Returns:
+            None
+        """
+        for pubkey in pubkeys:
+            self.set_peer_enabled(pubkey, enabled)
+
     @abstractmethod
     def get_peer_enabled(self, pubkey: str) -> bool:
         """Check if a peer is enabled in the WireGuard server.